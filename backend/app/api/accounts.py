@@ -1,14 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import update
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime, date, timedelta
+import json
 import pytz
-from app.models.database import get_db
-from app.models.account import Account, Transaction, AccountType, TransactionType
+from app.models.database import get_db, SessionLocal
+from app.models.account import Transaction, AccountType, TransactionType, StatementLine, StatementLineStatus
 from app.auth.security import get_current_active_user, require_owner
 from app.models.user import User
+from app.services.accounts import get_default_account_id, adjust_balance
+from app.services.daybook import (
+    record_transaction, reverse_transaction, rebuild_daybook, daily_summary, monthly_summary,
+    transactions_page_query, encode_cursor, decode_cursor,
+)
+from app.services.reports import pnl_report, pnl_totals, invalidate_reports, GRANULARITIES
+from app.services.reconciliation import iter_statement_rows, import_statement_rows
+from app.services.stock_import import ImportFormatError
 
 router = APIRouter(prefix="/accounts", tags=["accounts"])
 
@@ -65,100 +75,234 @@ class TransactionResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class StatementImportResponse(BaseModel):
+    total_rows: int
+    matched: int
+    suggested: int
+    duplicates: int
+    failed: int
+    errors: List[dict]
+
+class StatementLineResponse(BaseModel):
+    id: int
+    date: datetime
+    amount: float
+    type: TransactionType
+    description: Optional[str] = None
+    reference: Optional[str] = None
+    payment_method: Optional[str] = None
+    balance: Optional[float] = None
+    status: StatementLineStatus
+    transaction_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class StatementLineAccept(BaseModel):
+    # Overrides for the Day Book entry created from the line
+    description: Optional[str] = None
+    category: Optional[str] = None
+    customer_name: Optional[str] = None
+    notes: Optional[str] = None
+
 # --- Endpoints ---
 
+def _owner_id(user: User) -> int:
+    return user.id if user.role == "owner" else user.owner_id
+
+def _parse_month(value: str) -> date:
+    year, month = map(int, value.split('-'))
+    return date(year, month, 1)
+
+# Page size cap for /transactions; follow X-Next-Cursor for more
+MAX_PAGE_SIZE = 1000
+
 @router.get("/transactions", response_model=List[TransactionResponse])
 def list_transactions(
+    response: Response,
     date_str: Optional[str] = None, # format: YYYY-MM-DD
     month_str: Optional[str] = None, # format: YYYY-MM
-    limit: int = 1000, # Increased limit for monthly views
+    limit: int = MAX_PAGE_SIZE, # Page size
+    cursor: Optional[str] = None, # X-Next-Cursor of the previous page
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """List transactions. Filter by specific day (date_str) or entire month (month_str)."""
+    """
+    List transactions, newest first. Filter by specific day (date_str) or entire month (month_str).
+    When more rows exist, the `X-Next-Cursor` response header is set: pass it back as `cursor`.
+    """
     
     # --- Business Isolation Logic ---
-    # 1. Determine Owner ID (Business Context)
-    if current_user.role == "owner":  # Or UserRole.OWNER if imported
-        owner_id = current_user.id
-    else:
-        owner_id = current_user.owner_id
-        
-    # 2. Get all User IDs belonging to this Business (Owner + All Staff)
-    # We filter transactions where created_by_id is in this list.
-    team_ids_query = db.query(User.id).filter(
-        (User.id == owner_id) | (User.owner_id == owner_id)
-    )
-    team_ids = [uid[0] for uid in team_ids_query.all()]
-    
-    # 3. Apply Filter
-    query = db.query(Transaction).filter(Transaction.created_by_id.in_(team_ids))
-    # -------------------------------
+    # Transactions carry the business (owner) they belong to
+    owner_id = _owner_id(current_user)
     
+    # Half-open ranges on the bare column (index friendly): start <= date < end
+    start = end = None
     if date_str:
         try:
-            target_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-            # Filter by day
-            query = query.filter(func.date(Transaction.date) == target_date)
+            start = datetime.strptime(date_str, "%Y-%m-%d")
+            end = start + timedelta(days=1)
         except ValueError:
             pass
     elif month_str:
         try:
             # format YYYY-MM means we verify year and month
-            year, month = map(int, month_str.split('-'))
-            query = query.filter(
-                func.extract('year', Transaction.date) == year,
-                func.extract('month', Transaction.date) == month
-            )
+            start = datetime.combine(_parse_month(month_str), datetime.min.time())
+            end = (start + timedelta(days=32)).replace(day=1)
         except ValueError:
             pass
 
-    txns = query.order_by(desc(Transaction.date)).limit(limit).all()
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    # One extra row tells whether there is a next page
+    txns = db.scalars(transactions_page_query(owner_id, start, end, after, limit + 1)).all()
+    if len(txns) > limit:
+        txns = txns[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(txns[-1].date, txns[-1].id)
     return txns
 
-@router.post("/transactions", response_model=TransactionResponse)
-def create_transaction(
-    transaction: TransactionCreate,
+@router.get("/daybook/daily")
+def daybook_daily_summary(
+    date_str: Optional[str] = None, # format: YYYY-MM-DD
+    month_str: Optional[str] = None, # format: YYYY-MM (every day of the month)
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
-    Record a Day Book transaction.
+    Day Book totals (income, expense, net, counts) with a per-day series and breakdowns by
+    payment method, handler and category. Read from the daily rollup (one row per day and group).
     """
-    
-    if transaction.amount <= 0:
-        raise HTTPException(status_code=400, detail="Amount must be positive")
+    try:
+        if date_str:
+            start_date = end_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+        elif month_str:
+            start_date = _parse_month(month_str)
+            end_date = (start_date + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD or YYYY-MM.")
+    if not start_date or not end_date:
+        # Default: today (IST)
+        start_date = end_date = datetime.now(pytz.timezone('Asia/Kolkata')).date()
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date is before start_date")
 
-    # Day Book doesn't strictly require Account balances (user said "no need of bank account link")
-    # BUT we should still use a default 'Cash' account or similar to keep data valid if we ever want to use it.
-    # Let's check if a default account exists, if not create one.
-    
-    default_acc = db.query(Account).filter(Account.type == AccountType.CASH).first()
-    if not default_acc:
-        default_acc = Account(name="Main Cash", type=AccountType.CASH, balance=0)
-        db.add(default_acc)
+    summary = daily_summary(db, _owner_id(current_user), start_date, end_date)
+    return {"start_date": start_date, "end_date": end_date, **summary}
+
+@router.get("/daybook/monthly")
+def daybook_monthly_summary(
+    start_month: Optional[str] = None, # format: YYYY-MM
+    end_month: Optional[str] = None, # format: YYYY-MM
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Day Book totals per month (default: this year so far), from the monthly rollup."""
+    today = datetime.now(pytz.timezone('Asia/Kolkata')).date()
+    try:
+        start = _parse_month(start_month) if start_month else date(today.year, 1, 1)
+        end = _parse_month(end_month) if end_month else today.replace(day=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid month format. Use YYYY-MM.")
+    if end < start:
+        raise HTTPException(status_code=400, detail="end_month is before start_month")
+
+    summary = monthly_summary(db, _owner_id(current_user), start, end)
+    return {"start_month": start.strftime("%Y-%m"), "end_month": end.strftime("%Y-%m"), **summary}
+
+@router.post("/daybook/rebuild")
+def rebuild_daybook_rollups(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_owner)
+):
+    """Recompute this business's Day Book totals from its transactions."""
+    try:
+        count = rebuild_daybook(db, current_user.id)
         db.commit()
-        db.refresh(default_acc)
+    except Exception as e:
+        db.rollback()
+        print(f"Error rebuilding day book: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to rebuild day book totals."
+        )
+    return {"transactions": count}
+
+@router.get("/reports/pnl")
+def profit_and_loss_report(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    granularity: str = "month", # day, week or month
+    stream: bool = False, # NDJSON: one line per period as it is computed, then the totals
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_owner)
+):
+    """
+    Profit & loss and cash flow per period (default: this year so far): revenue, COGS,
+    gross margin, operating expenses by category, net profit, cash in/out.
+    """
+    today = datetime.now(pytz.timezone('Asia/Kolkata')).date()
+    start_date = start_date or date(today.year, 1, 1)
+    end_date = end_date or today
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date is before start_date")
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of: {', '.join(GRANULARITIES)}")
+
+    owner_id = current_user.id
+    if not stream:
+        periods = list(pnl_report(db, owner_id, start_date, end_date, granularity))
+        return {
+            "start_date": start_date, "end_date": end_date, "granularity": granularity,
+            "periods": periods, "totals": pnl_totals(periods),
+        }
+
+    def lines():
+        # Own session: the request's session is closed once the response starts streaming
+        report_db = SessionLocal()
+        try:
+            periods = []
+            for period in pnl_report(report_db, owner_id, start_date, end_date, granularity):
+                periods.append(period)
+                yield json.dumps(period) + "\n"
+            yield json.dumps({"totals": pnl_totals(periods)}) + "\n"
+        finally:
+            report_db.close()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def _add_transaction(db: Session, transaction: TransactionCreate, current_user: User, owner_id: int) -> Transaction:
+    """Day Book entry on the business's default account, with its balance and totals. Does not commit."""
+    # Day Book doesn't strictly require Account balances (user said "no need of bank account link")
+    # BUT we should still use the business's default 'Cash' account to keep data valid if we ever want to use it.
+    default_acc_id = get_default_account_id(db, owner_id)
         
-    # Logic for updating balance (Optional but good practice)
+    # Logic for updating balance (Optional but good practice), atomic UPDATE
     if transaction.type == TransactionType.INCOME:
         # Incoming money -> Add to Cash
-        default_acc.balance += transaction.amount
-        to_acc_id = default_acc.id
+        adjust_balance(db, default_acc_id, transaction.amount)
+        to_acc_id = default_acc_id
         from_acc_id = None
         
     elif transaction.type == TransactionType.EXPENSE:
         # Outgoing money -> Deduct from Cash
-        default_acc.balance -= transaction.amount
-        from_acc_id = default_acc.id
+        adjust_balance(db, default_acc_id, -transaction.amount)
+        from_acc_id = default_acc_id
         to_acc_id = None
         
     elif transaction.type == TransactionType.TRANSFER:
          # For simplicity in Day Book, treat Transfer as Expense? Or just record it.
          # User asked for "Daily Transactions", usually Income/Expense.
          # Let's just record it without balance impact if distinct accounts aren't used.
-         from_acc_id = default_acc.id
-         to_acc_id = default_acc.id # Self transfer? Placeholder.
+         from_acc_id = default_acc_id
+         to_acc_id = default_acc_id # Self transfer? Placeholder.
 
     # Create Transaction Record
     new_txn = Transaction(
@@ -179,12 +323,34 @@ def create_transaction(
         category=transaction.category,
         notes=transaction.notes,
         date=transaction.date or datetime.now(pytz.timezone('Asia/Kolkata')).replace(tzinfo=None),
-        created_by_id=current_user.id
+        created_by_id=current_user.id,
+        owner_id=owner_id,
     )
     
     db.add(new_txn)
+    record_transaction(db, owner_id, new_txn)
+    return new_txn
+
+@router.post("/transactions", response_model=TransactionResponse)
+def create_transaction(
+    transaction: TransactionCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Record a Day Book transaction.
+    """
+    
+    if transaction.amount <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
+
+    owner_id = _owner_id(current_user)
+    new_txn = _add_transaction(db, transaction, current_user, owner_id)
     db.commit()
     db.refresh(new_txn)
+    if transaction.date:
+        # May be back-dated into a closed (cached) report period
+        invalidate_reports(owner_id)
     
     return new_txn
 
@@ -197,8 +363,12 @@ def delete_transaction(
     """
     Delete a transaction and reverse its balance impact.
     """
-    # 1. Fetch Transaction
-    txn = db.query(Transaction).filter(Transaction.id == transaction_id).first()
+    # 1. Fetch Transaction (this business's only: another's would look "not found")
+    owner_id = _owner_id(current_user)
+    txn = db.query(Transaction).filter(
+        Transaction.id == transaction_id,
+        Transaction.owner_id == owner_id,
+    ).first()
     if not txn:
         raise HTTPException(status_code=404, detail="Transaction not found")
         
@@ -207,16 +377,122 @@ def delete_transaction(
     # and 'from_account_id' was the default cash account for EXPENSE
     
     if txn.type == TransactionType.INCOME and txn.to_account_id:
-        acc = db.query(Account).filter(Account.id == txn.to_account_id).first()
-        if acc:
-            acc.balance -= txn.amount # Reverse Income
+        adjust_balance(db, txn.to_account_id, -txn.amount) # Reverse Income
             
     elif txn.type == TransactionType.EXPENSE and txn.from_account_id:
-        acc = db.query(Account).filter(Account.id == txn.from_account_id).first()
-        if acc:
-            acc.balance += txn.amount # Reverse Expense (Add money back)
+        adjust_balance(db, txn.from_account_id, txn.amount) # Reverse Expense (Add money back)
 
-    # 3. Delete Record
+    # 3. Take it out of the Day Book totals, then Delete Record
+    reverse_transaction(db, owner_id, txn)
+    # A statement line it was reconciled with goes back to the suggestions
+    statement_table = StatementLine.__table__
+    db.execute(
+        update(statement_table)
+        .where(statement_table.c.transaction_id == txn.id)
+        .values(transaction_id=None, status=StatementLineStatus.SUGGESTED)
+    )
     db.delete(txn)
     db.commit()
+    invalidate_reports(owner_id)
     return None
+
+# --- Statement reconciliation ---
+
+@router.post("/import-statement", response_model=StatementImportResponse)
+def import_statement(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_owner)
+):
+    """
+    Reconcile a bank/UPI statement (CSV export) against the Day Book.
+    Columns: Date, Narration/Description, Ref No, and Debit/Credit (or Amount with Dr/Cr).
+    Lines matching a Day Book entry (same amount, nearby date) are linked to it; the others
+    are kept as suggested entries (see /accounts/statement-lines).
+    """
+    if not (file.filename or "").lower().endswith(".csv"):
+        raise HTTPException(status_code=400, detail="Unsupported file type. Please upload the statement as a .csv file.")
+
+    try:
+        report = import_statement_rows(db, iter_statement_rows(file.file), owner_id=current_user.id)
+        db.commit()
+    except ImportFormatError as e:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        print(f"Error importing statement: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to import statement. Please try again."
+        )
+    finally:
+        file.file.close()
+
+    return StatementImportResponse(**report)
+
+@router.get("/statement-lines", response_model=List[StatementLineResponse])
+def list_statement_lines(
+    status_filter: Optional[StatementLineStatus] = Query(StatementLineStatus.SUGGESTED, alias="status"),
+    limit: int = 500,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_owner)
+):
+    """Imported statement lines, newest first (default: the suggested entries still to review)."""
+    query = db.query(StatementLine).filter(StatementLine.owner_id == current_user.id)
+    if status_filter:
+        query = query.filter(StatementLine.status == status_filter)
+    return query.order_by(StatementLine.date.desc(), StatementLine.id.desc()).limit(max(1, min(limit, MAX_PAGE_SIZE))).all()
+
+def _get_statement_line(db: Session, line_id: int, owner_id: int) -> StatementLine:
+    line = db.query(StatementLine).filter(StatementLine.id == line_id, StatementLine.owner_id == owner_id).first()
+    if not line:
+        raise HTTPException(status_code=404, detail="Statement line not found")
+    return line
+
+@router.post("/statement-lines/{line_id}/accept", response_model=TransactionResponse)
+def accept_statement_line(
+    line_id: int,
+    overrides: Optional[StatementLineAccept] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_owner)
+):
+    """Record a suggested statement line as a Day Book entry."""
+    line = _get_statement_line(db, line_id, current_user.id)
+    if line.status == StatementLineStatus.MATCHED:
+        raise HTTPException(status_code=400, detail="Statement line is already in the Day Book")
+
+    overrides = overrides or StatementLineAccept()
+    new_txn = _add_transaction(db, TransactionCreate(
+        description=overrides.description or line.description or f"Statement {line.type.value}",
+        amount=line.amount,
+        type=line.type,
+        customer_name=overrides.customer_name,
+        payment_method=line.payment_method,
+        category=overrides.category,
+        notes=overrides.notes,
+        date=line.date,
+    ), current_user, current_user.id)
+    new_txn.reference_id = line.reference
+    db.flush()
+    line.transaction_id = new_txn.id
+    line.status = StatementLineStatus.MATCHED
+    db.commit()
+    db.refresh(new_txn)
+    invalidate_reports(current_user.id)
+    return new_txn
+
+@router.post("/statement-lines/{line_id}/dismiss", response_model=StatementLineResponse)
+def dismiss_statement_line(
+    line_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_owner)
+):
+    """Leave a suggested statement line out of the Day Book."""
+    line = _get_statement_line(db, line_id, current_user.id)
+    if line.status == StatementLineStatus.MATCHED:
+        raise HTTPException(status_code=400, detail="Statement line is already in the Day Book")
+    line.status = StatementLineStatus.DISMISSED
+    db.commit()
+    db.refresh(line)
+    return line
@@ -1,22 +1,35 @@
+import json
 from datetime import datetime, timedelta
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from typing import Dict, Optional, Set
+from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel
 from app.models.database import get_db
 from app.models.user import User, UserRole
-from app.models.credentials_db import get_credentials_db, UserCredentials
+from app.models.purge import TenantPurge
 from app.auth.security import (
-    verify_password,
+    verify_and_update_password,
     get_password_hash,
-    create_access_token,
+    create_user_access_token,
     get_current_active_user,
     require_owner,
 )
-from app.utils.email import send_welcome_email, send_password_change_email
+from app.auth.principal_cache import invalidate_principal, remember_principal, resolve_principal
+from app.auth.refresh_tokens import (
+    RefreshTokenError,
+    decode_refresh_token,
+    issue_refresh_token,
+    new_family,
+    revoke_family,
+    revoke_user_sessions,
+    rotate_refresh_token,
+)
 from app.utils.security_utils import generate_security_code
+from app.services.outbox import enqueue_email, enqueue_whatsapp, outbox_worker
+from app.services.tenant_purge import purge_progress, request_tenant_purge, tenant_purge_worker
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
@@ -30,9 +43,30 @@ def validate_password(password: str):
 
 class Token(BaseModel):
     access_token: str
+    refresh_token: str
     token_type: str
     user: dict
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class RefreshedToken(BaseModel):
+    access_token: str
+    refresh_token: str
+    token_type: str
+
+class PurgeStatus(BaseModel):
+    purge_id: str
+    status: str  # 'pending', 'running', 'done', 'failed'
+    step: Optional[str] = None
+    steps_done: int
+    steps_total: int
+    deleted: Dict[str, int]  # Rows deleted per table so far
+    files_deleted: int
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
 class OwnerRegister(BaseModel):
     full_name: str
     business_name: str
@@ -57,61 +91,64 @@ class UserResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# Checked (and reported) in this order
+_UNIQUE_FIELDS = ("username", "email", "phone_number")
+_CONFLICT_DETAILS = {
+    "username": "Username already taken",
+    "email": "Email already registered",
+    "phone_number": "Phone number already registered",
+}
+
+def _taken_fields(db: Session, values: dict) -> Set[str]:
+    """Which of the unique fields already exist, in one query (each column is indexed)."""
+    columns = [getattr(User, field) for field in _UNIQUE_FIELDS]
+    rows = db.query(*columns).filter(
+        or_(*(column == values[field] for field, column in zip(_UNIQUE_FIELDS, columns)))
+    ).all()
+    return {field for row in rows for field, value in zip(_UNIQUE_FIELDS, row) if value == values[field]}
+
+def _conflict_detail(taken: Set[str]) -> Optional[str]:
+    for field in _UNIQUE_FIELDS:
+        if field in taken:
+            return _CONFLICT_DETAILS[field]
+    return None
+
+def _integrity_conflict(e: IntegrityError) -> Optional[str]:
+    """Map a unique-constraint error (e.g. "UNIQUE constraint failed: users.email") to its message."""
+    error_info = str(e.orig) if hasattr(e, 'orig') else str(e)
+    return _conflict_detail({field for field in _UNIQUE_FIELDS if field in error_info.lower()})
+
 @router.options("/register")
 async def options_register():
     return {}
 
 @router.post("/register", response_model=UserResponse)
-async def register_owner(
+def register_owner(
     owner_data: OwnerRegister,
     db: Session = Depends(get_db),
-    cred_db: Session = Depends(get_credentials_db),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
 ):
     username = owner_data.username.strip()
     email = owner_data.email.strip()
     phone_number = owner_data.phone_number.strip()
 
-    # 1️⃣ Check username in credentials DB
-    if cred_db.query(UserCredentials).filter_by(username=username).first():
-        raise HTTPException(status_code=400, detail="Username already taken")
-
-    # 1.5 Check if phone number is already registered (Optional, but good practice)
-    if cred_db.query(UserCredentials).filter_by(phone_number=phone_number).first():
-        raise HTTPException(status_code=400, detail="Phone number already registered")
-
-    # 2️⃣ Check username in main DB
-    if db.query(User).filter_by(username=username).first():
-        raise HTTPException(status_code=400, detail="Username already taken")
+    # 1️⃣ Username / email / phone in one query. A concurrent signup can still win
+    # between check and insert: the unique constraints catch that below.
+    values = {"username": username, "email": email, "phone_number": phone_number}
+    detail = _conflict_detail(_taken_fields(db, values))
+    if detail:
+        raise HTTPException(status_code=400, detail=detail)
 
     security_code = generate_security_code()
 
     try:
-        # 3️⃣ Create credential user
-        # User requested to store HASHED password in credentials DB to avoid plaintext storage
         hashed_password = get_password_hash(owner_data.password)
-        
-        cred_user = UserCredentials(
-            username=username,
-            email=email,
-            phone_number=phone_number,
-            password=hashed_password,  # Storing HASHED password
-            full_name=owner_data.full_name.strip(),
-            business_name=owner_data.business_name.strip(),
-            business_type=owner_data.business_type.strip(),
-            role="owner",
-            is_active=True,
-            security_code=security_code,
-            created_at=datetime.utcnow(),
-        )
-        cred_db.add(cred_user)
 
-        # 4️⃣ Create main user
+        # 2️⃣ Create the user (main DB only; credentials.db is replicated from it via the outbox)
         user = User(
             username=username,
             email=email,
             phone_number=phone_number,
-            hashed_password=hashed_password, # Use SAME hash
+            hashed_password=hashed_password,
             full_name=owner_data.full_name.strip(),
             business_name=owner_data.business_name.strip(),
             business_type=owner_data.business_type.strip(),
@@ -121,20 +158,21 @@ async def register_owner(
             created_at=datetime.utcnow(),
         )
         db.add(user)
+        db.flush()  # Need user.id for the outbox row
+
+        # Welcome WhatsApp, delivered by the outbox worker once the user is committed
+        enqueue_whatsapp(
+            db,
+            to_number=user.phone_number,
+            kind="welcome",
+            params={"business_name": user.business_name, "username": user.username},
+            owner_id=user.id,
+        )
 
-        # 5️⃣ Commit both
-        cred_db.commit()
+        # 3️⃣ Commit (the user, the welcome message and the credentials sync together)
         db.commit()
         db.refresh(user)
-
-        # Send Welcome WhatsApp
-        from app.utils.whatsapp import send_welcome_whatsapp
-        background_tasks.add_task(
-            send_welcome_whatsapp, 
-            to_number=user.phone_number, 
-            business_name=user.business_name, 
-            username=user.username
-        )
+        outbox_worker.wake()
 
         return UserResponse(
             id=user.id,
@@ -149,16 +187,20 @@ async def register_owner(
             created_at=user.created_at.isoformat(),
         )
 
+    except IntegrityError as e:
+        db.rollback()
+        detail = _integrity_conflict(e)
+        if detail is None:
+            raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=400, detail=detail)
     except Exception as e:
-        cred_db.rollback()
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/token", response_model=Token)
-async def login(
+def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db),
-    cred_db: Session = Depends(get_credentials_db),
 ):
     # 1. Login using ONLY main DB hash (Single Source of Truth)
     user = db.query(User).filter(User.username == form_data.username).first()
@@ -170,18 +212,37 @@ async def login(
         )
 
     # 2. Verify password (hash-check)
-    if not verify_password(form_data.password, user.hashed_password):
+    valid, new_hash = verify_and_update_password(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
         )
 
-    access_token = create_access_token(
-        data={"sub": user.username, "role": user.role.value}
-    )
+    if not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="This account has been disabled",
+        )
+
+    if new_hash:
+        # Hash made with another bcrypt cost: store it again at the current one
+        try:
+            user.hashed_password = new_hash
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Password rehash failed for {user.username}: {e}")
+
+    remember_principal(user)  # The token's first request won't need a lookup
+    session_id = new_family()
+    access_token = create_user_access_token(user, session_id)
+    refresh_token = issue_refresh_token(db, user.id, session_id)
+    db.commit()
 
     return {
         "access_token": access_token,
+        "refresh_token": refresh_token,
         "token_type": "bearer",
         "user": {
             "id": user.id,
@@ -201,8 +262,44 @@ class PasswordReset(BaseModel):
     security_code: str
     new_password: str
 
+@router.post("/refresh", response_model=RefreshedToken)
+def refresh_access_token(request: RefreshRequest, db: Session = Depends(get_db)):
+    """
+    New access token (and the next refresh token) for a refresh token, without the
+    password. The refresh token sent in is used up.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        user_id, session_id, refresh_token = rotate_refresh_token(db, request.refresh_token)
+    except RefreshTokenError as e:
+        print(f"Refresh rejected: {e}")
+        raise credentials_exception
+
+    user = resolve_principal(db, user_id)
+    if user is None or not user.is_active:
+        db.rollback()
+        raise credentials_exception
+    access_token = create_user_access_token(user, session_id)
+    db.commit()
+
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+def logout(request: RefreshRequest, db: Session = Depends(get_db)):
+    """End the session: its refresh token and access tokens stop working."""
+    try:
+        session_id = decode_refresh_token(request.refresh_token)["sid"]
+    except RefreshTokenError:
+        return  # Nothing to end
+    revoke_family(db, session_id)
+    db.commit()
+
 @router.post("/verify-security-code")
-async def verify_security_code(
+def verify_security_code(
     verify_data: SecurityCodeVerify,
     current_user: User = Depends(get_current_active_user),
 ):
@@ -213,7 +310,7 @@ async def verify_security_code(
     return {"message": "Security code verified"}
 
 @router.get("/verify-token", response_model=UserResponse)
-async def verify_token(current_user: User = Depends(get_current_active_user)):
+def verify_token(current_user: User = Depends(get_current_active_user)):
     """
     Verify the current token and user existence.
     If the user has been deleted or token is invalid, the dependency raises 401.
@@ -232,11 +329,10 @@ async def verify_token(current_user: User = Depends(get_current_active_user)):
     )
 
 @router.post("/reset-password")
-async def reset_password_with_code(
+def reset_password_with_code(
     reset_data: PasswordReset,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
 ):
     """
     Reset password using the Verified Security Code.
@@ -252,16 +348,21 @@ async def reset_password_with_code(
         # 2. Update Main DB (Hashed)
         hashed_password = get_password_hash(reset_data.new_password)
         current_user.hashed_password = hashed_password
-        db.commit()
+        # Sign out every session (including this one) once the password changes
+        revoke_user_sessions(db, [current_user.id])
         
-        # 3. Send Confirmation Email
+        # 3. Confirmation Email (outbox, same transaction; password wiped from the row once sent)
         if current_user.email:
-            background_tasks.add_task(
-                send_password_change_email,
+            enqueue_email(
+                db,
                 to_email=current_user.email,
-                username=current_user.username,
-                new_password=reset_data.new_password
+                template="password_change",
+                params={"username": current_user.username, "new_password": reset_data.new_password},
+                owner_id=current_user.owner_id or current_user.id,
+                sensitive=True,
             )
+        db.commit()
+        outbox_worker.wake()
         
         return {"message": "Password updated successfully"}
         
@@ -269,16 +370,16 @@ async def reset_password_with_code(
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.delete("/me", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/me", status_code=status.HTTP_202_ACCEPTED)
 def delete_account(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db),
-    cred_db: Session = Depends(get_credentials_db),
 ):
     """
     Delete the current user's account.
     Only Owners can perform this action.
-    Removes data from BOTH Main DB and Credentials DB.
+    The owner and staff are disabled (and logged out) right away; the business's data,
+    invoice PDFs and images are deleted in the background. Poll `status_url` for progress.
     """
     if current_user.role != UserRole.OWNER:
         raise HTTPException(
@@ -287,79 +388,32 @@ def delete_account(
         )
 
     try:
-        # Import all necessary models
-        from app.models.sale import Sale, SaleItem, Warranty, WarrantyClaim
-        from app.models.stock import Stock
-        from app.models.account import Transaction
-        
-        owner_id = current_user.id
-        username = current_user.username # Store username before delete
-        
-        # 1. Identify all users in this business (Owner + Staff)
-        team_ids = [uid[0] for uid in db.query(User.id).filter(
-            (User.id == owner_id) | (User.owner_id == owner_id)
-        ).all()]
-        
-        # 2. Get all Sales by these users
-        sales = db.query(Sale).filter(Sale.created_by_id.in_(team_ids)).all()
-        sale_ids = [s.id for s in sales]
-
-        if sale_ids:
-            # A. Delete Warranty Claims
-            warranties = db.query(Warranty).filter(Warranty.sale_id.in_(sale_ids)).all()
-            warranty_ids = [w.id for w in warranties]
-            if warranty_ids:
-                db.query(WarrantyClaim).filter(WarrantyClaim.warranty_id.in_(warranty_ids)).delete(synchronize_session=False)
-                # B. Delete Warranties
-                db.query(Warranty).filter(Warranty.sale_id.in_(sale_ids)).delete(synchronize_session=False)
-
-            # C. Delete Sale Items
-            db.query(SaleItem).filter(SaleItem.sale_id.in_(sale_ids)).delete(synchronize_session=False)
-            
-            # D. Delete Transactions linked to Sales (Income)
-            db.query(Transaction).filter(Transaction.sale_id.in_(sale_ids)).delete(synchronize_session=False)
-            
-            # Delete Sales
-            db.query(Sale).filter(Sale.id.in_(sale_ids)).delete(synchronize_session=False)
-
-        # 3. Delete Remaining Transactions (Expenses, Manual logs) by this team
-        db.query(Transaction).filter(Transaction.created_by_id.in_(team_ids)).delete(synchronize_session=False)
-        
-        # 4. Delete Stock (Owned by owner)
-        db.query(Stock).filter(Stock.owner_id == owner_id).delete(synchronize_session=False)
-        
-        # 5. Delete Staff Members (Main DB)
-        # Also need to delete Staff from Credentials DB? 
-        # Yes, find staff usernames first if we want strict cleanup, 
-        # OR just delete based on pattern/logic if possible.
-        # But UserCredentials doesn't always have owner_id populated in old records.
-        # However, improved 'create_staff' populates 'owner_id' in UserCredentials.
-        # Let's try to delete by username for consistency or owner_id if available.
-        
-        # 5a. Get staff usernames
-        staff_usernames = [u.username for u in db.query(User).filter(User.owner_id == owner_id).all()]
-        
-        db.query(User).filter(User.owner_id == owner_id).delete(synchronize_session=False)
-        
-        # 6. Delete the Owner User (Main DB)
-        db.delete(current_user)
-        
-        # 7. SYNC DELETE: Remove from Credentials DB
-        # Remove Owner
-        cred_db.query(UserCredentials).filter(UserCredentials.username == username).delete(synchronize_session=False)
-        
-        # Remove Staff (using usernames collected from Main DB)
-        if staff_usernames:
-            cred_db.query(UserCredentials).filter(UserCredentials.username.in_(staff_usernames)).delete(synchronize_session=False)
-
+        purge = request_tenant_purge(db, current_user)
         db.commit()
-        cred_db.commit()
-        
     except Exception as e:
         db.rollback()
-        cred_db.rollback()
         print(f"Delete Error: {e}") # Log to console
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to delete account: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+    for user_id in json.loads(purge.team_ids):
+        invalidate_principal(user_id)
+    tenant_purge_worker.wake()
+    return {
+        "purge_id": purge.public_id,
+        "status": purge.status,
+        "status_url": f"/api/auth/purges/{purge.public_id}",
+    }
+
+@router.get("/purges/{purge_id}", response_model=PurgeStatus)
+def get_purge_status(purge_id: str, db: Session = Depends(get_db)):
+    """
+    Progress of an account deletion. No auth: the account is gone (or disabled) by the
+    time this is polled; the random purge id is the credential.
+    """
+    purge = db.query(TenantPurge).filter(TenantPurge.public_id == purge_id).first()
+    if purge is None:
+        raise HTTPException(status_code=404, detail="Purge not found")
+    return purge_progress(purge)
@@ -3,18 +3,26 @@ from datetime import datetime, timedelta
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel
 import base64
+import random
+import time
 
 from app.models.database import get_db
 from app.models.stock import Stock
 from app.models.sale import Sale, SaleItem, SaleStatus, PaymentMethod
-from app.models.account import Account, Transaction, AccountType, TransactionType # Added Import
+from app.models.account import Transaction, TransactionType # Added Import
 from app.models.user import User
 from app.auth.security import get_current_active_user
-from app.utils.email import send_low_stock_alert, send_customer_invoice_email, send_invoice_copy_email
 from app.services.cleanup import cleanup_old_invoices
 from app.services.pdf_invoice_generator import generate_invoice_pdf
+from app.services.stock_ledger import record_movement, deduct_stock, request_snapshot, MOVEMENT_SALE
+from app.services.velocity import record_sale_velocity
+from app.services.alerts import claim_low_stock_items, queue_low_stock_alerts
+from app.services.outbox import enqueue_email, outbox_worker
+from app.services.accounts import get_default_account_id, adjust_balance
+from app.services.daybook import record_transaction
 from app.models.database import SessionLocal
 import os
 
@@ -59,15 +67,29 @@ class BillResponse(BaseModel):
     pdf_base64: Optional[str] = None
 
 
+# Bounded retry for invoice number collisions between concurrent bills
+BILL_RETRIES = 3
+
 @router.post("/generate", response_model=BillResponse)
-async def generate_bill(
+def generate_bill(
     request: BillRequest,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
     background_tasks: BackgroundTasks = BackgroundTasks()
 ):
     try:
-        return await _generate_bill_impl(request, db, current_user, background_tasks)
+        for attempt in range(BILL_RETRIES):
+            try:
+                return _generate_bill_impl(request, db, current_user, background_tasks)
+            except IntegrityError as e:
+                # Another bill took the same invoice number first: roll back (stock included) and renumber
+                if "invoice_number" not in str(e) or attempt == BILL_RETRIES - 1:
+                    raise
+                db.rollback()
+                time.sleep(random.uniform(0.005, 0.05))
+    except HTTPException:
+        # 400/404 (e.g. insufficient stock) must reach the client as-is
+        raise
     except Exception as e:
         import traceback
         fatal_msg = traceback.format_exc()
@@ -76,7 +98,7 @@ async def generate_bill(
             f.write(fatal_msg)
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
-async def _generate_bill_impl(
+def _generate_bill_impl(
     request: BillRequest,
     db: Session,
     current_user: User,
@@ -100,6 +122,18 @@ async def _generate_bill_impl(
     # Calculate final amount
     final_amount = subtotal - request.discount_amount
     
+    # Deduct stock atomically (another counter may have sold it since the check above).
+    # Done BEFORE numbering the invoice: once this transaction has written, SQLite lets no
+    # other bill write until we commit, so two bills can't read the same last invoice.
+    new_quantities = {}
+    for item_req in request.items:
+        product = db.query(Stock).filter(Stock.id == item_req.product_id).first()
+        new_quantity = deduct_stock(db, product, item_req.quantity)
+        if new_quantity is None:
+            db.rollback()
+            raise HTTPException(status_code=400, detail=f"Insufficient stock for {product.product_name}")
+        new_quantities[id(item_req)] = new_quantity
+
     # Create Sale
     # Determine Owner ID (for scope)
     owner_id = current_user.id if current_user.role == "owner" else current_user.owner_id
@@ -151,33 +185,38 @@ async def _generate_bill_impl(
     db.flush() # get ID
     
     # Create Items and update stock
+    sold_products = []
     for item_req in request.items:
         product = db.query(Stock).filter(Stock.id == item_req.product_id).first()
         item_total = item_req.quantity * item_req.unit_price
+        # Landing cost at time of sale (cost_price 0 = never entered, profit unknown)
+        unit_cost = product.cost_price if product.cost_price and product.cost_price > 0 else None
         
         sale_item = SaleItem(
             sale_id=new_sale.id,
             product_id=product.id,
             quantity=item_req.quantity,
             unit_price=item_req.unit_price,
-            total_price=item_total
+            total_price=item_total,
+            unit_cost=unit_cost,
+            profit=(item_req.unit_price - unit_cost) * item_req.quantity if unit_cost is not None else None
         )
         db.add(sale_item)
         
-        # Deduct stock
-        product.quantity -= item_req.quantity
+        # Ledger row for the deduction above, in the same transaction
+        record_movement(
+            db,
+            product,
+            -item_req.quantity,
+            MOVEMENT_SALE,
+            previous_quantity=new_quantities[id(item_req)] + item_req.quantity,
+            user_id=current_user.id,
+            sale_id=new_sale.id,
+            unit_cost=unit_cost,
+        )
+        record_sale_velocity(db, product, item_req.quantity)
         
-        # Check for low stock alert
-        if product.quantity <= 5: # Threshold is hardcoded for now, or could be in settings
-            owner_email = current_user.email if current_user.role == "owner" else current_user.owner.email
-            if owner_email:
-                background_tasks.add_task(
-                    send_low_stock_alert,
-                    product_name=product.product_name,
-                    company_name=product.company_name,
-                    current_quantity=product.quantity,
-                    recipients=[owner_email]
-                )
+        sold_products.append(product)
         
         # Add to response items
         response_items.append(BillItemResponse(
@@ -187,21 +226,21 @@ async def _generate_bill_impl(
             total_price=item_total
         ))
 
+    # Low stock: per-item threshold + cooldown, sent as one digest per recipient
+    alert_items = claim_low_stock_items(sold_products)
+
+    queue_low_stock_alerts(db, owner_id, alert_items)
     db.commit()
     db.refresh(new_sale)
+    request_snapshot(owner_id)  # Taken in the background, outside this bill's transaction
     
     # --- AUTOMATIC TRANSACTION RECORDING (Day Book) ---
     try:
-        # 1. Ensure Default Account (Cash) exists
-        default_acc = db.query(Account).filter(Account.type == AccountType.CASH).first()
-        if not default_acc:
-            default_acc = Account(name="Main Cash", type=AccountType.CASH, balance=0.0)
-            db.add(default_acc)
-            db.commit()
-            db.refresh(default_acc)
+        # 1. Business's default cash account (id cached per owner)
+        default_acc_id = get_default_account_id(db, owner_id)
             
-        # 2. Update Balance (Income)
-        default_acc.balance += final_amount
+        # 2. Update Balance (Income), atomic UPDATE
+        adjust_balance(db, default_acc_id, final_amount)
         
         # 3. Create Transaction Record
         new_txn = Transaction(
@@ -212,16 +251,19 @@ async def _generate_bill_impl(
             payment_method=new_sale.payment_method, # e.g. "cash", "upi"
             sale_id=new_sale.id,
             handler_name=current_user.full_name, # Set Handler to the person creating the bill
-            to_account_id=default_acc.id, # Money goes TO cash account
+            to_account_id=default_acc_id, # Money goes TO cash account
             # Store as Naive IST
             date=datetime.now(pytz.timezone('Asia/Kolkata')).replace(tzinfo=None),
-            created_by_id=current_user.id
+            created_by_id=current_user.id,
+            owner_id=owner_id,
         )
         db.add(new_txn)
+        record_transaction(db, owner_id, new_txn)
         db.commit()
         print(f"✅ Auto-logged transaction for Invoice {new_sale.invoice_number}")
         
     except Exception as e:
+        db.rollback()
         print(f"⚠️ Failed to auto-log transaction: {e}")
         # Don't fail the whole bill generation just for this logging error
     
@@ -291,19 +333,23 @@ async def _generate_bill_impl(
                 f.write(pdf_bytes)
             
             new_sale.pdf_file_path = pdf_path
-            db.commit()
             
-            # Send Email Logic
+            # Send Email Logic (outbox row committed with the PDF path; the worker attaches the file)
             # 1. Explicit "Send Email" requested (Customer Email must exist per frontend Check, but safe to check here)
             if request.send_email and request.customer_email:
-                background_tasks.add_task(
-                    send_customer_invoice_email,
+                enqueue_email(
+                    db,
                     to_email=request.customer_email,
-                    customer_name=new_sale.customer_name,
-                    business_name=business_settings['business_name'],
-                    invoice_number=new_sale.invoice_number,
-                    pdf_bytes=pdf_bytes,
-                    reply_to_email=owner.email
+                    template="customer_invoice",
+                    params={
+                        "customer_name": new_sale.customer_name,
+                        "business_name": business_settings['business_name'],
+                        "invoice_number": new_sale.invoice_number,
+                    },
+                    attachment_path=pdf_path,
+                    attachment_filename=f"Invoice_{new_sale.invoice_number}.pdf",
+                    reply_to=owner.email,
+                    owner_id=owner_id,
                 )
             
             # 2. Implicit "Fallback" - If NO customer email, send copy to CREATOR (Staff/Owner)
@@ -312,14 +358,21 @@ async def _generate_bill_impl(
                 creator_email = current_user.email
                 if creator_email:
                     print(f"📧 Auto-sending invoice copy to Creator: {creator_email}")
-                    background_tasks.add_task(
-                        send_invoice_copy_email, 
+                    enqueue_email(
+                        db,
                         to_email=creator_email,
-                        customer_name=new_sale.customer_name, 
-                        business_name=business_settings['business_name'],
-                        invoice_number=new_sale.invoice_number,
-                        pdf_bytes=pdf_bytes
+                        template="invoice_copy",
+                        params={
+                            "customer_name": new_sale.customer_name,
+                            "business_name": business_settings['business_name'],
+                            "invoice_number": new_sale.invoice_number,
+                        },
+                        attachment_path=pdf_path,
+                        attachment_filename=f"Invoice_{new_sale.invoice_number}_Copy.pdf",
+                        owner_id=owner_id,
                     )
+            db.commit()
+            outbox_worker.wake()
                 
             # TRIGGER CLEANUP (Wrapper to handle DB session)
             def run_cleanup():
@@ -356,7 +409,7 @@ async def _generate_bill_impl(
 
 
 @router.get("/history/grouped")
-async def get_grouped_history(
+def get_grouped_history(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -460,7 +513,7 @@ async def get_grouped_history(
 from fastapi.responses import FileResponse
 
 @router.get("/download/{sale_id}")
-async def download_invoice(
+def download_invoice(
     sale_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
@@ -481,7 +534,7 @@ async def download_invoice(
 
 
 @router.get("/{sale_id}", response_model=BillResponse)
-async def get_bill_details(
+def get_bill_details(
     sale_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
@@ -527,7 +580,7 @@ async def get_bill_details(
     )
 
 @router.delete("/delete/{sale_id}")
-async def delete_bill(
+def delete_bill(
     sale_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
@@ -40,7 +40,7 @@ IMAGES_DIR = "static/business_images"
 os.makedirs(IMAGES_DIR, exist_ok=True)
 
 @router.post("/upload-logo")
-async def upload_logo(
+def upload_logo(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -59,7 +59,7 @@ async def upload_logo(
     file_path = os.path.join(IMAGES_DIR, filename)
     
     # Save file
-    content = await file.read()
+    content = file.file.read()
     with open(file_path, 'wb') as f:
         f.write(content)
     
@@ -78,7 +78,7 @@ async def upload_logo(
     }
 
 @router.post("/upload-signature")
-async def upload_signature(
+def upload_signature(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -95,7 +95,7 @@ async def upload_signature(
     filename = f"signature_{current_user.id}.{file_ext}"
     file_path = os.path.join(IMAGES_DIR, filename)
     
-    content = await file.read()
+    content = file.file.read()
     with open(file_path, 'wb') as f:
         f.write(content)
     
@@ -114,7 +114,7 @@ async def upload_signature(
     }
 
 @router.post("/save-details")
-async def save_business_details(
+def save_business_details(
     details: BusinessDetailsRequest,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -138,7 +138,7 @@ async def save_business_details(
     }
 
 @router.put("/coordinates")
-async def update_coordinates(
+def update_coordinates(
     request: CoordinatesUpdateRequest,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -156,7 +156,7 @@ async def update_coordinates(
     }
 
 @router.get("/settings")
-async def get_business_settings(
+def get_business_settings(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -0,0 +1,305 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+
+from app.models.database import get_db
+from app.models.user import User
+from app.models.stock import Stock
+from app.models.product import Supplier
+from app.models.purchase import PurchaseOrder, PurchaseOrderStatus
+from app.auth.security import require_owner
+from app.services.reorder import (
+    plan_reorders, save_reorder_levels, create_draft_orders, DEFAULT_SERVICE_LEVEL, REVIEW_DAYS,
+)
+from app.services.stock_ledger import add_stock, record_movement, request_snapshot, ledger_now, MOVEMENT_PURCHASE
+from app.services.velocity import refresh_cover
+
+router = APIRouter(prefix="/purchasing", tags=["purchasing"])
+
+# --- Schemas ---
+class SupplierCreate(BaseModel):
+    name: str
+    contact_person: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    lead_time_days: float = 7.0
+    lead_time_std_days: float = 0.0
+
+class SupplierResponse(BaseModel):
+    id: int
+    name: str
+    contact_person: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    lead_time_days: float
+    lead_time_std_days: float
+
+    class Config:
+        from_attributes = True
+
+class SupplierAssignRequest(BaseModel):
+    stock_ids: List[int]
+    supplier_id: Optional[int] = None  # None = remove supplier
+
+class ReorderLine(BaseModel):
+    stock_id: int
+    product_name: str
+    company_name: str
+    quantity: int
+    on_order: int
+    daily_velocity: float
+    reorder_point: int
+    order_quantity: int
+    unit_cost: float
+    supplier_id: Optional[int] = None
+    supplier_name: Optional[str] = None
+
+class ReorderPlanResponse(BaseModel):
+    item_count: int
+    lines: List[ReorderLine]
+
+class PurchaseOrderResponse(BaseModel):
+    id: int
+    order_number: str
+    supplier_id: Optional[int] = None
+    total_amount: float
+    final_amount: float
+    status: PurchaseOrderStatus
+    order_date: datetime
+    received_date: Optional[datetime] = None
+    notes: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class ReceiveLine(BaseModel):
+    item_id: int
+    quantity: int
+
+class ReceiveRequest(BaseModel):
+    items: Optional[List[ReceiveLine]] = None  # None = everything still outstanding
+
+class DraftOrdersResponse(BaseModel):
+    item_count: int
+    lines: int
+    orders: List[PurchaseOrderResponse]
+
+
+# --- Suppliers ---
+@router.get("/suppliers", response_model=List[SupplierResponse])
+def list_suppliers(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_owner),
+):
+    return db.query(Supplier).filter(
+        Supplier.owner_id == current_user.id,
+        Supplier.is_active == True,
+    ).order_by(Supplier.name).all()
+
+@router.post("/suppliers", response_model=SupplierResponse)
+def create_supplier(
+    supplier_data: SupplierCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_owner),
+):
+    if supplier_data.lead_time_days < 0 or supplier_data.lead_time_std_days < 0:
+        raise HTTPException(status_code=400, detail="Lead time cannot be negative.")
+
+    supplier = Supplier(owner_id=current_user.id, **supplier_data.model_dump())
+    db.add(supplier)
+    db.commit()
+    db.refresh(supplier)
+    return supplier
+
+@router.post("/suppliers/assign")
+def assign_supplier(
+    request: SupplierAssignRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_owner),
+):
+    """Set (or clear) the supplier of several stock items at once."""
+    if request.supplier_id is not None:
+        supplier = db.query(Supplier.id).filter(
+            Supplier.id == request.supplier_id,
+            Supplier.owner_id == current_user.id,
+        ).first()
+        if not supplier:
+            raise HTTPException(status_code=404, detail="Supplier not found")
+
+    # Bulk UPDATE, so bump the version like every other raw stock update
+    updated = db.query(Stock).filter(
+        Stock.owner_id == current_user.id,
+        Stock.id.in_(request.stock_ids),
+    ).update(
+        {Stock.supplier_id: request.supplier_id, Stock.version: Stock.version + 1},
+        synchronize_session=False,
+    )
+    db.commit()
+    return {"updated": updated}
+
+
+# --- Reorder planner ---
+@router.get("/reorder-plan", response_model=ReorderPlanResponse)
+def get_reorder_plan(
+    service_level: float = DEFAULT_SERVICE_LEVEL,
+    review_days: float = REVIEW_DAYS,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_owner),
+):
+    """Preview what should be ordered now (nothing is saved)."""
+    if not 0.5 <= service_level < 1:
+        raise HTTPException(status_code=400, detail="service_level must be between 0.5 and 1")
+
+    plan = plan_reorders(db, current_user.id, service_level=service_level, review_days=review_days)
+    return ReorderPlanResponse(item_count=plan["item_count"], lines=plan["lines"])
+
+@router.post("/reorder-plan/drafts", response_model=DraftOrdersResponse)
+def create_reorder_drafts(
+    service_level: float = DEFAULT_SERVICE_LEVEL,
+    review_days: float = REVIEW_DAYS,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_owner),
+):
+    """
+    Run the planner, store each item's reorder point/quantity and create one draft
+    purchase order per supplier. Replaces the drafts from the previous run.
+    """
+    if not 0.5 <= service_level < 1:
+        raise HTTPException(status_code=400, detail="service_level must be between 0.5 and 1")
+
+    try:
+        plan = plan_reorders(db, current_user.id, service_level=service_level, review_days=review_days)
+        save_reorder_levels(db, plan)
+        order_ids = create_draft_orders(db, current_user.id, plan)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Error creating draft purchase orders: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create draft purchase orders."
+        )
+
+    orders = db.query(PurchaseOrder).filter(PurchaseOrder.id.in_(order_ids)).order_by(PurchaseOrder.id).all() if order_ids else []
+    return DraftOrdersResponse(item_count=plan["item_count"], lines=len(plan["lines"]), orders=orders)
+
+@router.get("/orders", response_model=List[PurchaseOrderResponse])
+def list_purchase_orders(
+    status_filter: Optional[PurchaseOrderStatus] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_owner),
+):
+    query = db.query(PurchaseOrder).filter(PurchaseOrder.created_by_id == current_user.id)
+    if status_filter:
+        query = query.filter(PurchaseOrder.status == status_filter)
+    return query.order_by(PurchaseOrder.id.desc()).limit(100).all()
+
+def _get_order(db: Session, order_id: int, owner_id: int) -> PurchaseOrder:
+    order = db.query(PurchaseOrder).filter(
+        PurchaseOrder.id == order_id,
+        PurchaseOrder.created_by_id == owner_id,
+    ).first()
+    if not order:
+        raise HTTPException(status_code=404, detail="Purchase order not found")
+    return order
+
+@router.post("/orders/{order_id}/confirm", response_model=PurchaseOrderResponse)
+def confirm_purchase_order(
+    order_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_owner),
+):
+    """
+    Mark a draft as placed with the supplier. Pending orders count as on order in the
+    reorder plan and are no longer replaced by the next planner run.
+    """
+    order = _get_order(db, order_id, current_user.id)
+    if order.status != PurchaseOrderStatus.DRAFT:
+        raise HTTPException(status_code=400, detail=f"Only draft orders can be confirmed (this one is {order.status.value}).")
+
+    order.status = PurchaseOrderStatus.PENDING
+    order.order_date = ledger_now()
+    db.commit()
+    db.refresh(order)
+    return order
+
+@router.post("/orders/{order_id}/receive", response_model=PurchaseOrderResponse)
+def receive_purchase_order(
+    order_id: int,
+    request: Optional[ReceiveRequest] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_owner),
+):
+    """
+    Record goods received against a pending order: adds the units to stock (with a
+    'purchase' ledger row each) and to the lines' quantity_received. Without a body the
+    whole outstanding quantity is received. The order becomes 'received' once every line
+    is complete.
+    """
+    order = _get_order(db, order_id, current_user.id)
+    if order.status != PurchaseOrderStatus.PENDING:
+        raise HTTPException(status_code=400, detail=f"Only pending orders can be received (this one is {order.status.value}).")
+
+    items = {item.id: item for item in order.items}
+    if request and request.items is not None:
+        quantities = {}
+        for line in request.items:
+            if line.item_id not in items:
+                raise HTTPException(status_code=404, detail=f"Item {line.item_id} is not on this order")
+            if line.quantity <= 0:
+                raise HTTPException(status_code=400, detail="Received quantity must be positive.")
+            quantities[line.item_id] = quantities.get(line.item_id, 0) + line.quantity
+    else:
+        quantities = {
+            item.id: item.quantity_ordered - item.quantity_received
+            for item in items.values()
+            if item.quantity_ordered > item.quantity_received
+        }
+
+    try:
+        stocks = {
+            stock.id: stock
+            for stock in db.query(Stock).filter(
+                Stock.owner_id == current_user.id,
+                Stock.id.in_([items[item_id].stock_id for item_id in quantities]),
+            )
+        }
+        for item_id, quantity in quantities.items():
+            item = items[item_id]
+            item.quantity_received += quantity
+            stock = stocks.get(item.stock_id)
+            if stock is None:
+                continue  # Stock item deleted since the order was placed
+            previous_quantity = add_stock(db, stock, quantity) - quantity
+            refresh_cover(stock)
+            stock.last_updated_by = current_user.full_name
+            stock.last_updated_at = ledger_now()
+            record_movement(
+                db,
+                stock,
+                quantity,
+                MOVEMENT_PURCHASE,
+                previous_quantity=previous_quantity,
+                user_id=current_user.id,
+                notes=f"Received {order.order_number}",
+                unit_cost=item.unit_cost,
+            )
+
+        if all(item.quantity_received >= item.quantity_ordered for item in items.values()):
+            order.status = PurchaseOrderStatus.RECEIVED
+            order.received_date = ledger_now()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Error receiving purchase order: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to receive purchase order."
+        )
+
+    if stocks:
+        request_snapshot(current_user.id)
+    db.refresh(order)
+    return order
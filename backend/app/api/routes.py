@@ -1,29 +1,50 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from app.models.database import get_db
+from app.models.user import User
+from app.auth.security import get_current_active_user, require_owner
+from app.api.stock import get_owner_id
+from app.services.velocity import rank_low_stock, recompute_velocity
 
 router = APIRouter()
 
 
 @router.get("/inventory/low-stock", tags=["inventory"])
-async def list_low_stock() -> dict[str, list[dict[str, str | float]]]:
+def list_low_stock(
+    limit: int = 20,
+    include_ok: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+) -> dict[str, list[dict]]:
     """
-    Placeholder endpoint returning static velocity-based low-stock insights.
+    Velocity-based low-stock insights, most urgent first.
+    Served from the precomputed sales velocity stored on each stock item.
     """
+    owner_id = get_owner_id(current_user)
+    if owner_id == -1:
+        return {"items": []}
 
-    sample = [
-        {
-            "sku": "IPHN-15-TYPEC",
-            "name": "Type-C Cable (Anker 60W)",
-            "days_remaining": 1.8,
-            "status": "critical",
-        },
-        {
-            "sku": "PIX-8-CASE-CLEAR",
-            "name": "Pixel 8 Clear Case",
-            "days_remaining": 4.2,
-            "status": "warning",
-        },
-    ]
-    return {"items": sample}
+    return {"items": rank_low_stock(db, owner_id, limit=min(limit, 500), include_ok=include_ok)}
+
+
+@router.post("/inventory/velocity/recompute", tags=["inventory"])
+def recompute_sales_velocity(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_owner),
+) -> dict[str, int]:
+    """
+    Rebuild sales velocity for all items from the stock ledger (owner only).
+    Normally not needed: velocity is updated on every sale.
+    """
+    try:
+        updated = recompute_velocity(db, current_user.id)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Error recomputing velocity: {e}")
+        raise HTTPException(status_code=500, detail="Failed to recompute sales velocity.")
+    return {"updated": updated}
 
 
 @router.get("/market-pulse/{sku}", tags=["pricing"])
@@ -47,10 +68,3 @@ async def market_pulse(sku: str) -> dict[str, object]:
         "suggested_price": suggested_price,
         "profit": suggested_price - landing_cost,
     }
-
-
-
-
-
-
-
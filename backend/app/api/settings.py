@@ -11,7 +11,7 @@ router = APIRouter(prefix="/settings", tags=["settings"])
 # Use standard business settings in /business-setup/ endpoints.
 
 @router.get("/template")
-async def get_invoice_template(
+def get_invoice_template(
     current_user: User = Depends(get_current_active_user)
 ):
     """
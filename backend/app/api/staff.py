@@ -2,18 +2,21 @@
 Staff Management API - Auto-generated credentials for staff accounts.
 """
 from sqlalchemy.sql import func
+import base64
 import secrets
 import string
 from datetime import datetime
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, joinedload
+from pydantic import AliasPath, BaseModel, Field
 from app.models.database import get_db
 from app.models.user import User, UserRole
-from app.models.credentials_db import get_credentials_db, UserCredentials
 from app.auth.security import get_password_hash, require_owner
 from sqlalchemy.exc import IntegrityError
+from app.services.alerts import invalidate_alert_recipients
+from app.services.outbox import enqueue_email, outbox_worker
 
 router = APIRouter(prefix="/staff", tags=["staff"])
 
@@ -38,39 +41,49 @@ class StaffCreateResponse(BaseModel):
 class StaffResponse(BaseModel):
     id: int
     username: str
+    email: Optional[str] = None
     full_name: str
     business_name: Optional[str]
-    role: str
+    role: UserRole
     is_active: bool
-    created_at: str
-    owner_name: Optional[str] = None # For "Reporting to"
+    created_at: datetime
+    owner_name: Optional[str] = Field(None, validation_alias=AliasPath("owner", "full_name")) # For "Reporting to"
 
     class Config:
         from_attributes = True
 
 
-def generate_username(first_name: str, cred_db: Session) -> str:
-    """Generate a unique username from first name."""
+# Allocation races with a concurrent create_staff are retried this many times
+USERNAME_ATTEMPTS = 5
+
+
+def generate_username(first_name: str, db: Session) -> str:
+    """
+    Generate a unique username from first name: the name itself if free, else the
+    lowest free `name_NNN`. One query loads every taken `name` / `name_*` username.
+    """
     base_username = first_name.lower().strip().replace(" ", "_")
-    
-    # Try base username first (check credentials DB)
-    existing = cred_db.query(UserCredentials).filter(UserCredentials.username == base_username).first()
-    if not existing:
+    # `_` and `%` are LIKE wildcards
+    pattern = base_username.replace("\\", "\\\\").replace("_", "\\_").replace("%", "\\%") + "\\_%"
+
+    taken = {
+        username for (username,) in db.query(User.username).filter(
+            (User.username == base_username)
+            | User.username.like(pattern, escape="\\")
+        )
+    }
+    if base_username not in taken:
         return base_username
-    
-    # If exists, append random digits
-    max_attempts = 100
-    for _ in range(max_attempts):
-        random_digits = ''.join(secrets.choice(string.digits) for _ in range(3))
-        username = f"{base_username}_{random_digits}"
-        
-        existing = cred_db.query(UserCredentials).filter(UserCredentials.username == username).first()
-        if not existing:
-            return username
-    
-    # Fallback: use timestamp
-    import time
-    return f"{base_username}_{int(time.time()) % 10000}"
+
+    prefix = base_username + "_"
+    suffixes = {
+        int(username[len(prefix):]) for username in taken
+        if username.startswith(prefix) and username[len(prefix):].isdigit()
+    }
+    suffix = 1
+    while suffix in suffixes:
+        suffix += 1
+    return f"{prefix}{suffix:03d}"
 
 
 def generate_password(length: int = 8) -> str:
@@ -80,16 +93,15 @@ def generate_password(length: int = 8) -> str:
 
 
 @router.post("/create", response_model=StaffCreateResponse)
-async def create_staff(
+def create_staff(
     staff_data: StaffCreateRequest,
     db: Session = Depends(get_db),
-    cred_db: Session = Depends(get_credentials_db),
     owner: User = Depends(require_owner),
 ):
     """
     Create a new staff account with auto-generated credentials.
     Only owners can create staff accounts.
-    Credentials are stored in credentials.db
+    Credentials reach credentials.db through the outbox (app/services/credentials_replica.py)
     """
     if not staff_data.staff_name or not staff_data.staff_name.strip():
         raise HTTPException(
@@ -107,9 +119,7 @@ async def create_staff(
     business_name = owner.business_name.strip()
 
     try:
-        # Generate username from first name
         first_name = staff_data.staff_name.strip().split()[0]  # Get first name
-        generated_username = generate_username(first_name, cred_db)
         
         # Generate password and security code
         generated_password = generate_password(8)
@@ -118,52 +128,49 @@ async def create_staff(
         # Calculate hash ONCE
         hashed_password = get_password_hash(generated_password)
 
-        # Store credentials in credentials database (HASHED password now)
-        new_credentials = UserCredentials(
-            username=generated_username,
-            email=staff_data.email,  # Staff email
-            password=hashed_password,  # Store HASHED password
-            full_name=staff_data.staff_name.strip(),
-            business_name=business_name,
-            business_type=owner.business_type, # Inherit business type
-            role="staff",
-            is_active=True,
-            is_auto_generated=True,  # Mark as auto-generated
-            security_code=security_code,
-            owner_id=owner.id, # Link to owner
-            created_at=datetime.utcnow(),
-        )
-        cred_db.add(new_credentials)
-        cred_db.commit()
-        cred_db.refresh(new_credentials)
-        
-        # Also create user in main database
-        new_staff = User(
-            username=generated_username,
-            email=staff_data.email, # Save email in main DB too
-            hashed_password=hashed_password, # Use message hash
-
-            full_name=staff_data.staff_name.strip(),
-            business_name=business_name,
-            business_type=owner.business_type, # Inherit business type
-            role=UserRole.STAFF,
-            is_active=True,
-            security_code=security_code,
-            owner_id=owner.id, # Link to owner for Cascade Delete
-            created_at=datetime.utcnow(),
-        )
-        db.add(new_staff)
+        # Create the user. The username's unique index settles races: if another
+        # request took it first, allocate again.
+        for attempt in range(USERNAME_ATTEMPTS):
+            generated_username = generate_username(first_name, db)
+            new_staff = User(
+                username=generated_username,
+                email=staff_data.email,
+                hashed_password=hashed_password,
+                full_name=staff_data.staff_name.strip(),
+                business_name=business_name,
+                business_type=owner.business_type, # Inherit business type
+                role=UserRole.STAFF,
+                is_active=True,
+                security_code=security_code,
+                owner_id=owner.id, # Link to owner for Cascade Delete
+                created_at=datetime.utcnow(),
+            )
+            db.add(new_staff)
+            try:
+                db.flush()
+                break
+            except IntegrityError as e:
+                db.rollback()
+                if "username" not in str(e.orig).lower() or attempt == USERNAME_ATTEMPTS - 1:
+                    raise
+
+        # Welcome Email via the outbox (same transaction; credentials wiped from the row once sent)
+        if staff_data.email:
+            enqueue_email(
+                db,
+                to_email=staff_data.email,
+                template="welcome",
+                params={"username": generated_username, "password": generated_password, "security_code": security_code},
+                owner_id=owner.id,
+                sensitive=True,
+            )
         db.commit()
+        invalidate_alert_recipients(owner.id)
+        outbox_worker.wake()
         
         # Refresh to get ID and other specific DB fields
         db.refresh(new_staff)
 
-        # Send Welcome Email (Background Task ideally, but synchronous for now)
-        if staff_data.email:
-            from app.utils.email import send_welcome_email
-            # We wrap this in a try-except block inside the function, so it won't crash the request
-            send_welcome_email(staff_data.email, generated_username, generated_password, security_code)
-
         return StaffCreateResponse(
             id=new_staff.id,
             full_name=new_staff.full_name,
@@ -174,7 +181,6 @@ async def create_staff(
             message="Staff account created successfully. Save these credentials now - they will not be shown again.",
         )
     except IntegrityError as e:
-        cred_db.rollback()
         db.rollback()
         error_info = str(e.orig) if hasattr(e, 'orig') else str(e)
         if "email" in error_info.lower():
@@ -194,7 +200,6 @@ async def create_staff(
             )
 
     except Exception as e:
-        cred_db.rollback()
         db.rollback()
         print(f"Staff creation error: {e}")
         import traceback
@@ -207,70 +212,71 @@ async def create_staff(
         )
 
 
-@router.get("/list", response_model=list[StaffResponse])
-async def list_staff(
+# Page size cap for /list; follow X-Next-Cursor for more
+MAX_STAFF_PAGE_SIZE = 500
+
+
+def _encode_staff_cursor(full_name: str, staff_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{staff_id}|{full_name}".encode()).decode()
+
+
+def _decode_staff_cursor(cursor: str) -> Tuple[str, int]:
+    """Raises ValueError for a malformed cursor."""
+    staff_id, full_name = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+    return full_name, int(staff_id)
+
+
+@router.get("/list", response_model=List[StaffResponse])
+def list_staff(
+    response: Response,
+    q: Optional[str] = None, # Search name, username or email
+    limit: int = MAX_STAFF_PAGE_SIZE, # Page size
+    cursor: Optional[str] = None, # X-Next-Cursor of the previous page
     db: Session = Depends(get_db),
     owner: User = Depends(require_owner),
 ):
     """
-    List all staff members for the owner's business.
+    Staff directory of the owner's business, in name order.
+    When more staff exist, the `X-Next-Cursor` response header is set: pass it back as `cursor`.
     """
-    if not owner.business_name:
-        print("DEBUG: Owner has no business name!")
-        return []
-
-    # Normalize business name for filtering
-    owner_business = owner.business_name.strip()
-    
-    print(f"DEBUG: Listing staff for Owner: '{owner.username}' Business: '{owner_business}'")
-    
-    # DEBUG: Check if ANY users exist
-    all_users = db.query(User).all()
-    print(f"DEBUG: Total users in DB: {len(all_users)}")
-    for u in all_users:
-        print(f"DEBUG: User: {u.username}, Role: {u.role}, Business: '{u.business_name}'")
-
-    # Case-insensitive business name matching
-    # SQLite default collation is usually case-insensitive for ASCII, but we'll be explicit
-    # Using python-side filtering for robust debug comparison if needed, but SQL filter is better.
-    # We will use ilike or simple comparison after strip. Since business info is critical, exact match on normalized string is best.
-    
-    try:
-        staff_list = db.query(User).filter(
-            User.role == UserRole.STAFF,
-            User.owner_id == owner.id
-        ).all()
-        
-        print(f"DEBUG: Found {len(staff_list)} staff members after filter")
-        
-        # Ensure response matches schema, particularly datetime
-        response = []
-        for staff in staff_list:
-            response.append(StaffResponse(
-                id=staff.id,
-                username=staff.username,
-                full_name=staff.full_name,
-                business_name=staff.business_name,
-                role=staff.role.value if hasattr(staff.role, 'value') else str(staff.role),
-                is_active=staff.is_active,
-                created_at=staff.created_at.isoformat() if isinstance(staff.created_at, datetime) else str(staff.created_at),
-                owner_name=staff.owner.full_name if staff.owner else None # Populate reporting manager
-            ))
-            
-        return response
-    except Exception as e:
-        print(f"Error listing staff: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to retrieve staff list. Please try again later."
-        )
+    query = (
+        db.query(User)
+        .options(joinedload(User.owner))
+        .filter(User.owner_id == owner.id, User.role == UserRole.STAFF)
+    )
+
+    if q and q.strip():
+        term = f"%{q.strip()}%"
+        query = query.filter(or_(
+            User.full_name.ilike(term),
+            User.username.ilike(term),
+            User.email.ilike(term),
+        ))
+
+    if cursor:
+        try:
+            after_name, after_id = _decode_staff_cursor(cursor)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        # Keyset on (full_name, id): served by ix_users_owner_name however deep the page
+        query = query.filter(or_(
+            User.full_name > after_name,
+            and_(User.full_name == after_name, User.id > after_id),
+        ))
+
+    limit = max(1, min(limit, MAX_STAFF_PAGE_SIZE))
+    # One extra row tells whether there is a next page
+    staff_list = query.order_by(User.full_name, User.id).limit(limit + 1).all()
+    if len(staff_list) > limit:
+        staff_list = staff_list[:limit]
+        response.headers["X-Next-Cursor"] = _encode_staff_cursor(staff_list[-1].full_name, staff_list[-1].id)
+    return staff_list
 
 
 @router.delete("/{staff_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_staff(
+def delete_staff(
     staff_id: int,
     db: Session = Depends(get_db),
-    cred_db: Session = Depends(get_credentials_db),
     owner: User = Depends(require_owner),
 ):
     """
@@ -299,24 +305,13 @@ async def delete_staff(
         from app.models.account import Transaction
         db.query(Transaction).filter(Transaction.created_by_id == staff_id).update({Transaction.created_by_id: None})
 
-        db.commit()
-
-        # 3. Delete from credentials DB
-        cred_user = cred_db.query(UserCredentials).filter(
-            UserCredentials.username == staff_member.username
-        ).first()
-        
-        if cred_user:
-            cred_db.delete(cred_user)
-            cred_db.commit()
-
-        # 4. Delete from main DB
+        # 3. Delete from main DB (same transaction; credentials.db follows via the outbox)
         db.delete(staff_member)
         db.commit()
+        invalidate_alert_recipients(owner.id)
         
     except Exception as e:
         db.rollback()
-        cred_db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to delete staff member: {str(e)}"
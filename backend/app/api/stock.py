@@ -1,19 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime, timedelta
+import logging
+import time
+import random
 import pytz
 from sqlalchemy import func
+from sqlalchemy.orm.exc import StaleDataError
 
 from app.models.database import get_db
 from app.models.user import User, UserRole
 from app.models.stock import Stock
 from app.models.account import Transaction, TransactionType
 from app.auth.security import get_current_active_user, require_owner
-from app.utils.email import send_low_stock_alert
+from app.services.stock_import import iter_rows, import_stock_rows, ImportFormatError
+from app.services.stock_ledger import (
+    record_movement, request_snapshot, movement_type_for, stock_on, MOVEMENT_PURCHASE, MOVEMENT_SNAPSHOT,
+)
+from app.models.product import StockMovement
+from app.services.velocity import refresh_cover
+from app.services.alerts import claim_low_stock_items, queue_low_stock_alerts
+from app.services.daybook import record_transaction
 
 router = APIRouter(prefix="/stock", tags=["stock"])
+logger = logging.getLogger(__name__)
 
 # Helper to get the effective owner_id
 def get_owner_id(user: User) -> int:
@@ -89,10 +101,42 @@ class StockResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class StockMovementResponse(BaseModel):
+    id: int
+    movement_type: str
+    quantity_change: int
+    previous_quantity: int
+    new_quantity: int
+    sale_id: Optional[int] = None
+    notes: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class StockOnDateResponse(BaseModel):
+    id: int
+    product_name: str
+    company_name: str
+    category: str
+    quantity: int
+
+class StockImportError(BaseModel):
+    row: int
+    error: str
+
+class StockImportResponse(BaseModel):
+    total_rows: int
+    created: int
+    updated: int
+    failed: int
+    low_stock_alerts: int
+    errors: List[StockImportError]
+
 # --- Endpoints ---
 
 @router.get("/companies", response_model=List[str])
-async def get_companies(
+def get_companies(
     business_type: str = "default",
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db),
@@ -131,7 +175,7 @@ async def get_companies(
 
 
 @router.get("/suggestions", response_model=List[StockSuggestion])
-async def get_suggestions(
+def get_suggestions(
     business_type: str = "default",
     company_name: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
@@ -183,17 +227,38 @@ async def get_suggestions(
     unique_map = {s.product_name.lower(): s for s in all_suggestions}
     return list(unique_map.values())
 
+# Version conflicts (another counter changed the same item) are retried this many times
+STOCK_UPDATE_RETRIES = 5
+
 @router.post("/add-or-update", response_model=StockResponse)
-async def add_or_update_stock(
+def add_or_update_stock(
     stock_data: StockCreateRequest,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
 ):
     """
     Add new stock or update quantity if it exists.
     Scoped to Owner ID.
     """
+    for attempt in range(STOCK_UPDATE_RETRIES):
+        try:
+            return _add_or_update_stock_impl(stock_data, db, current_user)
+        except StaleDataError:
+            # Stock.version changed between our read and write: re-read and apply again
+            db.rollback()
+            logger.warning(f"Stock version conflict, retrying ({attempt + 1}/{STOCK_UPDATE_RETRIES})")
+            time.sleep(random.uniform(0.005, 0.05))
+
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="This item is being updated by someone else right now. Please try again."
+    )
+
+def _add_or_update_stock_impl(
+    stock_data: StockCreateRequest,
+    db: Session,
+    current_user: User,
+):
     owner_id = get_owner_id(current_user)
     if owner_id == -1:
          raise HTTPException(status_code=400, detail="Unable to determine Business Owner ID.")
@@ -208,6 +273,7 @@ async def add_or_update_stock(
 
         if existing_stock:
             # Update existing
+            previous_quantity = existing_stock.quantity
             existing_stock.quantity += stock_data.quantity
             existing_stock.last_updated_by = current_user.full_name
             existing_stock.category = stock_data.category # Update category if changed
@@ -217,64 +283,32 @@ async def add_or_update_stock(
             # Update Price if provided (allow 0.0)
             if stock_data.selling_price is not None:
                 existing_stock.selling_price = stock_data.selling_price
+            if stock_data.cost_price and stock_data.cost_price > 0:
+                existing_stock.cost_price = stock_data.cost_price
             
             # Ensure quantity doesn't go negative if bad input
             if existing_stock.quantity < 0:
                  existing_stock.quantity = 0
+
+            # Ledger row for the change (same transaction)
+            if existing_stock.quantity != previous_quantity:
+                refresh_cover(existing_stock)
+                record_movement(
+                    db,
+                    existing_stock,
+                    existing_stock.quantity - previous_quantity,
+                    movement_type_for(stock_data.quantity),
+                    previous_quantity=previous_quantity,
+                    user_id=current_user.id,
+                )
+                request_snapshot(owner_id)
             
-            # Check Low Stock Alert
-            # Condition: Quantity <= Threshold AND (No previous alert OR > 24h since last alert)
-            if existing_stock.quantity <= existing_stock.threshold_quantity:
-                should_alert = False
-                if not existing_stock.last_alert_sent:
-                    should_alert = True
-                else:
-                    # Check if 24 hours passed
-                    # Use Naive IST for comparison (since DB stores naive)
-                    now_ist_naive = datetime.now(pytz.timezone('Asia/Kolkata')).replace(tzinfo=None)
-                    if existing_stock.last_alert_sent:
-                         # Ensure database value is treated as naive (it usually is)
-                         last_sent = existing_stock.last_alert_sent
-                         # DEV MODE: Cooldown reduced to 1 minute for easier testing
-                         if now_ist_naive - last_sent > timedelta(minutes=1):
-                             should_alert = True
-                
-                if should_alert:
-                    # Fetch recipients: Owner + ALL Staff members (Phone Numbers)
-                    phone_numbers = set()
-                    
-                    # 1. Get Owner Phone
-                    if owner_id != -1:
-                        owner = db.query(User).filter(User.id == owner_id).first()
-                        if owner and owner.phone_number:
-                            phone_numbers.add(owner.phone_number)
-                    
-                    # 2. Get All Staff for this Owner
-                    if owner_id != -1:
-                         staff_members = db.query(User).filter(User.owner_id == owner_id).all()
-                         for staff in staff_members:
-                             if staff.phone_number:
-                                 phone_numbers.add(staff.phone_number)
-                    
-                    # Call WhatsApp for each number
-                    from app.utils.whatsapp import send_low_stock_whatsapp
-                    
-                    if phone_numbers:
-                        for phone in phone_numbers:
-                            background_tasks.add_task(
-                                send_low_stock_whatsapp,
-                                to_number=phone,
-                                product_name=existing_stock.product_name,
-                                current_quantity=existing_stock.quantity
-                            )
-                        
-                        # Store as Naive IST
-                        existing_stock.last_alert_sent = datetime.now(pytz.timezone('Asia/Kolkata')).replace(tzinfo=None)
+            # Low stock: honours threshold_quantity and the per-item alert cooldown
+            alert_items = claim_low_stock_items([existing_stock])
             
             # Auto-Log Expense if Cost Price & Quantity provided (and positive)
 
             if stock_data.quantity > 0 and stock_data.cost_price and stock_data.cost_price > 0:
-                print("DEBUG: Condition Met. Creating Transaction...")
                 total_cost = stock_data.quantity * stock_data.cost_price
                 expense_txn = Transaction(
                     description=f"Stock Purchase: {existing_stock.product_name} x {stock_data.quantity}",
@@ -284,11 +318,14 @@ async def add_or_update_stock(
                     # Store as Naive IST
                     date=datetime.now(pytz.timezone('Asia/Kolkata')).replace(tzinfo=None),
                     created_by_id=current_user.id,
+                    owner_id=owner_id,
                     payment_method="cash", # Default to cash
                     handler_name=current_user.full_name # Mark who added it
                 )
                 db.add(expense_txn)
+                record_transaction(db, owner_id, expense_txn)
 
+            queue_low_stock_alerts(db, owner_id, alert_items)
             db.commit()
             db.refresh(existing_stock)
             return StockResponse(
@@ -313,6 +350,7 @@ async def add_or_update_stock(
                 quantity=stock_data.quantity,
 
                 selling_price=stock_data.selling_price if stock_data.selling_price is not None else 0.0,
+                cost_price=stock_data.cost_price or 0.0,
                 threshold_quantity=stock_data.threshold_quantity if stock_data.threshold_quantity is not None else 5,
                 last_updated_by=current_user.full_name
             )
@@ -320,34 +358,6 @@ async def add_or_update_stock(
             if new_stock.quantity < 0:
                 new_stock.quantity = 0
             
-            # Initial Check for Low Stock (Unlikely unless initial qty is low)
-            if new_stock.quantity <= new_stock.threshold_quantity:
-                 # Fetch recipients: Owner + ALL Staff members
-                 phone_numbers = set()
-                 
-                 if owner_id != -1:
-                    owner = db.query(User).filter(User.id == owner_id).first()
-                    if owner and owner.phone_number:
-                        phone_numbers.add(owner.phone_number)
-                 
-                 if owner_id != -1:
-                     staff_members = db.query(User).filter(User.owner_id == owner_id).all()
-                     for staff in staff_members:
-                         if staff.phone_number:
-                             phone_numbers.add(staff.phone_number)
-                 
-                 if phone_numbers:
-                    from app.utils.whatsapp import send_low_stock_whatsapp
-                    for phone in phone_numbers:
-                        background_tasks.add_task(
-                            send_low_stock_whatsapp,
-                            to_number=phone,
-                            product_name=new_stock.product_name,
-                            current_quantity=new_stock.quantity
-                        )
-                 
-                 new_stock.last_alert_sent = datetime.now(pytz.timezone('Asia/Kolkata'))
-
             # Auto-Log Expense
             if stock_data.quantity > 0 and stock_data.cost_price and stock_data.cost_price > 0:
                 total_cost = stock_data.quantity * stock_data.cost_price
@@ -356,14 +366,29 @@ async def add_or_update_stock(
                     amount=total_cost,
                     type=TransactionType.EXPENSE,
                     category="Stock",
-                    date=datetime.now(pytz.timezone('Asia/Kolkata')),
+                    date=datetime.now(pytz.timezone('Asia/Kolkata')).replace(tzinfo=None),
                     created_by_id=current_user.id,
+                    owner_id=owner_id,
                     payment_method="cash",
                     handler_name=current_user.full_name
                 )
                 db.add(expense_txn)
+                record_transaction(db, owner_id, expense_txn)
 
             db.add(new_stock)
+            record_movement(
+                db,
+                new_stock,
+                new_stock.quantity,
+                MOVEMENT_PURCHASE,
+                previous_quantity=0,
+                user_id=current_user.id,
+                notes="Opening stock",
+            )
+            request_snapshot(owner_id)
+            # Initial Check for Low Stock (Unlikely unless initial qty is low)
+            alert_items = claim_low_stock_items([new_stock])
+            queue_low_stock_alerts(db, owner_id, alert_items)
             db.commit()
             db.refresh(new_stock)
             
@@ -379,6 +404,8 @@ async def add_or_update_stock(
                 last_updated_at=new_stock.last_updated_at.isoformat()
             )
 
+    except StaleDataError:
+        raise
     except Exception as e:
         db.rollback()
         print(f"Error adding/updating stock: {e}")
@@ -387,8 +414,68 @@ async def add_or_update_stock(
             detail="Failed to update stock inventory. Please try again."
         )
 
+@router.post("/import", response_model=StockImportResponse)
+def import_stock(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Bulk add/update stock from a CSV or XLSX sheet.
+    Columns: product_name, company_name, category, quantity
+    (optional: selling_price, cost_price, threshold_quantity).
+    Valid rows are saved even if some rows fail; failures are reported per row.
+    """
+    owner_id = get_owner_id(current_user)
+    if owner_id == -1:
+         raise HTTPException(status_code=400, detail="Unable to determine Business Owner ID.")
+
+    try:
+        rows = iter_rows(file.filename, file.file)
+        report = import_stock_rows(
+            db,
+            rows,
+            owner_id=owner_id,
+            business_name=current_user.business_name,
+            user_id=current_user.id,
+            user_name=current_user.full_name,
+        )
+
+        # Single low stock evaluation for everything the import touched
+        low_items = []
+        if report["stock_ids"]:
+            candidates = db.query(Stock).filter(
+                Stock.owner_id == owner_id,
+                Stock.quantity <= Stock.threshold_quantity,
+            ).all()
+            low_items = claim_low_stock_items(s for s in candidates if s.id in report["stock_ids"])
+
+        queue_low_stock_alerts(db, owner_id, low_items)
+        db.commit()
+    except ImportFormatError as e:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        print(f"Error importing stock: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to import stock sheet. Please try again."
+        )
+    finally:
+        file.file.close()
+
+    return StockImportResponse(
+        total_rows=report["total_rows"],
+        created=report["created"],
+        updated=report["updated"],
+        failed=report["failed"],
+        low_stock_alerts=len(low_items),
+        errors=[StockImportError(**e) for e in report["errors"]],
+    )
+
 @router.get("/list", response_model=List[StockResponse])
-async def list_stock(
+def list_stock(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
@@ -430,8 +517,74 @@ async def list_stock(
         )
 
 
+@router.get("/on-date", response_model=List[StockOnDateResponse])
+def stock_on_date(
+    date_str: str, # format: YYYY-MM-DD
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Quantity of every item at the END of the given day, rebuilt from the stock ledger.
+    """
+    owner_id = get_owner_id(current_user)
+    if owner_id == -1:
+        return []
+
+    try:
+        day = datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date_str must be YYYY-MM-DD")
+
+    # Ledger times are Naive IST, like the Day Book
+    quantities = stock_on(db, owner_id, day + timedelta(days=1) - timedelta(microseconds=1))
+    if not quantities:
+        return []
+
+    items = db.query(Stock).filter(Stock.owner_id == owner_id).order_by(Stock.product_name).all()
+    return [
+        StockOnDateResponse(
+            id=s.id,
+            product_name=s.product_name,
+            company_name=s.company_name,
+            category=s.category,
+            quantity=quantities[s.id],
+        )
+        for s in items
+        if s.id in quantities
+    ]
+
+
+@router.get("/{stock_id}/movements", response_model=List[StockMovementResponse])
+def list_stock_movements(
+    stock_id: int,
+    before_id: Optional[int] = None, # pass the last id of the previous page
+    limit: int = 50,
+    include_snapshots: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Movement history (ledger) of one stock item, newest first.
+    """
+    owner_id = get_owner_id(current_user)
+    stock_item = db.query(Stock.id).filter(
+        Stock.id == stock_id,
+        Stock.owner_id == owner_id
+    ).first()
+    if not stock_item:
+        raise HTTPException(status_code=404, detail="Stock item not found")
+
+    query = db.query(StockMovement).filter(StockMovement.stock_id == stock_id)
+    if not include_snapshots:
+        query = query.filter(StockMovement.movement_type != MOVEMENT_SNAPSHOT)
+    if before_id:
+        query = query.filter(StockMovement.id < before_id)
+
+    return query.order_by(StockMovement.id.desc()).limit(min(limit, 500)).all()
+
+
 @router.delete("/{stock_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_stock(
+def delete_stock(
     stock_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_owner), # Enforce Owner Role
@@ -1,10 +1,12 @@
-from app.auth.security import verify_password, get_password_hash, create_access_token, get_current_user
+from app.auth.security import verify_password, verify_and_update_password, get_password_hash, create_access_token, create_user_access_token, get_current_user
 from app.auth.dependencies import get_current_active_user, require_owner
 
 __all__ = [
     "verify_password",
+    "verify_and_update_password",
     "get_password_hash",
     "create_access_token",
+    "create_user_access_token",
     "get_current_user",
     "get_current_active_user",
     "require_owner",
@@ -0,0 +1,210 @@
+"""
+Authenticated-principal cache.
+
+`get_current_user` used to run `SELECT ... FROM users WHERE username = ?` on every
+request (and staff requests a second one for `current_user.owner`). Access tokens now
+carry `uid`, and the user's principal columns (id, username, role, owner_id, business
+name, ...) are cached per user id for PRINCIPAL_CACHE_TTL seconds. On a hit the User is
+attached to the request's session with `merge(load=False)`: no round trip, and it is
+still a normal persistent object (changes to it are saved by the request's commit, and
+columns left out of the cache - password hash, logo, templates - load on first access).
+
+Any committed ORM change to a user (update or delete) drops its entry; bulk
+`query(User).delete()` callers call `invalidate_principal` themselves. The local backend
+is per process, so another worker may serve a changed user for up to the TTL; set
+`principal_cache_backend=redis` to share the cache (and its invalidations) between
+workers.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import DateTime, Enum, event
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.config import get_settings
+from app.models.user import User, UserRole
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Columns kept in the cache (no password hash / security code, no large template columns)
+PRINCIPAL_COLUMNS = (
+    "id", "username", "email", "phone_number", "full_name", "business_name", "business_type",
+    "business_address", "business_phone", "role", "is_active", "owner_id", "created_at",
+)
+
+PRINCIPAL_CACHE_TTL = settings.principal_cache_ttl_seconds
+PRINCIPAL_CACHE_SIZE = settings.principal_cache_size
+
+
+class LocalPrincipalCache:
+    """In-process TTL LRU (the default, and the fallback when Redis is unavailable)."""
+
+    def __init__(self, ttl: int = PRINCIPAL_CACHE_TTL, size: int = PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()  # user id -> (expires_at, principal)
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id: int, principal: Dict):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+class RedisPrincipalCache:
+    """Shared between workers. Redis errors count as misses (auth falls back to the DB)."""
+
+    def __init__(self, client, ttl: int = PRINCIPAL_CACHE_TTL):
+        self.client = client
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"principal:{user_id}"
+
+    def get(self, user_id: int) -> Optional[Dict]:
+        try:
+            value = self.client.get(self._key(user_id))
+        except Exception as e:
+            logger.warning(f"Principal cache read failed: {e}")
+            return None
+        return json.loads(value) if value else None
+
+    def set(self, user_id: int, principal: Dict):
+        try:
+            self.client.set(self._key(user_id), json.dumps(principal), ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Principal cache write failed: {e}")
+
+    def delete(self, user_id: int):
+        try:
+            self.client.delete(self._key(user_id))
+        except Exception as e:
+            logger.warning(f"Principal cache invalidation failed for user {user_id}: {e}")
+
+
+def _create_cache():
+    if settings.principal_cache_backend == "redis":
+        try:
+            import redis
+        except ImportError:
+            logger.warning("principal_cache_backend=redis but the redis package is not installed; using the local cache")
+        else:
+            return RedisPrincipalCache(redis.Redis.from_url(settings.redis_url, socket_timeout=0.5))
+    return LocalPrincipalCache()
+
+
+principal_cache = _create_cache()
+
+
+# --- (De)serialization: JSON-safe dicts, so both backends store the same thing ---
+
+_COLUMN_TYPES = {column.name: column.type for column in User.__table__.columns}
+
+
+def _snapshot(user: User) -> Dict:
+    principal = {}
+    for name in PRINCIPAL_COLUMNS:
+        value = getattr(user, name)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, UserRole):
+            value = value.value
+        principal[name] = value
+    return principal
+
+
+def _restore(principal: Dict) -> Dict:
+    values = dict(principal)
+    for name, value in principal.items():
+        if value is None:
+            continue
+        column_type = _COLUMN_TYPES[name]
+        if isinstance(column_type, DateTime):
+            values[name] = datetime.fromisoformat(value)
+        elif isinstance(column_type, Enum):
+            values[name] = column_type.enum_class(value)
+    return values
+
+
+def _attach(db: Session, principal: Dict) -> User:
+    """Persistent User in `db` from cached columns, without a query."""
+    user = User(**_restore(principal))
+    make_transient_to_detached(user)  # Not-cached columns become "expired": loaded on access
+    return db.merge(user, load=False)
+
+
+def _principal(db: Session, user_id: int) -> Optional[User]:
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return _attach(db, principal)
+    user = db.get(User, user_id)
+    if user is not None:
+        principal_cache.set(user_id, _snapshot(user))
+    return user
+
+
+def resolve_principal(db: Session, user_id: int) -> Optional[User]:
+    """
+    The user with this id, from the cache when possible. A staff member's `owner` is
+    resolved the same way, so `current_user.owner` doesn't query either.
+    """
+    user = _principal(db, user_id)
+    if user is not None and user.owner_id is not None and "owner" not in user.__dict__:
+        owner = _principal(db, user.owner_id)
+        set_committed_value(user, "owner", owner)
+    return user
+
+
+def remember_principal(user: User):
+    principal_cache.set(user.id, _snapshot(user))
+
+
+def invalidate_principal(user_id: int):
+    """Call after bulk changes to users that bypass the ORM (query(User)...delete/update)."""
+    principal_cache.delete(user_id)
+
+
+# --- Invalidation on commit ---
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session, flush_context):
+    changed = session.info.setdefault("changed_user_ids", set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            changed.add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop("changed_user_ids", ()):
+        principal_cache.delete(user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_changed_users(session, previous_transaction):
+    session.info.pop("changed_user_ids", None)
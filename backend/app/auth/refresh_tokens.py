@@ -0,0 +1,225 @@
+"""
+Rotating refresh tokens.
+
+Access tokens live `access_token_expire_minutes`. To renew one the client posts its
+refresh token to /auth/refresh instead of logging in again, so no bcrypt. A refresh token
+is an HS256 JWT naming a `refresh_tokens` row: checking it is one HMAC and one lookup by
+`jti`. Each refresh marks the row used and issues the next token of the same family (a
+family is one login session). A used token presented again (outside a short grace
+window for two tabs refreshing at once) means it was copied, and the whole family is
+revoked.
+
+Access tokens carry their family as `sid`. Revoked families are kept in memory
+(`revoked_sessions`), so `get_current_user` rejects a logged-out session's access tokens
+without a query. Each worker reloads the list every `revocation_sync_seconds`, so a
+logout handled by one worker reaches the others within that time.
+"""
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+import pytz
+from jose import JWTError, jwt
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.models.database import SessionLocal
+from app.models.refresh_token import RefreshToken
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+REFRESH_TOKEN_TYPE = "refresh"
+
+# A token used again this soon after its rotation is a concurrent refresh, not a replay
+REUSE_GRACE = timedelta(seconds=10)
+
+
+class RefreshTokenError(Exception):
+    """The refresh token is invalid, expired, revoked or replayed."""
+
+
+def refresh_now() -> datetime:
+    # Store as Naive IST (same clock as the rest of the app)
+    return datetime.now(pytz.timezone('Asia/Kolkata')).replace(tzinfo=None)
+
+
+def access_token_lifetime() -> timedelta:
+    return timedelta(minutes=settings.access_token_expire_minutes)
+
+
+class RevokedSessions:
+    """In-memory set of revoked families, reloaded from `refresh_tokens` periodically."""
+
+    def __init__(self, sync_interval: float = settings.revocation_sync_seconds):
+        self.sync_interval = sync_interval
+        self._families: Dict[str, datetime] = {}  # family -> revoked_at
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_purge = datetime.min
+
+    def __contains__(self, family: str) -> bool:
+        with self._lock:
+            return family in self._families
+
+    def add(self, families: Iterable[str], revoked_at: datetime):
+        with self._lock:
+            for family in families:
+                self._families[family] = revoked_at
+
+    def sync(self):
+        # A family revoked longer ago than an access token lives has no valid access tokens left
+        since = refresh_now() - access_token_lifetime()
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(RefreshToken.family, RefreshToken.revoked_at)
+                .filter(RefreshToken.revoked_at >= since)
+                .distinct()
+                .all()
+            )
+        finally:
+            db.close()
+        with self._lock:
+            self._families = {family: revoked_at for family, revoked_at in rows}
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="revocation-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+                self._maybe_purge()
+            except Exception as e:
+                logger.error(f"❌ Revocation list sync failed: {e}")
+            self._stop.wait(self.sync_interval)
+
+    def _maybe_purge(self):
+        now = refresh_now()
+        if now - self._last_purge < timedelta(hours=1):
+            return
+        self._last_purge = now
+        db = SessionLocal()
+        try:
+            purged = purge_expired(db)
+            db.commit()
+            if purged:
+                logger.info(f"🧹 Purged {purged} expired refresh tokens")
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+revoked_sessions = RevokedSessions()
+
+
+def new_family() -> str:
+    return uuid.uuid4().hex
+
+
+def issue_refresh_token(db: Session, user_id: int, family: str) -> str:
+    """Add the family's next refresh token (the caller commits)."""
+    jti = uuid.uuid4().hex
+    lifetime = timedelta(days=settings.refresh_token_expire_days)
+    now = refresh_now()
+    db.add(RefreshToken(
+        jti=jti,
+        family=family,
+        user_id=user_id,
+        created_at=now,
+        expires_at=now + lifetime,
+    ))
+    return jwt.encode(
+        {"typ": REFRESH_TOKEN_TYPE, "jti": jti, "sid": family, "uid": user_id, "exp": datetime.utcnow() + lifetime},
+        settings.secret_key,
+        algorithm="HS256",
+    )
+
+
+def decode_refresh_token(token: str) -> Dict:
+    try:
+        payload = jwt.decode(token, settings.secret_key, algorithms=["HS256"])
+    except JWTError:
+        raise RefreshTokenError("Invalid refresh token")
+    if payload.get("typ") != REFRESH_TOKEN_TYPE or not payload.get("jti") or not payload.get("sid"):
+        raise RefreshTokenError("Invalid refresh token")
+    return payload
+
+
+def rotate_refresh_token(db: Session, token: str) -> Tuple[int, str, str]:
+    """
+    Exchange a refresh token for the next one in its family.
+    Returns (user_id, family, new refresh token); the caller commits.
+    """
+    payload = decode_refresh_token(token)
+    family = payload["sid"]
+    if family in revoked_sessions:
+        raise RefreshTokenError("Session has been revoked")
+
+    row = db.query(RefreshToken).filter(RefreshToken.jti == payload["jti"]).first()
+    now = refresh_now()
+    if row is None or row.revoked_at is not None or row.expires_at <= now:
+        raise RefreshTokenError("Invalid refresh token")
+
+    # Conditional update, so two requests can't both rotate the same token unnoticed
+    claimed = (
+        db.query(RefreshToken)
+        .filter(RefreshToken.id == row.id, RefreshToken.used_at.is_(None))
+        .update({"used_at": now}, synchronize_session=False)
+    )
+    if not claimed:
+        used_at = row.used_at or now  # None: another request rotated it just now
+        if now - used_at > REUSE_GRACE:
+            revoke_family(db, family)
+            db.commit()
+            logger.warning(f"Refresh token reuse for user {row.user_id}: session revoked")
+            raise RefreshTokenError("Refresh token has already been used")
+
+    return row.user_id, family, issue_refresh_token(db, row.user_id, family)
+
+
+def revoke_family(db: Session, family: str):
+    """End one session (the caller commits)."""
+    now = refresh_now()
+    db.query(RefreshToken).filter(
+        RefreshToken.family == family, RefreshToken.revoked_at.is_(None)
+    ).update({"revoked_at": now}, synchronize_session=False)
+    revoked_sessions.add([family], now)
+
+
+def purge_expired(db: Session) -> int:
+    """Delete refresh tokens past their expiry (used or not, they can't be exchanged any more)."""
+    return db.query(RefreshToken).filter(RefreshToken.expires_at < refresh_now()).delete(synchronize_session=False)
+
+
+def revoke_user_sessions(db: Session, user_ids: Iterable[int]):
+    """End all sessions of these users, e.g. after a password change (the caller commits)."""
+    user_ids = list(user_ids)
+    now = refresh_now()
+    families = [
+        family for (family,) in db.query(RefreshToken.family)
+        .filter(RefreshToken.user_id.in_(user_ids), RefreshToken.revoked_at.is_(None))
+        .distinct()
+    ]
+    if not families:
+        return
+    db.query(RefreshToken).filter(
+        RefreshToken.user_id.in_(user_ids), RefreshToken.revoked_at.is_(None)
+    ).update({"revoked_at": now}, synchronize_session=False)
+    revoked_sessions.add(families, now)
@@ -1,5 +1,7 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
@@ -8,57 +10,84 @@ from sqlalchemy.orm import Session
 from app.config import get_settings
 from app.models.database import get_db
 from app.models.user import User, UserRole
+from app.auth.principal_cache import resolve_principal, remember_principal
+from app.auth.refresh_tokens import REFRESH_TOKEN_TYPE, access_token_lifetime, revoked_sessions
 
 settings = get_settings()
 
-# We keep this for hashing passwords into the main DB
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# We keep this for hashing passwords into the main DB. The cost is pinned (min = max =
+# default rounds), so a hash made at another cost "needs update" and is redone on login.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.bcrypt_rounds,
+    bcrypt__min_rounds=settings.bcrypt_rounds,
+    bcrypt__max_rounds=settings.bcrypt_rounds,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# bcrypt runs in its own pool, one hash per core at a time: a login rush queues here
+# instead of every request thread grinding bcrypt at once
+_password_pool = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers or os.cpu_count() or 2,
+    thread_name_prefix="bcrypt",
+)
+
+def _bcrypt_input(password: str) -> str:
+    # Truncate to 72 bytes strictly (bcrypt ignores the rest)
+    b = password.encode("utf-8")
+    if len(b) > 72:
+        b = b[:72]
+    # DECISION: Passlib/Bcrypt can be finicky with bytes on some platforms
+    # Decode back to utf-8 string, ignoring errors (lossy is fine for truncation)
+    return b.decode("utf-8", errors="ignore")
+
 def verify_password(plain_password: str, stored_password: str) -> bool:
     """
     Verify a stored password against the provided plain password.
     """
-    # Truncate to 72 bytes strictly to match hashing behavior
-    b_plain = plain_password.encode("utf-8")
-    if len(b_plain) > 72:
-        b_plain = b_plain[:72]
-    
-    # DECISION: Passlib/Bcrypt can be finicky with bytes on some platforms
-    # Decode back to utf-8 string, ignoring errors (lossy is fine for truncation)
-    valid_str = b_plain.decode("utf-8", errors="ignore")
-    
-    return pwd_context.verify(valid_str, stored_password)
+    return _password_pool.submit(pwd_context.verify, _bcrypt_input(plain_password), stored_password).result()
+
+def verify_and_update_password(plain_password: str, stored_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Like verify_password, plus a new hash when the stored one was made with another
+    bcrypt cost (None otherwise).
+    """
+    return _password_pool.submit(
+        pwd_context.verify_and_update, _bcrypt_input(plain_password), stored_password
+    ).result()
 
 def get_password_hash(password: str) -> str:
     """Hash a password for the main application database."""
-    print(f"DEBUG: Input PW Len: {len(password)}")
-    
-    # Ensure strict 72-byte limit
-    b = password.encode("utf-8")
-    if len(b) > 72:
-        print("DEBUG: Truncating password bytes")
-        b = b[:72]
-        
-    # DECISION: Decode back to utf-8 string for maximum compatibility
-    valid_str = b.decode("utf-8", errors="ignore")
-    print(f"DEBUG: Hashing final string of len: {len(valid_str)}")
-    
-    return pwd_context.hash(valid_str)
+    return _password_pool.submit(pwd_context.hash, _bcrypt_input(password)).result()
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
-    """Create a JWT access token."""
+    """
+    Create a JWT access token (lifetime `access_token_expire_minutes` by default). Include
+    `uid` so requests resolve the user from the principal cache; login sessions use
+    create_user_access_token.
+    """
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(hours=24)
+        expire = datetime.utcnow() + access_token_lifetime()
     to_encode.update({"exp": expire})
     # Ensure settings.secret_key is used
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm="HS256")
     return encoded_jwt
 
-async def get_current_user(
+def create_user_access_token(user: User, session_id: str) -> str:
+    """Access token for a login session (`session_id` = its refresh token family)."""
+    return create_access_token(data={
+        "sub": user.username,
+        "uid": user.id,
+        "owner_id": user.owner_id,
+        "role": user.role.value,
+        "sid": session_id,
+    })
+
+def get_current_user(
     token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
 ) -> User:
     """Get the current authenticated user from JWT token."""
@@ -70,17 +99,30 @@ async def get_current_user(
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=["HS256"])
         username: str = payload.get("sub")
-        if username is None:
+        if username is None or payload.get("typ") == REFRESH_TOKEN_TYPE:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    # Logged out / revoked session (in-memory list, no query)
+    if payload.get("sid") in revoked_sessions:
+        raise credentials_exception
 
-    user = db.query(User).filter(User.username == username).first()
+    user_id = payload.get("uid")
+    if user_id is None:
+        # Token issued before tokens carried `uid`
+        user = db.query(User).filter(User.username == username).first()
+        if user is not None:
+            remember_principal(user)
+    else:
+        user = resolve_principal(db, user_id)
+        # The id may have been reused after the account was deleted
+        if user is not None and user.username != username:
+            user = None
     if user is None:
         raise credentials_exception
     return user
 
-async def get_current_active_user(
+def get_current_active_user(
     current_user: User = Depends(get_current_user),
 ) -> User:
     """Get the current active user."""
@@ -88,7 +130,7 @@ async def get_current_active_user(
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
-async def require_owner(current_user: User = Depends(get_current_active_user)) -> User:
+def require_owner(current_user: User = Depends(get_current_active_user)) -> User:
     """Require the current user to be an owner."""
     if current_user.role != UserRole.OWNER:
         raise HTTPException(
@@ -12,9 +12,36 @@ class Settings(BaseSettings):
     # Credentials database for user authentication
     credentials_db_url: str = "sqlite:///./credentials.db"
     
+    # Request handlers are plain `def` and run in this thread pool (AnyIO's default is 40);
+    # the DB pools are sized so that every handler thread can hold a connection
+    threadpool_size: int = 40
+    db_pool_size: int = 10
+    db_max_overflow: int = 30
+
+    # SQLite tuning, applied to every connection of both databases (app/models/database.py)
+    sqlite_journal_mode: str = "WAL"  # Readers and the writer don't block each other
+    sqlite_synchronous: str = "NORMAL"  # Durable with WAL except for the last commits on power loss
+    sqlite_busy_timeout_ms: int = 5000  # How long a writer waits for the lock before "database is locked"
+    sqlite_cache_size_kib: int = 16384  # Page cache per connection
+    sqlite_mmap_size: int = 268435456  # Bytes of the file read through mmap (0 = off)
+    sqlite_temp_store: str = "MEMORY"  # Sorts and temp tables stay off disk
+    sqlite_checkpoint_seconds: int = 300  # Periodic wal_checkpoint (0 = only SQLite's automatic ones)
+    sqlite_checkpoint_mode: str = "PASSIVE"  # PASSIVE never blocks; TRUNCATE also shrinks the -wal file
+    sqlite_optimize_seconds: int = 3600  # Periodic PRAGMA optimize (0 = off)
+
     redis_url: str = "redis://localhost:6379/0"
+    # Authenticated users are cached (see app/auth/principal_cache.py); "redis" shares the cache between workers
+    principal_cache_backend: str = "local"
+    principal_cache_ttl_seconds: int = 60
+    principal_cache_size: int = 10000
     secret_key: str = "dev-secret-key-change-in-production-min-32-characters-long"
     algorithm: str = "HS256"
+    # Access tokens are short-lived; clients renew them at /auth/refresh (no password check)
+    access_token_expire_minutes: int = 15
+    refresh_token_expire_days: int = 30
+    revocation_sync_seconds: int = 30  # How often each worker reloads revoked sessions
+    bcrypt_rounds: int = 12  # Password hashing cost (lower it for dev/test); old hashes are redone on login
+    password_hash_workers: int = 0  # Threads hashing/verifying passwords (0 = one per CPU core)
 
     twilio_account_sid: str = ""
     twilio_auth_token: str = ""
@@ -26,6 +53,11 @@ class Settings(BaseSettings):
     whatsapp_access_token: str = ""
     whatsapp_verify_token: str = "" # Optional (for webhooks)
     whatsapp_business_account_id: str = "" # Optional
+    whatsapp_api_base_url: str = "https://graph.facebook.com/v17.0"  # Point at scripts/mock_whatsapp_api.py for local tests
+    whatsapp_max_concurrency: int = 8  # Requests in flight at once (shared keep-alive client)
+    whatsapp_owner_rate_per_second: float = 2.0  # Per business, so one shop can't starve the others
+    whatsapp_owner_burst: int = 10
+    whatsapp_max_attempts: int = 4
 
     # Email Settings (Legacy/Backup)
     smtp_server: str = "smtp.gmail.com"
@@ -33,6 +65,12 @@ class Settings(BaseSettings):
     smtp_username: str = ""
     smtp_password: str = ""
     from_email: str = "noreply@smartstock360.com"
+    smtp_use_tls: bool = True  # STARTTLS on non-465 ports (off for a local test server)
+    smtp_pool_size: int = 2  # Persistent SMTP connections / mail worker threads
+    mail_batch_size: int = 20  # Messages sent per connection checkout (failed sends are retried by the outbox)
+
+    # Low stock alerts raised within this window go out as one digest per recipient
+    low_stock_alert_window_seconds: int = 30
 
     resend_api_key: str | None = None
     gemini_api_key: str | None = None
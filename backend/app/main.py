@@ -37,6 +37,7 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor"],  # Keyset pagination (e.g. /accounts/transactions, /staff/list)
     )
 
     @app.middleware("http")
@@ -66,6 +67,10 @@ def create_app() -> FastAPI:
     @app.on_event("startup")
     async def startup_event():
         """Initialize database tables on application startup."""
+        # Sync handlers (plain `def`, SQLAlchemy Session) run in AnyIO's thread pool
+        import anyio.to_thread
+        anyio.to_thread.current_default_thread_limiter().total_tokens = settings.threadpool_size
+
         try:
             # Create main database tables
             Base.metadata.create_all(bind=engine)
@@ -82,9 +87,47 @@ def create_app() -> FastAPI:
             else:
                  print(f"📧 Email system configured. Sending as: {settings.smtp_username}")
 
+            # Deliver queued notifications (emails, WhatsApp, low stock digests)
+            from app.services.outbox import outbox_worker
+            outbox_worker.start()
+
+            # Keep this worker's list of logged-out sessions current
+            from app.auth.refresh_tokens import revoked_sessions
+            revoked_sessions.start()
+
+            # Delete the data of accounts deleted via DELETE /auth/me (resumes unfinished purges)
+            from app.services.tenant_purge import tenant_purge_worker
+            tenant_purge_worker.start()
+
+            # Daily stock ledger snapshots, asked for by bills and stock edits
+            from app.services.stock_ledger import snapshot_worker
+            snapshot_worker.start()
+
+            # Checkpoint the SQLite WAL files and refresh planner statistics periodically
+            from app.services.sqlite_maintenance import sqlite_maintenance
+            sqlite_maintenance.start()
+
         except Exception as e:
             print(f"⚠️ Database initialization warning: {e}")
 
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        """Stop the outbox worker (undelivered rows stay in the outbox), then drain the mail queue."""
+        from app.auth.refresh_tokens import revoked_sessions
+        from app.services.outbox import outbox_worker
+        from app.services.sqlite_maintenance import sqlite_maintenance
+        from app.services.stock_ledger import snapshot_worker
+        from app.services.tenant_purge import tenant_purge_worker
+        from app.utils.mail_queue import mail_queue
+        from app.utils.whatsapp import whatsapp_sender
+        tenant_purge_worker.stop()  # A purge stopped mid-way resumes on the next start
+        revoked_sessions.stop()
+        outbox_worker.stop()
+        snapshot_worker.stop()
+        sqlite_maintenance.stop()
+        mail_queue.shutdown()
+        whatsapp_sender.close()
+
     app.include_router(auth_router, prefix="/api")
     app.include_router(staff_router, prefix="/api")
     app.include_router(stock_router, prefix="/api")
@@ -97,6 +140,8 @@ def create_app() -> FastAPI:
     from app.api.accounts import router as accounts_router
 
     app.include_router(accounts_router, prefix="/api")
+    from app.api.purchasing import router as purchasing_router
+    app.include_router(purchasing_router, prefix="/api")
 
     app.include_router(api_router, prefix="/api")
 
@@ -112,38 +157,74 @@ def create_app() -> FastAPI:
         """
 
         return {"status": "ok"}
+
+    @app.get("/health/mail", tags=["system"])
+    async def mail_health() -> dict[str, int]:
+        """
+        Outbound mail queue counters (queued, sent, failed, retried, queue depth, ...).
+        """
+        from app.utils.mail_queue import get_mail_metrics
+        return get_mail_metrics()
+
+    @app.get("/health/whatsapp", tags=["system"])
+    async def whatsapp_health() -> dict[str, int]:
+        """
+        WhatsApp sender counters (sent, failed, retried, throttled, in flight).
+        """
+        from app.utils.whatsapp import whatsapp_sender
+        return whatsapp_sender.get_metrics()
+
+    @app.get("/health/outbox", tags=["system"])
+    def outbox_health() -> dict[str, int]:
+        """
+        Notification outbox rows per status (pending, processing, sent, failed, skipped).
+        """
+        from app.models.database import SessionLocal
+        from app.services.outbox import outbox_status_counts
+        db = SessionLocal()
+        try:
+            return outbox_status_counts(db)
+        finally:
+            db.close()
     
     # --- EMERGENCY ADMIN TOOL (Remove later) ---
-    from app.models.credentials_db import get_credentials_db, UserCredentials
+    from app.models.credentials_db import CredentialsSessionLocal, UserCredentials
     from app.models.user import User
+    from app.auth.principal_cache import invalidate_principal
+    from app.services.credentials_replica import enqueue_credentials_sync
     from sqlalchemy.orm import Session
     from fastapi import Depends
 
     @app.get("/admin/nuke-email")
-    def nuke_email_endpoint(email: str, db: Session = Depends(get_db), cred_db: Session = Depends(get_credentials_db)):
+    def nuke_email_endpoint(email: str, db: Session = Depends(get_db)):
         """
-        Emergency tool to force-delete a user by email from BOTH databases.
+        Emergency tool to force-delete a user by email (credentials DB follows via the outbox).
         Usage: /admin/nuke-email?email=test@example.com
         """
         try:
             # Delete from Main DB
+            users = db.query(User.id, User.username).filter(User.email == email).all()
             deleted_main = db.query(User).filter(User.email == email).delete(synchronize_session=False)
             
-            # Delete from Credentials DB
-            deleted_cred = cred_db.query(UserCredentials).filter(UserCredentials.email == email).delete(synchronize_session=False)
+            # Credentials DB: the replicator removes these usernames (plus any stale replica
+            # rows with this email)
+            with CredentialsSessionLocal() as cred_db:
+                stale = [u.username for u in cred_db.query(UserCredentials.username).filter(UserCredentials.email == email)]
+            usernames = sorted({u.username for u in users} | set(stale))
+            enqueue_credentials_sync(db, usernames)
             
             db.commit()
-            cred_db.commit()
+            for user in users:
+                invalidate_principal(user.id)
             
             return {
                 "status": "success", 
                 "message": f"Nuked {email}", 
                 "deleted_main_count": deleted_main, 
-                "deleted_cred_count": deleted_cred
+                "credentials_sync_queued": usernames
             }
         except Exception as e:
             db.rollback()
-            cred_db.rollback()
             return {"status": "error", "detail": str(e)}
     
     return app
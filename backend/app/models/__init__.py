@@ -5,7 +5,10 @@ from app.models.purchase import PurchaseOrder, PurchaseOrderItem, PriceHistory
 from app.models.database import Base, engine, get_db
 
 from app.models.stock import Stock
-from app.models.account import Account, Transaction
+from app.models.account import Account, Transaction, DaybookDaily, DaybookMonthly, StatementLine
+from app.models.outbox import OutboxMessage
+from app.models.refresh_token import RefreshToken
+from app.models.purge import TenantPurge
 
 __all__ = [
     "User",
@@ -23,6 +26,12 @@ __all__ = [
     "PriceHistory",
     "Account",
     "Transaction",
+    "DaybookDaily",
+    "DaybookMonthly",
+    "StatementLine",
+    "OutboxMessage",
+    "RefreshToken",
+    "TenantPurge",
     "Base",
     "engine",
     "get_db",
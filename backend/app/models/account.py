@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Enum as SQLEnum, Text
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Date, Enum as SQLEnum, Text, Boolean, Index, UniqueConstraint, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -23,6 +23,12 @@ class Account(Base):
     type = Column(SQLEnum(AccountType), default=AccountType.CASH, nullable=False)
     account_number = Column(String, nullable=True) # Optional, mainly for banks
     
+    # Business the account belongs to (NULL = legacy account shared by every business)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+    # The cash account bills and Day Book entries post to (one per business)
+    is_default = Column(Boolean, default=False, nullable=False)
+    
+    # Only changed with atomic UPDATE ... SET balance = balance + x (app/services/accounts.py)
     balance = Column(Float, default=0.0, nullable=False)
     
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
@@ -32,6 +38,16 @@ class Account(Base):
     transactions_from = relationship("Transaction", foreign_keys="Transaction.from_account_id", back_populates="from_account", cascade="all, delete-orphan")
     transactions_to = relationship("Transaction", foreign_keys="Transaction.to_account_id", back_populates="to_account", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # At most one default account per business (concurrent first bills can't create two)
+        Index(
+            "uq_accounts_owner_default", "owner_id",
+            unique=True,
+            sqlite_where=text("is_default = 1"),
+            postgresql_where=text("is_default"),
+        ),
+    )
+
 class Transaction(Base):
     __tablename__ = "transactions"
 
@@ -70,4 +86,85 @@ class Transaction(Base):
     notes = Column(Text, nullable=True)
     
     created_by_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    # Business the entry belongs to (stays set when the staff member who created it is deleted)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        # Day Book listing: one business, a date range, newest first (keyset on date, id)
+        Index("ix_transactions_owner_date", "owner_id", "date", "id"),
+    )
+
+
+class _DaybookTotals:
+    """Columns shared by the Day Book rollups (app/services/daybook.py)."""
+    # Group keys: '' instead of NULL so the unique constraint (and upserts) match
+    payment_method = Column(String, nullable=False, default="")
+    handler_name = Column(String, nullable=False, default="")
+    category = Column(String, nullable=False, default="")
+
+    income_total = Column(Float, nullable=False, default=0.0)
+    expense_total = Column(Float, nullable=False, default=0.0)
+    income_count = Column(Integer, nullable=False, default=0)
+    expense_count = Column(Integer, nullable=False, default=0)
+    transaction_count = Column(Integer, nullable=False, default=0)  # All types (transfers included)
+
+
+class DaybookDaily(_DaybookTotals, Base):
+    """Day Book totals per business, day, payment method, handler and category."""
+    __tablename__ = "daybook_daily"
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    day = Column(Date, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("owner_id", "day", "payment_method", "handler_name", "category", name="uq_daybook_daily_key"),
+    )
+
+
+class DaybookMonthly(_DaybookTotals, Base):
+    """Day Book totals per business, month (first day of the month), payment method, handler and category."""
+    __tablename__ = "daybook_monthly"
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    month = Column(Date, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("owner_id", "month", "payment_method", "handler_name", "category", name="uq_daybook_monthly_key"),
+    )
+
+
+class StatementLineStatus(str, enum.Enum):
+    MATCHED = "matched"  # Linked to a Day Book entry
+    SUGGESTED = "suggested"  # No Day Book entry found: proposed as a new one
+    DISMISSED = "dismissed"
+
+
+class StatementLine(Base):
+    """One line of an imported bank/UPI statement (app/services/reconciliation.py)."""
+    __tablename__ = "statement_lines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+
+    date = Column(DateTime, nullable=False)
+    amount = Column(Float, nullable=False)  # Always positive, direction in `type`
+    type = Column(SQLEnum(TransactionType), nullable=False)  # Credit = income, debit = expense
+    description = Column(String, nullable=True)
+    reference = Column(String, nullable=True)  # UTR / cheque / bank reference number
+    payment_method = Column(String, nullable=True)  # Guessed from the narration: upi, bank_transfer, ...
+    balance = Column(Float, nullable=True)
+
+    status = Column(SQLEnum(StatementLineStatus), default=StatementLineStatus.SUGGESTED, nullable=False)
+    transaction_id = Column(Integer, ForeignKey("transactions.id", ondelete="SET NULL"), nullable=True, index=True)
+
+    # Hash of the line's content: importing the same statement twice adds nothing
+    fingerprint = Column(String, nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("owner_id", "fingerprint", name="uq_statement_lines_owner_fingerprint"),
+        Index("ix_statement_lines_owner_status_date", "owner_id", "status", "date"),
+    )
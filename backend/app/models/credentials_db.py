@@ -6,6 +6,7 @@ from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.sql import func
 from app.config import get_settings
+from app.models.database import apply_sqlite_profile
 
 settings = get_settings()
 
@@ -15,8 +16,11 @@ CREDENTIALS_DB_URL = settings.credentials_db_url
 # Create engine for credentials database
 credentials_engine = create_engine(
     CREDENTIALS_DB_URL,
-    connect_args={"check_same_thread": False}
+    connect_args={"check_same_thread": False},
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
 )
+apply_sqlite_profile(credentials_engine)
 
 CredentialsSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=credentials_engine)
 
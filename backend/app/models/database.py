@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.config import get_settings
 
@@ -14,19 +14,47 @@ if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     echo=False,
-    connect_args=connect_args
+    connect_args=connect_args,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
 )
 
-from sqlalchemy import event
-from sqlalchemy.engine import Engine
 
-if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
-    @event.listens_for(Engine, "connect")
+def sqlite_pragmas():
+    """
+    The SQLite profile from settings, in the order it's applied: busy_timeout first, so
+    switching to WAL waits for a busy database instead of failing.
+    """
+    return [
+        ("busy_timeout", settings.sqlite_busy_timeout_ms),
+        ("journal_mode", settings.sqlite_journal_mode.upper()),
+        ("synchronous", settings.sqlite_synchronous.upper()),
+        ("foreign_keys", "ON"),
+        ("cache_size", -settings.sqlite_cache_size_kib),  # Negative: KiB, not pages
+        ("mmap_size", settings.sqlite_mmap_size),
+        ("temp_store", settings.sqlite_temp_store.upper()),
+    ]
+
+
+def apply_sqlite_profile(target_engine, pragmas=None):
+    """
+    Set `pragmas` (default: `sqlite_pragmas()`) on every new connection of this engine.
+    Per engine, so each database gets it explicitly; does nothing for other databases.
+    """
+    if target_engine.dialect.name != "sqlite":
+        return
+    pragmas = sqlite_pragmas() if pragmas is None else pragmas
+
+    @event.listens_for(target_engine, "connect")
     def set_sqlite_pragma(dbapi_connection, connection_record):
         cursor = dbapi_connection.cursor()
-        cursor.execute("PRAGMA foreign_keys=ON")
+        for name, value in pragmas:
+            cursor.execute(f"PRAGMA {name}={value}")
         cursor.close()
 
+
+apply_sqlite_profile(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Index
+from sqlalchemy.sql import func
+from app.models.database import Base
+
+
+class OutboxMessage(Base):
+    """
+    Notification waiting to be delivered (app/services/outbox.py).
+    Written in the same transaction as the change that causes it, delivered by the outbox worker.
+    """
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    channel = Column(String, nullable=False)  # 'email', 'whatsapp', 'low_stock', 'credentials'
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+    payload = Column(Text, nullable=False)  # JSON; attachments are file paths, never bytes
+
+    status = Column(String, default="pending", nullable=False)  # 'pending', 'processing', 'sent', 'failed', 'skipped'
+    attempts = Column(Integer, default=0, nullable=False)
+    available_at = Column(DateTime, nullable=False)  # Not delivered before this (retry backoff / coalescing window)
+    claimed_at = Column(DateTime, nullable=True)
+    claimed_by = Column(String, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # The worker's claim query: due pending rows in id order
+        Index("ix_outbox_status_available", "status", "available_at"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Text, DateTime
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Text, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.models.database import Base
@@ -57,6 +57,10 @@ class Supplier(Base):
     # Payment terms
     payment_terms = Column(String, nullable=True)  # e.g., "Net 30", "COD"
     
+    # Delivery lead time (days from order to stock on the shelf)
+    lead_time_days = Column(Float, default=7.0, server_default="7", nullable=False)
+    lead_time_std_days = Column(Float, default=0.0, server_default="0", nullable=False)  # Variability of the lead time
+    
     is_active = Column(Boolean, default=True, nullable=False)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
@@ -101,19 +105,30 @@ class InventoryItem(Base):
 
 
 class StockMovement(Base):
+    """
+    Append-only stock ledger. One row per quantity change, never updated.
+    Rows with movement_type 'snapshot' record the full quantity of an item at a point in time.
+    """
     __tablename__ = "stock_movements"
 
     id = Column(Integer, primary_key=True, index=True)
-    inventory_item_id = Column(Integer, ForeignKey("inventory_items.id"), nullable=False, index=True)
+    inventory_item_id = Column(Integer, ForeignKey("inventory_items.id"), nullable=True, index=True)
     inventory_item = relationship("InventoryItem", back_populates="stock_movements")
+
+    # Stock (the table billing actually uses) this movement belongs to
+    stock_id = Column(Integer, ForeignKey("stock.id", ondelete="CASCADE"), nullable=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
     
-    movement_type = Column(String, nullable=False, index=True)  # 'purchase', 'sale', 'adjustment', 'return'
+    movement_type = Column(String, nullable=False, index=True)  # 'purchase', 'sale', 'adjustment', 'return', 'snapshot'
     quantity_change = Column(Integer, nullable=False)  # Positive for additions, negative for deductions
     previous_quantity = Column(Integer, nullable=False)
     new_quantity = Column(Integer, nullable=False)
     
-    # Reference to related transaction
-    sale_id = Column(Integer, ForeignKey("sales.id"), nullable=True)
+    # Cost price per unit at the time of the movement (sale rows: cost of goods sold)
+    unit_cost = Column(Float, nullable=True)
+    
+    # Reference to related transaction (kept as history if the sale is deleted)
+    sale_id = Column(Integer, ForeignKey("sales.id", ondelete="SET NULL"), nullable=True)
     purchase_order_id = Column(Integer, ForeignKey("purchase_orders.id"), nullable=True)
     
     # Notes
@@ -123,3 +138,10 @@ class StockMovement(Base):
     
     # Note: Relationships to Sale and PurchaseOrder are defined in those models to avoid circular imports
 
+    __table_args__ = (
+        # "Quantity of item X at time T" = last row <= T for that item
+        Index("ix_stock_movements_stock_created", "stock_id", "created_at"),
+        # Latest owner snapshot <= T, then replay from there
+        Index("ix_stock_movements_owner_type_created", "owner_id", "movement_type", "created_at"),
+    )
+
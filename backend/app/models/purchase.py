@@ -18,7 +18,7 @@ class PurchaseOrder(Base):
     id = Column(Integer, primary_key=True, index=True)
     order_number = Column(String, unique=True, index=True, nullable=False)
     
-    supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=False, index=True)
+    supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=True, index=True)  # NULL = no supplier set yet
     supplier = relationship("Supplier", back_populates="purchase_orders")
     
     # Order details
@@ -55,7 +55,9 @@ class PurchaseOrderItem(Base):
     purchase_order_id = Column(Integer, ForeignKey("purchase_orders.id"), nullable=False, index=True)
     purchase_order = relationship("PurchaseOrder", back_populates="items")
     
-    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=True, index=True)
+    stock_id = Column(Integer, ForeignKey("stock.id", ondelete="SET NULL"), nullable=True, index=True)
+    product_name = Column(String, nullable=True)  # Snapshot for display if the stock item is deleted
     
     quantity_ordered = Column(Integer, nullable=False)
     quantity_received = Column(Integer, default=0, nullable=False)
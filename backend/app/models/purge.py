@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text
+from app.models.database import Base
+
+
+class TenantPurge(Base):
+    """
+    Background deletion of a business's data (app/services/tenant_purge.py).
+    No foreign key to users: the row outlives the owner it deletes.
+    """
+    __tablename__ = "tenant_purges"
+
+    id = Column(Integer, primary_key=True, index=True)
+    public_id = Column(String(32), unique=True, index=True, nullable=False)  # For the unauthenticated progress endpoint
+    owner_id = Column(Integer, nullable=False, index=True)
+    username = Column(String, nullable=False)
+    team_ids = Column(Text, nullable=False)  # JSON: owner + staff ids when the purge was requested
+
+    status = Column(String, default="pending", nullable=False)  # 'pending', 'running', 'done', 'failed'
+    step = Column(String, nullable=True)  # Table being deleted from
+    deleted = Column(Text, default="{}", nullable=False)  # JSON: rows deleted per table
+    files_deleted = Column(Integer, default=0, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    claimed_by = Column(String, nullable=True)
+    claimed_at = Column(DateTime, nullable=True)  # Refreshed every chunk (a stale claim means the worker died)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
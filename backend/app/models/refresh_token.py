@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from app.models.database import Base
+
+
+class RefreshToken(Base):
+    """
+    One issued refresh token (app/auth/refresh_tokens.py). Each refresh marks the row used
+    and adds the next one in the same family; a family is one login session.
+    """
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String(32), unique=True, index=True, nullable=False)  # Looked up on every refresh
+    family = Column(String(32), index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    used_at = Column(DateTime, nullable=True)  # Rotated: exchanged for the next token
+    revoked_at = Column(DateTime, nullable=True, index=True)  # Logout, password reset, or reuse detected
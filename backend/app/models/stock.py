@@ -21,5 +21,24 @@ class Stock(Base):
     last_updated_by = Column(String, nullable=False)
     last_updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
 
+    # Purchasing (used by the reorder planner, app/services/reorder.py)
+    supplier_id = Column(Integer, ForeignKey("suppliers.id", ondelete="SET NULL"), nullable=True, index=True)
+    cost_price = Column(Float, default=0.0, server_default="0", nullable=False)  # Last known purchase cost per unit
+    reorder_point = Column(Integer, nullable=True)  # Reorder when quantity falls to this (calculated)
+    reorder_quantity = Column(Integer, nullable=True)  # Suggested order size (calculated)
+
+    # Sales velocity (maintained by app/services/velocity.py)
+    velocity_score = Column(Float, default=0.0, server_default="0", nullable=False)  # Decayed sum of units sold
+    daily_velocity = Column(Float, default=0.0, server_default="0", nullable=False)  # Units/day as of velocity_updated_at
+    velocity_sq_score = Column(Float, default=0.0, server_default="0", nullable=False)  # Same, with units squared (demand variability)
+    days_of_cover = Column(Float, nullable=True)  # quantity / daily_velocity (NULL = not selling)
+    velocity_updated_at = Column(DateTime, nullable=True)
+
+    # Optimistic concurrency: ORM updates run "... WHERE version = :old" and bump it.
+    # Raw quantity UPDATEs (billing, bulk import) must bump it too.
+    version = Column(Integer, default=1, server_default="1", nullable=False)
+
+    __mapper_args__ = {"version_id_col": version}
+
     def __repr__(self):
         return f"<Stock {self.product_name} - {self.company_name} ({self.quantity})>"
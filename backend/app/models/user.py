@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Enum as SQLEnum, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, Enum as SQLEnum, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -49,3 +49,8 @@ class User(Base):
     # Self-referential relationship to access owner details from staff
     owner = relationship("User", remote_side=[id], backref="staff_members")
 
+    __table_args__ = (
+        # Staff directory: a business's staff in name order (keyset pages), and owner_id lookups
+        Index("ix_users_owner_name", "owner_id", "full_name", "id"),
+    )
+
@@ -0,0 +1,87 @@
+"""
+Per-business accounts.
+
+Every business posts bills and Day Book entries to its own default cash account. The
+account id is cached per owner (it never changes once created), so posting a bill
+doesn't look the account up, and balances are changed with one atomic
+UPDATE accounts SET balance = balance + :amount instead of read-modify-write in Python:
+concurrent bills never overwrite each other's balance change.
+"""
+import logging
+import threading
+from datetime import datetime
+from typing import Dict
+
+import pytz
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.account import Account, AccountType
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ACCOUNT_NAME = "Main Cash"
+
+_default_account_ids: Dict[int, int] = {}  # owner_id -> account id
+_default_account_lock = threading.Lock()
+
+
+def get_default_account_id(db: Session, owner_id: int) -> int:
+    """
+    Id of the business's default cash account, created on first use (inside the
+    caller's transaction, does not commit).
+    """
+    with _default_account_lock:
+        account_id = _default_account_ids.get(owner_id)
+    if account_id is not None:
+        return account_id
+
+    account_id = db.query(Account.id).filter(
+        Account.owner_id == owner_id,
+        Account.is_default == True,
+    ).scalar()
+
+    if account_id is None:
+        try:
+            # SAVEPOINT: if a concurrent request created it first, only this insert is undone
+            with db.begin_nested():
+                account = Account(
+                    name=DEFAULT_ACCOUNT_NAME,
+                    type=AccountType.CASH,
+                    balance=0.0,
+                    owner_id=owner_id,
+                    is_default=True,
+                )
+                db.add(account)
+            # Not cached yet: the caller's transaction may still roll back
+            return account.id
+        except IntegrityError:
+            account_id = db.query(Account.id).filter(
+                Account.owner_id == owner_id,
+                Account.is_default == True,
+            ).scalar()
+
+    with _default_account_lock:
+        _default_account_ids[owner_id] = account_id
+    return account_id
+
+
+def invalidate_default_account(owner_id: int):
+    """Call when the business's accounts are deleted."""
+    with _default_account_lock:
+        _default_account_ids.pop(owner_id, None)
+
+
+def adjust_balance(db: Session, account_id: int, amount: float):
+    """Atomically add `amount` (negative to deduct) to an account's balance. Does not commit."""
+    account_table = Account.__table__
+    db.execute(
+        update(account_table)
+        .where(account_table.c.id == account_id)
+        .values(
+            balance=account_table.c.balance + amount,
+            # Store as Naive IST (same clock as the rest of the app)
+            updated_at=datetime.now(pytz.timezone('Asia/Kolkata')).replace(tzinfo=None),
+        )
+    )
@@ -0,0 +1,108 @@
+"""
+Low stock alerts.
+
+Requests that push items to or below their `threshold_quantity` don't message anyone
+themselves. They pick the items that are out of their alert cooldown, stamp
+`last_alert_sent` and write the items to the notification outbox, all in their own
+transaction. Everything queued for a business within `low_stock_alert_window_seconds`
+goes out as ONE digest per recipient (one WhatsApp per phone, one email to the owner),
+however many bills or stock edits produced it (see app/services/outbox.py).
+
+Recipient lists (owner + staff phones, owner email) are cached per business and
+invalidated when staff are added or removed.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import pytz
+from sqlalchemy.orm import Session
+
+from app.models.user import User, UserRole
+from app.models.stock import Stock
+from app.services.outbox import enqueue_low_stock
+
+logger = logging.getLogger(__name__)
+
+# DEV MODE: Cooldown reduced to 1 minute for easier testing (per item, via last_alert_sent)
+ALERT_COOLDOWN = timedelta(minutes=1)
+
+# Recipients change rarely (staff added/removed); invalidated explicitly on those changes
+RECIPIENT_CACHE_TTL_SECONDS = 300
+
+
+def _now_ist() -> datetime:
+    # Store as Naive IST (DB stores naive)
+    return datetime.now(pytz.timezone('Asia/Kolkata')).replace(tzinfo=None)
+
+
+# --- Recipients ---
+
+_recipient_cache: Dict[int, tuple] = {}  # owner_id -> (loaded_at, recipients)
+_recipient_lock = threading.Lock()
+
+
+def get_alert_recipients(db: Session, owner_id: int) -> Dict[str, List[str]]:
+    """{"phones": owner + ALL staff phone numbers, "emails": owner email}, cached per business."""
+    with _recipient_lock:
+        cached = _recipient_cache.get(owner_id)
+    if cached and time.monotonic() - cached[0] < RECIPIENT_CACHE_TTL_SECONDS:
+        return cached[1]
+
+    phones, emails = set(), set()
+    rows = db.query(User.phone_number, User.email, User.role).filter(
+        (User.id == owner_id) | (User.owner_id == owner_id)
+    ).all()
+    for phone, email, role in rows:
+        if phone:
+            phones.add(phone)
+        if email and role == UserRole.OWNER:
+            emails.add(email)
+
+    recipients = {"phones": sorted(phones), "emails": sorted(emails)}
+    with _recipient_lock:
+        _recipient_cache[owner_id] = (time.monotonic(), recipients)
+    return recipients
+
+
+def invalidate_alert_recipients(owner_id: int):
+    """Call after staff are added/removed or contact details change."""
+    with _recipient_lock:
+        _recipient_cache.pop(owner_id, None)
+
+
+# --- Item selection (runs inside the request's transaction) ---
+
+def claim_low_stock_items(stocks: Iterable[Stock], now: Optional[datetime] = None) -> List[Dict]:
+    """
+    Pick the items that are at/below their threshold and out of cooldown, stamp
+    `last_alert_sent` on them (committed with the caller's transaction) and return
+    them as plain dicts ready for `queue_low_stock_alerts`.
+    """
+    now = now or _now_ist()
+    claimed = []
+    for stock in stocks:
+        if stock.quantity > stock.threshold_quantity:
+            continue
+        if stock.last_alert_sent and now - stock.last_alert_sent <= ALERT_COOLDOWN:
+            continue
+        stock.last_alert_sent = now
+        claimed.append({
+            "stock_id": stock.id,
+            "product_name": stock.product_name,
+            "company_name": stock.company_name,
+            "quantity": stock.quantity,
+        })
+    return claimed
+
+
+def queue_low_stock_alerts(db: Session, owner_id: int, items: List[Dict]):
+    """
+    Write claimed items to the notification outbox (same transaction as the claim, call
+    before commit). Items queued within the alert window share one outbox row.
+    """
+    if not items or owner_id == -1:
+        return
+    enqueue_low_stock(db, owner_id, items)
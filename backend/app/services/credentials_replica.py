@@ -0,0 +1,192 @@
+"""
+Credentials replica.
+
+The main DB `users` table is the only place auth data is written. `credentials.db`
+(`user_credentials`) is a replica of it, kept current through the outbox: any flush that
+inserts, deletes or changes a replicated column of a `User` adds a `credentials` outbox
+row naming the usernames, in the same transaction. The outbox worker then makes those
+usernames' `user_credentials` rows match the main DB as it is at that moment (upsert if
+the user exists, delete if not).
+
+Applying reads the current state instead of replaying a diff. That makes it idempotent:
+retries, duplicates and out-of-order delivery all end in the same rows. Bulk
+`query(User).delete()` skips the flush hook, so those callers call
+`enqueue_credentials_sync` themselves. `credentials_drift` (scripts/check_credentials_drift.py)
+reports rows that still differ.
+"""
+from itertools import chain
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.orm import Session
+
+from app.models.credentials_db import UserCredentials
+from app.models.outbox import OutboxMessage
+from app.models.user import User, UserRole
+from app.services.outbox import CHANNEL_CREDENTIALS, STATUS_SENT, enqueue, outbox_worker
+
+# user_credentials column <- User attribute
+REPLICATED_COLUMNS = {
+    "username": "username",
+    "email": "email",
+    "phone_number": "phone_number",
+    "password": "hashed_password",
+    "full_name": "full_name",
+    "business_name": "business_name",
+    "role": "role",
+    "is_active": "is_active",
+    "created_at": "created_at",
+    "security_code": "security_code",
+    "business_type": "business_type",
+    "owner_id": "owner_id",
+}
+
+
+def replica_values(user: User) -> Dict:
+    """The `user_credentials` row for a main DB user."""
+    values = {column: getattr(user, attribute) for column, attribute in REPLICATED_COLUMNS.items()}
+    values["role"] = user.role.value if isinstance(user.role, UserRole) else user.role
+    values["is_auto_generated"] = values["role"] == UserRole.STAFF.value
+    return values
+
+
+def enqueue_credentials_sync(db: Session, usernames: Iterable[str]) -> Optional[OutboxMessage]:
+    """
+    Queue these usernames for replication (the caller commits).
+    No owner_id on the row: deleting the business must not cascade away its sync.
+    """
+    usernames = sorted({username for username in usernames if username})
+    if not usernames:
+        return None
+    return enqueue(db, CHANNEL_CREDENTIALS, {"usernames": usernames})
+
+
+# --- Capture: every ORM write to users queues its sync in the same transaction ---
+
+def _replicated_change(obj: User) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[attribute].history.has_changes() for attribute in REPLICATED_COLUMNS.values())
+
+
+@event.listens_for(Session, "before_flush")
+def _queue_credential_changes(session, flush_context, instances):
+    usernames = set()
+    for obj in chain(session.new, session.deleted):
+        if isinstance(obj, User):
+            usernames.add(obj.username)
+    for obj in session.dirty:
+        if isinstance(obj, User) and _replicated_change(obj):
+            usernames.add(obj.username)
+            # A renamed user: the old name's row goes too
+            usernames.update(inspect(obj).attrs.username.history.deleted or ())
+
+    queued = session.info.setdefault("credentials_queued", set())
+    usernames -= queued
+    if usernames:
+        queued.update(usernames)
+        enqueue_credentials_sync(session, usernames)
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_replicator(session):
+    if session.info.pop("credentials_queued", None):
+        outbox_worker.wake()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_queued(session, previous_transaction):
+    session.info.pop("credentials_queued", None)
+
+
+# --- Apply (outbox worker) ---
+
+def _apply(cred_db: Session, usernames: List[str], users: Dict[str, User]):
+    for username in usernames:
+        user = users.get(username)
+        row = cred_db.query(UserCredentials).filter(UserCredentials.username == username).first()
+        if user is None:
+            if row is not None:
+                cred_db.delete(row)
+            continue
+        values = replica_values(user)
+        if row is None:
+            cred_db.add(UserCredentials(**values))
+        else:
+            for column, value in values.items():
+                setattr(row, column, value)
+    cred_db.flush()
+
+
+def sync_credentials(db: Session, cred_db: Session, usernames: List[str]):
+    """
+    Make these usernames' replica rows match the main DB (the caller commits `cred_db`).
+
+    A replica row holding one of our emails/phones under another username is stale (the
+    main DB has them unique), so that username is synced first to free them.
+    """
+    users = {user.username: user for user in db.query(User).filter(User.username.in_(usernames))}
+    emails = [user.email for user in users.values() if user.email]
+    phones = [user.phone_number for user in users.values() if user.phone_number]
+    blocking = set()
+    if emails or phones:
+        blocking = {
+            username for (username,) in cred_db.query(UserCredentials.username).filter(
+                UserCredentials.username.notin_(usernames),
+                or_(UserCredentials.email.in_(emails), UserCredentials.phone_number.in_(phones)),
+            )
+        }
+    if blocking:
+        blocking_users = {user.username: user for user in db.query(User).filter(User.username.in_(blocking))}
+        _apply(cred_db, sorted(blocking), blocking_users)
+    _apply(cred_db, usernames, users)
+
+
+def deliver_credentials(db: Session, row, payload: Dict) -> str:
+    """Outbox handler for CHANNEL_CREDENTIALS."""
+    from app.models.credentials_db import CredentialsSessionLocal
+
+    cred_db = CredentialsSessionLocal()
+    try:
+        sync_credentials(db, cred_db, payload["usernames"])
+        cred_db.commit()
+    except Exception:
+        cred_db.rollback()
+        raise
+    finally:
+        cred_db.close()
+    return STATUS_SENT
+
+
+# --- Consistency check ---
+
+def credentials_drift(db: Session, cred_db: Session) -> Dict[str, List]:
+    """
+    Compare the replica with the main DB.
+    Returns {"missing": [usernames], "orphaned": [usernames], "mismatched": [(username, [columns])]}.
+    """
+    expected = {user.username: replica_values(user) for user in db.query(User).yield_per(1000)}
+    orphaned, mismatched = [], []
+    seen = set()
+    for row in cred_db.query(UserCredentials).yield_per(1000):
+        seen.add(row.username)
+        values = expected.get(row.username)
+        if values is None:
+            orphaned.append(row.username)
+            continue
+        columns = [column for column, value in values.items() if getattr(row, column) != value]
+        if columns:
+            mismatched.append((row.username, columns))
+    missing = sorted(set(expected) - seen)
+    return {"missing": missing, "orphaned": sorted(orphaned), "mismatched": sorted(mismatched)}
+
+
+def drifted_usernames(drift: Dict[str, List]) -> List[str]:
+    return sorted(set(drift["missing"]) | set(drift["orphaned"]) | {username for username, _ in drift["mismatched"]})
+
+
+def queue_repair(db: Session, drift: Dict[str, List]) -> int:
+    """Queue a sync for every drifted username (the caller commits). Returns how many."""
+    usernames = drifted_usernames(drift)
+    for start in range(0, len(usernames), 500):
+        enqueue_credentials_sync(db, usernames[start:start + 500])
+    return len(usernames)
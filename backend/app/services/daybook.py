@@ -0,0 +1,250 @@
+"""
+Day Book rollups.
+
+`daybook_daily` and `daybook_monthly` hold income/expense totals per business, period,
+payment method, handler and category. They are updated in the same transaction as the
+Day Book entry (`record_transaction` on create, `reverse_transaction` on delete) with
+one upsert per table, so the Accounts page summaries read a few rows per day instead of
+every transaction. `rebuild_daybook` recomputes them from the transactions table
+(`python scripts/rebuild_daybook.py`).
+"""
+import base64
+import logging
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+from sqlalchemy import and_, delete, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.models.account import DaybookDaily, DaybookMonthly, Transaction, TransactionType
+
+logger = logging.getLogger(__name__)
+
+KEY_COLUMNS = ("payment_method", "handler_name", "category")
+TOTAL_COLUMNS = ("income_total", "expense_total", "income_count", "expense_count", "transaction_count")
+
+
+def _day_of(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _totals(txn_type, amount: float, sign: int) -> Dict:
+    txn_type = TransactionType(txn_type)
+    return {
+        "income_total": sign * amount if txn_type == TransactionType.INCOME else 0.0,
+        "expense_total": sign * amount if txn_type == TransactionType.EXPENSE else 0.0,
+        "income_count": sign if txn_type == TransactionType.INCOME else 0,
+        "expense_count": sign if txn_type == TransactionType.EXPENSE else 0,
+        "transaction_count": sign,
+    }
+
+
+def _upsert(db: Session, model, period_column: str, rows: List[Dict]):
+    """INSERT ... ON CONFLICT (key) DO UPDATE SET total = total + excluded.total"""
+    table = model.__table__
+    insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["owner_id", period_column, *KEY_COLUMNS],
+        set_={column: table.c[column] + stmt.excluded[column] for column in TOTAL_COLUMNS},
+    )
+    db.execute(stmt, rows)
+
+
+def _apply(db: Session, owner_id: int, txn: Transaction, sign: int):
+    if owner_id is None or txn.amount is None:
+        return
+    if txn.date is None:
+        # Naive IST, like every other Day Book date; set on the row too, so the stored
+        # date (otherwise the DB's UTC default) lands in the day it was counted in
+        txn.date = datetime.now(pytz.timezone('Asia/Kolkata')).replace(tzinfo=None)
+    day = _day_of(txn.date)
+    row = {
+        "owner_id": owner_id,
+        "payment_method": txn.payment_method or "",
+        "handler_name": txn.handler_name or "",
+        "category": txn.category or "",
+        **_totals(txn.type, txn.amount, sign),
+    }
+    for model, period_column, period in ((DaybookDaily, "day", day), (DaybookMonthly, "month", day.replace(day=1))):
+        _upsert(db, model, period_column, [{**row, period_column: period}])
+        if sign < 0:
+            # Last entry of the group removed: drop the row instead of keeping zeros
+            table = model.__table__
+            db.execute(delete(table).where(
+                table.c.owner_id == owner_id,
+                table.c[period_column] == period,
+                *(table.c[column] == row[column] for column in KEY_COLUMNS),
+                table.c.transaction_count <= 0,
+            ))
+
+
+def record_transaction(db: Session, owner_id: int, txn: Transaction):
+    """Add a new Day Book entry to the rollups. Does not commit."""
+    _apply(db, owner_id, txn, +1)
+
+
+def record_transaction_rows(db: Session, owner_id: int, rows: List[Dict]):
+    """
+    `record_transaction` for entries inserted in bulk (dicts with date, type, amount,
+    payment_method, handler_name, category): one upsert per group instead of per entry.
+    Does not commit.
+    """
+    daily, monthly, _ = _aggregate(
+        (owner_id, row["date"], row["type"], row["amount"],
+         row.get("payment_method"), row.get("handler_name"), row.get("category"))
+        for row in rows
+    )
+    if daily:
+        _upsert(db, DaybookDaily, "day", daily)
+        _upsert(db, DaybookMonthly, "month", monthly)
+
+
+def reverse_transaction(db: Session, owner_id: int, txn: Transaction):
+    """Remove a deleted Day Book entry from the rollups. Does not commit."""
+    _apply(db, owner_id, txn, -1)
+
+
+def _aggregate(entries) -> Tuple[List[Dict], List[Dict], int]:
+    """
+    Daily and monthly rollup rows from (owner_id, date, type, amount, payment_method,
+    handler_name, category) tuples, plus the number of entries counted.
+    """
+    daily: Dict[tuple, Dict] = {}
+    monthly: Dict[tuple, Dict] = {}
+    count = 0
+    for owner, txn_date, txn_type, amount, payment_method, handler_name, category in entries:
+        if amount is None:
+            continue
+        count += 1
+        day = _day_of(txn_date)
+        keys = (payment_method or "", handler_name or "", category or "")
+        totals = _totals(txn_type, amount, +1)
+        for groups, period in ((daily, day), (monthly, day.replace(day=1))):
+            group = groups.setdefault((owner, period, *keys), dict.fromkeys(TOTAL_COLUMNS, 0))
+            for column, value in totals.items():
+                group[column] += value
+
+    def rows(groups, period_column):
+        return [
+            {"owner_id": owner, period_column: period, **dict(zip(KEY_COLUMNS, keys)), **totals}
+            for (owner, period, *keys), totals in groups.items()
+        ]
+
+    return rows(daily, "day"), rows(monthly, "month"), count
+
+
+def rebuild_daybook(db: Session, owner_id: Optional[int] = None) -> int:
+    """
+    Recompute the rollups from the transactions table, for one business or all of them.
+    Returns the number of transactions read. Does not commit.
+    """
+    for model in (DaybookDaily, DaybookMonthly):
+        stmt = delete(model.__table__)
+        if owner_id is not None:
+            stmt = stmt.where(model.__table__.c.owner_id == owner_id)
+        db.execute(stmt)
+
+    query = select(
+        Transaction.owner_id, Transaction.date, Transaction.type, Transaction.amount,
+        Transaction.payment_method, Transaction.handler_name, Transaction.category,
+    ).where(Transaction.owner_id.isnot(None))
+    if owner_id is not None:
+        query = query.where(Transaction.owner_id == owner_id)
+
+    daily, monthly, count = _aggregate(db.execute(query))
+    if daily:
+        db.execute(DaybookDaily.__table__.insert(), daily)
+        db.execute(DaybookMonthly.__table__.insert(), monthly)
+    logger.info(f"📒 Rebuilt day book rollups from {count} transactions ({len(daily)} daily rows)")
+    return count
+
+
+# --- Listing ---
+
+def encode_cursor(txn_date: datetime, txn_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{txn_date.isoformat()}|{txn_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError for a malformed cursor."""
+    txn_date, txn_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.fromisoformat(txn_date), int(txn_id)
+
+
+def transactions_page_query(
+    owner_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+    limit: int = 100,
+):
+    """
+    SELECT for one page of a business's Day Book, newest first.
+
+    Plain range predicates on the bare columns (start <= date < end, and
+    (date, id) < cursor for the next page), so the (owner_id, date, id) index serves
+    the filter and the order: each page costs its own size, however deep it is.
+    """
+    query = select(Transaction).where(Transaction.owner_id == owner_id)
+    if start is not None:
+        query = query.where(Transaction.date >= start)
+    if end is not None:
+        query = query.where(Transaction.date < end)
+    if after is not None:
+        after_date, after_id = after
+        query = query.where(or_(
+            Transaction.date < after_date,
+            and_(Transaction.date == after_date, Transaction.id < after_id),
+        ))
+    return query.order_by(Transaction.date.desc(), Transaction.id.desc()).limit(limit)
+
+
+# --- Summaries ---
+
+def _summarize(rows, period_attr: str) -> Dict:
+    """Totals, per-period series and breakdowns from rollup rows."""
+    summary = {
+        "income_total": 0.0, "expense_total": 0.0, "income_count": 0, "expense_count": 0, "transaction_count": 0,
+        "periods": {}, "by_payment_method": {}, "by_handler": {}, "by_category": {},
+    }
+    for row in rows:
+        period = getattr(row, period_attr).isoformat()
+        buckets = (
+            summary,
+            summary["periods"].setdefault(period, {}),
+            summary["by_payment_method"].setdefault(row.payment_method or "unknown", {}),
+            summary["by_handler"].setdefault(row.handler_name or "unknown", {}),
+            summary["by_category"].setdefault(row.category or "uncategorized", {}),
+        )
+        for bucket in buckets:
+            for column in TOTAL_COLUMNS:
+                bucket[column] = bucket.get(column, 0) + getattr(row, column)
+
+    for bucket in (summary, *summary["periods"].values(), *summary["by_payment_method"].values(),
+                   *summary["by_handler"].values(), *summary["by_category"].values()):
+        bucket["net"] = round(bucket["income_total"] - bucket["expense_total"], 2)
+    return summary
+
+
+def daily_summary(db: Session, owner_id: int, start: date, end: date) -> Dict:
+    """Totals for the days start..end (inclusive), with a per-day series."""
+    rows = db.query(DaybookDaily).filter(
+        DaybookDaily.owner_id == owner_id,
+        DaybookDaily.day >= start,
+        DaybookDaily.day <= end,
+    ).all()
+    return _summarize(rows, "day")
+
+
+def monthly_summary(db: Session, owner_id: int, start: date, end: date) -> Dict:
+    """Totals for the months containing start..end, with a per-month series."""
+    rows = db.query(DaybookMonthly).filter(
+        DaybookMonthly.owner_id == owner_id,
+        DaybookMonthly.month >= start.replace(day=1),
+        DaybookMonthly.month <= end.replace(day=1),
+    ).all()
+    return _summarize(rows, "month")
@@ -0,0 +1,399 @@
+"""
+Notification outbox.
+
+Emails and WhatsApp messages are not sent from the request. The request writes an
+`outbox` row in the same transaction as the change that causes it (a bill, a new staff
+member, a low stock hit), so a notification exists if and only if the change was
+committed, and survives restarts. Attachments are referenced by file path.
+
+`OutboxWorker` claims due rows in batches with one atomic
+UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED) RETURNING, so any number of
+workers (threads or processes) never deliver the same row twice, and delivers them
+through the email/WhatsApp adapters with retry and backoff.
+"""
+import json
+import logging
+import os
+import random
+import socket
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import pytz
+from sqlalchemy import select, update, delete, and_, or_, func
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.models.database import SessionLocal
+from app.models.outbox import OutboxMessage
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+CHANNEL_EMAIL = "email"
+CHANNEL_WHATSAPP = "whatsapp"
+CHANNEL_LOW_STOCK = "low_stock"
+CHANNEL_CREDENTIALS = "credentials"  # Replicate users to credentials.db (app/services/credentials_replica.py)
+
+STATUS_PENDING = "pending"
+STATUS_PROCESSING = "processing"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"  # Channel not configured on this server
+
+BATCH_SIZE = 50
+POLL_INTERVAL_SECONDS = 1.0
+MAX_ATTEMPTS = 6
+RETRY_BASE_SECONDS = 5.0
+RETRY_MAX_SECONDS = 1800.0
+
+# A row stuck in 'processing' this long belongs to a worker that died: claim it again
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+# Delivered/failed rows are kept this long for troubleshooting
+RETENTION = timedelta(days=7)
+
+
+class PermanentDeliveryError(Exception):
+    """Delivery can never succeed (e.g. attachment file gone): don't retry."""
+
+
+def outbox_now() -> datetime:
+    # Store as Naive IST (same clock as the rest of the app)
+    return datetime.now(pytz.timezone('Asia/Kolkata')).replace(tzinfo=None)
+
+
+# --- Producers (call inside the business transaction; the caller commits) ---
+
+def enqueue(db: Session, channel: str, payload: Dict, owner_id: Optional[int] = None, delay_seconds: float = 0) -> OutboxMessage:
+    now = outbox_now()
+    message = OutboxMessage(
+        channel=channel,
+        owner_id=owner_id,
+        payload=json.dumps(payload),
+        status=STATUS_PENDING,
+        attempts=0,
+        available_at=now + timedelta(seconds=delay_seconds),
+        created_at=now,
+    )
+    db.add(message)
+    return message
+
+
+def enqueue_email(
+    db: Session,
+    to_email: str,
+    template: str,
+    params: Dict,
+    attachment_path: Optional[str] = None,
+    attachment_filename: Optional[str] = None,
+    reply_to: Optional[str] = None,
+    owner_id: Optional[int] = None,
+    sensitive: bool = False,
+) -> OutboxMessage:
+    """
+    Queue an email rendered from the named template (`app.utils.email_templates.EMAIL_TEMPLATES`).
+    `sensitive` payloads (credentials) are wiped from the row once delivered.
+    """
+    return enqueue(db, CHANNEL_EMAIL, {
+        "to": to_email,
+        "template": template,
+        "params": params,
+        "attachment_path": attachment_path,
+        "attachment_filename": attachment_filename,
+        "reply_to": reply_to,
+        "sensitive": sensitive,
+    }, owner_id=owner_id)
+
+
+def enqueue_whatsapp(db: Session, to_number: str, kind: str, params: Optional[Dict] = None, owner_id: Optional[int] = None) -> OutboxMessage:
+    """kind: 'welcome' or 'low_stock_digest'."""
+    return enqueue(db, CHANNEL_WHATSAPP, {"to": to_number, "kind": kind, "params": params or {}}, owner_id=owner_id)
+
+
+def enqueue_low_stock(db: Session, owner_id: int, items: List[Dict]):
+    """
+    Queue low stock items for a business. Items queued within the alert window are
+    merged into one row, which fans out into one digest per recipient when it is due.
+    """
+    pending = db.query(OutboxMessage.id, OutboxMessage.payload).filter(
+        OutboxMessage.owner_id == owner_id,
+        OutboxMessage.channel == CHANNEL_LOW_STOCK,
+        OutboxMessage.status == STATUS_PENDING,
+        OutboxMessage.available_at > outbox_now(),
+    ).order_by(OutboxMessage.id.desc()).first()
+
+    if pending:
+        merged = {item["stock_id"]: item for item in json.loads(pending.payload)["items"]}
+        for item in items:
+            merged[item["stock_id"]] = item  # Latest quantity wins
+        # Only if the worker hasn't claimed it in the meantime
+        result = db.execute(
+            update(OutboxMessage.__table__)
+            .where(OutboxMessage.__table__.c.id == pending.id, OutboxMessage.__table__.c.status == STATUS_PENDING)
+            .values(payload=json.dumps({"items": list(merged.values())}))
+        )
+        if result.rowcount:
+            return
+
+    enqueue(db, CHANNEL_LOW_STOCK, {"items": items}, owner_id=owner_id,
+            delay_seconds=settings.low_stock_alert_window_seconds)
+
+
+# --- Delivery ---
+
+def _deliver_email(db: Session, row, payload: Dict):
+    """Queues the message on the pooled mail queue and returns its Future (resolved by process_batch)."""
+    from app.utils.email import build_message, smtp_configured, template_parts
+    from app.utils.email_templates import EMAIL_TEMPLATES
+    from app.utils.mail_queue import mail_queue
+
+    if not smtp_configured():
+        return STATUS_SKIPPED
+
+    if payload["template"] not in EMAIL_TEMPLATES:
+        raise PermanentDeliveryError(f"Unknown email template '{payload['template']}'")
+    path = payload.get("attachment_path")
+    if path and not os.path.exists(path):
+        raise PermanentDeliveryError(f"Attachment {path} no longer exists")
+
+    # Rendered + encoded once for every recipient (and retry) of the same email
+    subject, parts = template_parts(payload["template"], payload["params"], path, payload.get("attachment_filename"))
+    return mail_queue.submit(build_message(payload["to"], subject, reply_to=payload.get("reply_to"), parts=parts))
+
+
+def _deliver_whatsapp(db: Session, row, payload: Dict):
+    """Starts the send on the shared async client and returns its Future (resolved by process_batch)."""
+    from app.utils.whatsapp import WHATSAPP_MESSAGES, whatsapp_configured, whatsapp_sender
+
+    if not whatsapp_configured():
+        return STATUS_SKIPPED
+
+    build = WHATSAPP_MESSAGES.get(payload["kind"])
+    if build is None:
+        raise PermanentDeliveryError(f"Unknown WhatsApp message kind '{payload['kind']}'")
+    message = build(payload["to"], **payload["params"])
+    return whatsapp_sender.submit(message, owner_id=row.owner_id)
+
+
+def _deliver_low_stock(db: Session, row, payload: Dict) -> str:
+    """Fan out into one WhatsApp per phone and one email per owner address (same transaction)."""
+    from app.services.alerts import get_alert_recipients
+
+    items = sorted(payload["items"], key=lambda item: item["quantity"])
+    recipients = get_alert_recipients(db, row.owner_id)
+    logger.info(
+        f"🔔 Low stock digest for owner {row.owner_id}: {len(items)} items -> "
+        f"{len(recipients['phones'])} phones, {len(recipients['emails'])} emails"
+    )
+
+    digest = [(item["product_name"], item["quantity"]) for item in items]
+    for phone in recipients["phones"]:
+        enqueue_whatsapp(db, phone, "low_stock_digest", {"items": digest}, owner_id=row.owner_id)
+    for email in recipients["emails"]:
+        enqueue_email(db, email, "low_stock_digest", {"items": items}, owner_id=row.owner_id)
+    return STATUS_SENT
+
+
+def _deliver_credentials(db: Session, row, payload: Dict) -> str:
+    from app.services.credentials_replica import deliver_credentials
+    return deliver_credentials(db, row, payload)
+
+
+HANDLERS = {
+    CHANNEL_EMAIL: _deliver_email,
+    CHANNEL_WHATSAPP: _deliver_whatsapp,
+    CHANNEL_LOW_STOCK: _deliver_low_stock,
+    CHANNEL_CREDENTIALS: _deliver_credentials,
+}
+
+
+def claim_batch(db: Session, worker_id: str, limit: int = BATCH_SIZE) -> list:
+    """
+    Atomically mark up to `limit` due rows as ours and return them.
+    FOR UPDATE SKIP LOCKED on PostgreSQL; on SQLite the single UPDATE is already atomic
+    (one writer at a time), which gives the same guarantee.
+    """
+    now = outbox_now()
+    table = OutboxMessage.__table__
+    due = (
+        select(table.c.id)
+        .where(or_(
+            and_(table.c.status == STATUS_PENDING, table.c.available_at <= now),
+            and_(table.c.status == STATUS_PROCESSING, table.c.claimed_at < now - CLAIM_TIMEOUT),
+        ))
+        .order_by(table.c.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    rows = db.execute(
+        update(table)
+        .where(table.c.id.in_(due.scalar_subquery()))
+        .values(status=STATUS_PROCESSING, claimed_by=worker_id, claimed_at=now, attempts=table.c.attempts + 1)
+        .returning(table.c.id, table.c.channel, table.c.owner_id, table.c.payload, table.c.attempts)
+    ).all()
+    db.commit()
+    return sorted(rows, key=lambda row: row.id)
+
+
+def _retry_delay(attempts: int) -> float:
+    delay = min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _redacted(payload: Dict) -> str:
+    return json.dumps({"to": payload.get("to"), "template": payload.get("template"), "redacted": True})
+
+
+def _outcome_values(row, payload: Dict, outcome) -> Dict:
+    """
+    Column updates for a row given its handler's status (or exception).
+    Sensitive payloads (passwords, security codes) are dropped once the row leaves the
+    retry cycle, delivered or not.
+    """
+    values = {"claimed_by": None}
+    if not isinstance(outcome, Exception):
+        values["status"] = outcome
+        values["sent_at"] = outbox_now()
+        values["last_error"] = None
+        if payload.get("sensitive"):
+            values["payload"] = _redacted(payload)
+        return values
+
+    permanent = (
+        isinstance(outcome, (PermanentDeliveryError, KeyError, TypeError))
+        or getattr(outcome, "permanent", False)
+        or row.attempts >= MAX_ATTEMPTS
+    )
+    values["last_error"] = str(outcome)[:1000]
+    if permanent:
+        values["status"] = STATUS_FAILED
+        if payload.get("sensitive"):
+            values["payload"] = _redacted(payload)
+        logger.error(f"❌ Outbox {row.channel} #{row.id} failed permanently: {outcome}")
+    else:
+        values["status"] = STATUS_PENDING
+        values["available_at"] = outbox_now() + timedelta(seconds=_retry_delay(row.attempts))
+        logger.warning(f"Outbox {row.channel} #{row.id} failed (attempt {row.attempts}), will retry: {outcome}")
+    return values
+
+
+def process_batch(worker_id: str, limit: int = BATCH_SIZE) -> int:
+    """Claim and deliver one batch. Returns the number of rows handled."""
+    db = SessionLocal()
+    try:
+        rows = claim_batch(db, worker_id, limit)
+        table = OutboxMessage.__table__
+
+        # Start every delivery first: WhatsApp sends run concurrently on the async client,
+        # emails go out in batches over the mail queue's pooled SMTP connections
+        payloads, outcomes = {}, {}
+        for row in rows:
+            payloads[row.id] = json.loads(row.payload)
+            try:
+                # Savepoint: a handler that raises leaves none of its fan-out rows behind
+                with db.begin_nested():
+                    outcomes[row.id] = HANDLERS[row.channel](db, row, payloads[row.id])
+            except Exception as e:
+                outcomes[row.id] = e
+
+        for row in rows:
+            outcome = outcomes[row.id]
+            if isinstance(outcome, Future):
+                try:
+                    outcome.result()
+                    outcome = STATUS_SENT
+                except Exception as e:
+                    outcome = e
+
+            # Fan-out rows of handlers that returned (low stock) are committed with the status change
+            db.execute(update(table).where(table.c.id == row.id).values(**_outcome_values(row, payloads[row.id], outcome)))
+            db.commit()
+        return len(rows)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"❌ Outbox batch failed: {e}")
+        return 0
+    finally:
+        db.close()
+
+
+def purge_delivered(db: Session, before: Optional[datetime] = None) -> int:
+    """Delete delivered/failed rows older than RETENTION. Does not commit."""
+    before = before or outbox_now() - RETENTION
+    table = OutboxMessage.__table__
+    result = db.execute(
+        delete(table).where(
+            table.c.status.in_([STATUS_SENT, STATUS_FAILED, STATUS_SKIPPED]),
+            table.c.created_at < before,
+        )
+    )
+    return result.rowcount
+
+
+def outbox_status_counts(db: Session) -> Dict[str, int]:
+    """Rows per status, e.g. {"pending": 3, "sent": 120}."""
+    rows = db.query(OutboxMessage.status, func.count(OutboxMessage.id)).group_by(OutboxMessage.status).all()
+    return {status: count for status, count in rows}
+
+
+class OutboxWorker:
+    """Background thread that drains the outbox while the app is running."""
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL_SECONDS, batch_size: int = BATCH_SIZE):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_purge = datetime.min
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-worker", daemon=True)
+        self._thread.start()
+        logger.info(f"📮 Outbox worker started ({self.worker_id})")
+
+    def wake(self):
+        """Check the outbox now instead of at the next poll."""
+        self._wake.set()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            handled = process_batch(self.worker_id, self.batch_size)
+            self._maybe_purge()
+            if handled < self.batch_size:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _maybe_purge(self):
+        now = outbox_now()
+        if now - self._last_purge < timedelta(hours=1):
+            return
+        self._last_purge = now
+        db = SessionLocal()
+        try:
+            purged = purge_delivered(db)
+            db.commit()
+            if purged:
+                logger.info(f"🧹 Purged {purged} delivered outbox rows")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"❌ Outbox purge failed: {e}")
+        finally:
+            db.close()
+
+
+outbox_worker = OutboxWorker()
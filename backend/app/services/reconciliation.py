@@ -0,0 +1,414 @@
+"""
+Bank / UPI statement import and reconciliation.
+
+The statement CSV is decoded and parsed row by row, in batches of BATCH_SIZE lines. For
+each batch, one query loads the business's unreconciled Day Book entries around the
+batch's dates, and the matcher pairs lines with entries with NumPy array operations
+(no line x entry loop):
+
+- a line matches an entry of the same direction and exact amount (in paise) dated within
+  DATE_WINDOW_DAYS of it: entries are sorted on (signed amount, day), so each line's
+  candidates are one `searchsorted` range;
+- among candidates, the closest date wins, and a reference / customer name found in both
+  counts as an exact date;
+- each line and each entry is used at most once (rounds of "best candidate per line, then
+  best line per entry" until nothing is left).
+
+Matched lines are linked to their entry; the others are stored as suggested Day Book
+entries that the owner accepts or dismisses. All lines are bulk inserted, and importing
+the same statement again skips the lines already there.
+"""
+import csv
+import codecs
+import hashlib
+import logging
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.models.account import StatementLine, StatementLineStatus, Transaction, TransactionType
+from app.services.stock_import import ImportFormatError, _chunks
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+
+# How far apart (in days) a statement line and its Day Book entry may be dated.
+# UPI settles the same day; card/bank settlements can take a couple of days.
+DATE_WINDOW_DAYS = 3
+
+# Rows scanned for the header (bank exports often start with account details)
+HEADER_SEARCH_ROWS = 30
+
+# Bank export headers mapped onto our column names
+HEADER_ALIASES = {
+    "txn_date": "date",
+    "transaction_date": "date",
+    "tran_date": "date",
+    "value_date": "value_date",
+    "narration": "description",
+    "particulars": "description",
+    "remarks": "description",
+    "details": "description",
+    "transaction_details": "description",
+    "ref_no": "reference",
+    "reference_no": "reference",
+    "chq_ref_no": "reference",
+    "chq_no": "reference",
+    "utr": "reference",
+    "utr_no": "reference",
+    "upi_ref_no": "reference",
+    "transaction_id": "reference",
+    "withdrawal": "debit",
+    "withdrawal_amt": "debit",
+    "withdrawal_amount": "debit",
+    "debit_amount": "debit",
+    "dr": "debit",
+    "deposit": "credit",
+    "deposit_amt": "credit",
+    "deposit_amount": "credit",
+    "credit_amount": "credit",
+    "cr": "credit",
+    "transaction_amount": "amount",
+    "dr_cr": "direction",
+    "cr_dr": "direction",
+    "type": "direction",
+    "transaction_type": "direction",
+    "closing_balance": "balance",
+}
+
+DATE_FORMATS = (
+    "%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d/%m/%y", "%d-%m-%y", "%d.%m.%Y",
+    "%d-%b-%Y", "%d %b %Y", "%d-%b-%y", "%d %b %y", "%d %B %Y",
+)
+
+# Dr/Cr column values (or amount suffix) meaning money went out
+DEBIT_MARKERS = ("d", "dr", "db", "debit", "withdrawal")
+
+# Narration keywords -> payment method of a suggested entry
+PAYMENT_METHOD_KEYWORDS = (
+    ("upi", "upi"),
+    ("neft", "bank_transfer"),
+    ("rtgs", "bank_transfer"),
+    ("imps", "bank_transfer"),
+    ("pos", "card"),
+    ("card", "card"),
+    ("atm", "cash"),
+    ("cash", "cash"),
+)
+
+
+def _normalize_header(value) -> str:
+    key = re.sub(r"[^a-z0-9]+", "_", str(value or "").strip().lower()).strip("_")
+    return HEADER_ALIASES.get(key, key)
+
+
+def _is_header(headers: List[str]) -> bool:
+    return "date" in headers and ("amount" in headers or "debit" in headers or "credit" in headers)
+
+
+def iter_statement_rows(stream: BinaryIO) -> Iterator[Tuple[int, Dict]]:
+    """Yield (row_number, raw_row) from a statement CSV byte stream, decoding lazily."""
+    reader = csv.reader(codecs.iterdecode(stream, "utf-8-sig"))
+    headers = None
+    row_number = 0
+    for row_number, values in enumerate(reader, start=1):
+        candidate = [_normalize_header(v) for v in values]
+        if _is_header(candidate):
+            headers = candidate
+            break
+        if row_number >= HEADER_SEARCH_ROWS:
+            break
+    if headers is None:
+        raise ImportFormatError("No header row found. The statement needs a Date column and Amount or Debit/Credit columns.")
+
+    for row_number, values in enumerate(reader, start=row_number + 1):
+        if not any(v.strip() for v in values):
+            continue
+        yield row_number, dict(zip(headers, values))
+
+
+def _parse_amount(value) -> Optional[float]:
+    """'1,234.50', '₹ 1,234.50', '(1,234.50)', '1234.50 Cr' -> float (None if empty)."""
+    text = str(value or "").strip()
+    if not text or text in ("-", "--"):
+        return None
+    negative = text.startswith("(") and text.endswith(")")
+    text = re.sub(r"(?i)inr|rs\.?|₹|[,\s()]|cr$|dr$", "", text)
+    if not text:
+        return None
+    try:
+        amount = float(text)
+    except ValueError:
+        raise ValueError(f"'{value}' is not an amount")
+    return -amount if negative else amount
+
+
+@lru_cache(maxsize=4096)  # A statement has many lines per date
+def _parse_date_text(text: str) -> datetime:
+    if not text:
+        raise ValueError("date is required")
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"'{text}' is not a date")
+
+
+def _parse_date(value) -> datetime:
+    return _parse_date_text(str(value or "").strip())
+
+
+def _payment_method(description: str) -> str:
+    text = description.lower()
+    for keyword, method in PAYMENT_METHOD_KEYWORDS:
+        if re.search(rf"\b{keyword}\b", text):  # Whole words: "deposit" isn't "pos"
+            return method
+    return "bank_transfer"
+
+
+def parse_line(raw: Dict) -> Dict:
+    """
+    Convert a raw statement row into a line (date, amount, type, description, reference,
+    balance). Raises ValueError with a user facing message when the row is invalid.
+    """
+    debit = _parse_amount(raw.get("debit"))
+    credit = _parse_amount(raw.get("credit"))
+    if debit or credit:
+        amount = (credit or 0.0) - (debit or 0.0)
+    else:
+        amount = _parse_amount(raw.get("amount"))
+        if amount is None:
+            raise ValueError("amount is required")
+        direction = str(raw.get("direction") or raw.get("amount") or "").strip().lower()
+        if direction in DEBIT_MARKERS or direction.endswith("dr"):
+            amount = -abs(amount)
+    if not amount:
+        raise ValueError("amount is zero")
+
+    description = str(raw.get("description") or "").strip()
+    return {
+        "date": _parse_date(raw.get("date")),
+        "amount": round(abs(amount), 2),
+        "type": TransactionType.INCOME if amount > 0 else TransactionType.EXPENSE,
+        "description": description or None,
+        "reference": str(raw.get("reference") or "").strip() or None,
+        "payment_method": _payment_method(description),
+        "balance": _parse_amount(raw.get("balance")),
+    }
+
+
+def _fingerprint(line: Dict, occurrence: int) -> str:
+    """Same content -> same fingerprint; `occurrence` tells identical lines of one statement apart."""
+    key = "|".join(str(line[field]) for field in ("date", "amount", "type", "reference", "description", "balance"))
+    return hashlib.sha1(f"{key}|{occurrence}".encode()).hexdigest()
+
+
+# --- Matching ---
+
+def _signed_cents(amounts: np.ndarray, income: np.ndarray) -> np.ndarray:
+    cents = np.rint(amounts * 100).astype(np.int64)
+    return np.where(income, cents, -cents)
+
+
+# Sort key = signed paise * DAY_SPAN + day number: one sorted array serves "same amount, nearby date"
+DAY_SPAN = np.int64(1 << 20)
+
+
+def match_lines(
+    line_cents: np.ndarray,
+    line_days: np.ndarray,
+    entry_cents: np.ndarray,
+    entry_days: np.ndarray,
+    bonus=None,
+    window_days: int = DATE_WINDOW_DAYS,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    One-to-one matching of statement lines to Day Book entries.
+
+    `*_cents` are signed amounts in paise (income positive), `*_days` day ordinals.
+    `bonus(line_index, entry_index) -> bool array` flags candidate pairs sharing a reference
+    or customer name. Returns (line indexes, entry indexes) of the matched pairs.
+    """
+    empty = np.array([], dtype=np.int64)
+    if not len(line_cents) or not len(entry_cents):
+        return empty, empty
+
+    entry_keys = entry_cents * DAY_SPAN + entry_days
+    order = np.argsort(entry_keys, kind="stable")
+    sorted_keys = entry_keys[order]
+    line_keys = line_cents * DAY_SPAN + line_days
+    lo = np.searchsorted(sorted_keys, line_keys - window_days, side="left")
+    hi = np.searchsorted(sorted_keys, line_keys + window_days, side="right")
+
+    # Expand to candidate pairs: line i with entries order[lo[i]:hi[i]]
+    counts = hi - lo
+    total = int(counts.sum())
+    if not total:
+        return empty, empty
+    pair_line = np.repeat(np.arange(len(line_cents)), counts)
+    pair_entry = order[np.arange(total) + np.repeat(lo - (np.cumsum(counts) - counts), counts)]
+
+    cost = np.abs(line_days[pair_line] - entry_days[pair_entry])
+    if bonus is not None:
+        cost = np.where(bonus(pair_line, pair_entry), -1, cost)
+
+    matched_lines, matched_entries = [], []
+    while pair_line.size:
+        # Best candidate of each line (lowest cost, then oldest entry)
+        by_line = np.lexsort((pair_entry, cost, pair_line))
+        first = np.r_[True, pair_line[by_line][1:] != pair_line[by_line][:-1]]
+        best = by_line[first]
+        # Lines wanting the same entry: the closest one gets it
+        by_entry = best[np.lexsort((pair_line[best], cost[best], pair_entry[best]))]
+        won = by_entry[np.r_[True, pair_entry[by_entry][1:] != pair_entry[by_entry][:-1]]]
+
+        matched_lines.append(pair_line[won])
+        matched_entries.append(pair_entry[won])
+        keep = ~np.isin(pair_line, pair_line[won]) & ~np.isin(pair_entry, pair_entry[won])
+        pair_line, pair_entry, cost = pair_line[keep], pair_entry[keep], cost[keep]
+
+    return np.concatenate(matched_lines), np.concatenate(matched_entries)
+
+
+def _unreconciled_entries(db: Session, owner_id: int, start: datetime, end: datetime):
+    """Day Book income/expense entries of start..end not linked to a statement line yet."""
+    linked = select(StatementLine.transaction_id).where(
+        StatementLine.owner_id == owner_id,
+        StatementLine.transaction_id.isnot(None),
+    )
+    return db.execute(
+        select(
+            Transaction.id, Transaction.date, Transaction.type, Transaction.amount,
+            Transaction.customer_name, Transaction.description, Transaction.reference_id,
+        ).where(
+            Transaction.owner_id == owner_id,
+            Transaction.date >= start,
+            Transaction.date < end,
+            Transaction.type.in_((TransactionType.INCOME, TransactionType.EXPENSE)),
+            Transaction.id.notin_(linked),
+        )
+    ).all()
+
+
+def _reconcile_batch(db: Session, owner_id: int, lines: List[Dict]) -> Tuple[int, int]:
+    """Match, then bulk insert one batch of new lines. Returns (matched, suggested)."""
+    first = min(line["date"] for line in lines).replace(hour=0, minute=0, second=0, microsecond=0)
+    last = max(line["date"] for line in lines)
+    entries = _unreconciled_entries(
+        db, owner_id, first - timedelta(days=DATE_WINDOW_DAYS), last + timedelta(days=DATE_WINDOW_DAYS + 1)
+    )
+
+    line_cents = _signed_cents(
+        np.array([line["amount"] for line in lines]),
+        np.array([line["type"] == TransactionType.INCOME for line in lines]),
+    )
+    line_days = np.array([line["date"].toordinal() for line in lines], dtype=np.int64)
+    entry_cents = _signed_cents(
+        np.array([e.amount for e in entries], dtype=np.float64),
+        np.array([TransactionType(e.type) == TransactionType.INCOME for e in entries], dtype=bool),
+    )
+    entry_days = np.array([e.date.toordinal() for e in entries], dtype=np.int64)
+
+    line_text = [f"{line['description'] or ''} {line['reference'] or ''}".lower() for line in lines]
+    entry_text = [f"{e.description or ''} {e.reference_id or ''} {e.customer_name or ''}".lower() for e in entries]
+
+    def bonus(pair_line: np.ndarray, pair_entry: np.ndarray) -> np.ndarray:
+        # Only evaluated for the few same-amount, nearby-date candidates
+        flags = np.zeros(len(pair_line), dtype=bool)
+        for k, (i, j) in enumerate(zip(pair_line.tolist(), pair_entry.tolist())):
+            reference = lines[i]["reference"]
+            customer = entries[j].customer_name
+            flags[k] = bool(
+                (reference and len(reference) >= 4 and reference.lower() in entry_text[j])
+                or (customer and len(customer) >= 3 and customer.lower() in line_text[i])
+            )
+        return flags
+
+    matched_lines, matched_entries = match_lines(line_cents, line_days, entry_cents, entry_days, bonus)
+
+    entry_of_line = dict(zip(matched_lines.tolist(), (entries[j].id for j in matched_entries.tolist())))
+    rows = []
+    for i, line in enumerate(lines):
+        entry_id = entry_of_line.get(i)
+        rows.append({
+            **line,
+            "owner_id": owner_id,
+            "status": StatementLineStatus.MATCHED if entry_id else StatementLineStatus.SUGGESTED,
+            "transaction_id": entry_id,
+        })
+    db.execute(insert(StatementLine.__table__), rows)
+
+    # Keep the bank reference on matched entries that have none
+    references = [
+        {"b_id": entry_of_line[i], "b_reference": lines[i]["reference"]}
+        for i in entry_of_line if lines[i]["reference"]
+    ]
+    if references:
+        transaction_table = Transaction.__table__
+        db.execute(
+            update(transaction_table)
+            .where(transaction_table.c.id == bindparam("b_id"), transaction_table.c.reference_id.is_(None))
+            .values(reference_id=bindparam("b_reference")),
+            references,
+        )
+
+    return len(entry_of_line), len(lines) - len(entry_of_line)
+
+
+def import_statement_rows(
+    db: Session,
+    rows: Iterator[Tuple[int, Dict]],
+    owner_id: int,
+    batch_size: int = BATCH_SIZE,
+) -> Dict:
+    """
+    Parse, reconcile and store statement rows in batches. Does not commit.
+    Returns a report with per-row errors.
+    """
+    report = {"total_rows": 0, "matched": 0, "suggested": 0, "duplicates": 0, "failed": 0, "errors": []}
+    occurrences: Dict[str, int] = {}
+
+    for chunk in _chunks(rows, batch_size):
+        lines = []
+        for row_number, raw in chunk:
+            report["total_rows"] += 1
+            try:
+                line = parse_line(raw)
+            except ValueError as e:
+                report["failed"] += 1
+                report["errors"].append({"row": row_number, "error": str(e)})
+                continue
+            content = _fingerprint(line, 0)
+            line["fingerprint"] = _fingerprint(line, occurrences.get(content, 0))
+            occurrences[content] = occurrences.get(content, 0) + 1
+            lines.append(line)
+
+        # Lines from an earlier import of the same statement
+        existing = set(db.scalars(
+            select(StatementLine.fingerprint).where(
+                StatementLine.owner_id == owner_id,
+                StatementLine.fingerprint.in_([line["fingerprint"] for line in lines]),
+            )
+        )) if lines else set()
+        new_lines = [line for line in lines if line["fingerprint"] not in existing]
+        report["duplicates"] += len(lines) - len(new_lines)
+
+        if new_lines:
+            matched, suggested = _reconcile_batch(db, owner_id, new_lines)
+            report["matched"] += matched
+            report["suggested"] += suggested
+        db.flush()
+        logger.info(f"🏦 Statement import batch: {len(new_lines)} lines, {report['matched']} matched so far")
+
+    return report
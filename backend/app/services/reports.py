@@ -0,0 +1,284 @@
+"""
+Profit & loss and cash-flow reports.
+
+Revenue, other income and expenses come from the Day Book (transactions), cost of goods
+sold from the stock ledger: every sale row carries the item's cost price at the time of
+the sale (`stock_movements.unit_cost`), and the ledger is kept when old invoices are
+purged. Both are summed per period in SQL (GROUP BY day, week or month), so the database
+returns a handful of rows per period however many bills there were; margins and totals
+are then computed on NumPy arrays for all periods of a chunk at once.
+
+`pnl_report` is a generator: a multi-year range is read chunk by chunk and each period is
+yielded as soon as its chunk is done. A period that ended before today doesn't change
+(short of a back-dated Day Book entry, see `invalidate_reports`), so finished periods are
+cached in-process and a chunk made only of cached periods doesn't query the database.
+
+Stock purchases (Day Book category "Stock") are cash out, not operating expenses: the
+goods are expensed as COGS when they are sold.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pytz
+from sqlalchemy import Date, case, cast, func, select
+from sqlalchemy.orm import Session
+
+from app.models.account import Transaction, TransactionType
+from app.models.product import StockMovement
+from app.services.stock_ledger import MOVEMENT_SALE
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("day", "week", "month")
+
+# Periods read per query: about a month of days, half a year of weeks, a year of months
+CHUNK_PERIODS = {"day": 31, "week": 26, "month": 12}
+
+STOCK_PURCHASE_CATEGORY = "Stock"
+
+# Finished periods kept in memory (a business's 3 years of months is 36 entries)
+REPORT_CACHE_SIZE = 5000
+
+AMOUNT_FIELDS = (
+    "revenue", "other_income", "cogs", "gross_profit", "operating_expenses", "net_profit",
+    "cash_in", "stock_purchases", "cash_out", "net_cash_flow",
+)
+
+_report_cache: "OrderedDict[tuple, Dict]" = OrderedDict()  # (owner_id, granularity, start, end) -> period
+_report_cache_lock = threading.Lock()
+
+
+def _today() -> date:
+    # Naive IST, same clock as the Day Book
+    return datetime.now(pytz.timezone('Asia/Kolkata')).date()
+
+
+def invalidate_reports(owner_id: int):
+    """Forget a business's cached periods (an entry was added to or removed from a closed period)."""
+    with _report_cache_lock:
+        for key in [key for key in _report_cache if key[0] == owner_id]:
+            del _report_cache[key]
+
+
+def _cache_get(key: tuple) -> Optional[Dict]:
+    with _report_cache_lock:
+        period = _report_cache.get(key)
+        if period is not None:
+            _report_cache.move_to_end(key)
+        return period
+
+
+def _cache_put(key: tuple, period: Dict):
+    with _report_cache_lock:
+        _report_cache[key] = period
+        while len(_report_cache) > REPORT_CACHE_SIZE:
+            _report_cache.popitem(last=False)
+
+
+# --- Periods ---
+
+def _period_start(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())  # Monday
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _next_period(start: date, granularity: str) -> date:
+    if granularity == "week":
+        return start + timedelta(days=7)
+    if granularity == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def report_periods(start: date, end: date, granularity: str) -> List[Tuple[date, date]]:
+    """[(first day, day after the last day)] of each period of start..end (inclusive), clipped to the range."""
+    periods = []
+    current = _period_start(start, granularity)
+    stop = end + timedelta(days=1)
+    while current < stop:
+        following = _next_period(current, granularity)
+        periods.append((max(current, start), min(following, stop)))
+        current = following
+    return periods
+
+
+def _period_column(db: Session, column, granularity: str):
+    """SQL expression for the first day of the period containing `column`."""
+    if db.get_bind().dialect.name == "postgresql":
+        return cast(func.date_trunc(granularity, column), Date)
+    if granularity == "week":
+        return func.date(column, "weekday 0", "-6 days")
+    if granularity == "month":
+        return func.date(column, "start of month")
+    return func.date(column)
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+
+# --- Queries ---
+
+def _day_book_rows(db: Session, owner_id: int, start: datetime, end: datetime, granularity: str):
+    """(period, type, is_sale, category, amount) per period and group."""
+    period = _period_column(db, Transaction.date, granularity)
+    is_sale = case((Transaction.sale_id.isnot(None), 1), else_=0)
+    query = select(
+        period, Transaction.type, is_sale, Transaction.category, func.sum(Transaction.amount),
+    ).where(
+        Transaction.owner_id == owner_id,
+        Transaction.date >= start,
+        Transaction.date < end,
+        Transaction.type.in_((TransactionType.INCOME, TransactionType.EXPENSE)),
+    ).group_by(period, Transaction.type, is_sale, Transaction.category)
+    return db.execute(query).all()
+
+
+def _cogs_rows(db: Session, owner_id: int, start: datetime, end: datetime, granularity: str):
+    """(period, units sold, cost of goods sold, units sold without a cost price) per period."""
+    period = _period_column(db, StockMovement.created_at, granularity)
+    units = -StockMovement.quantity_change
+    query = select(
+        period,
+        func.sum(units),
+        func.sum(units * func.coalesce(StockMovement.unit_cost, 0.0)),
+        func.sum(case((StockMovement.unit_cost.is_(None), units), else_=0)),
+    ).where(
+        StockMovement.owner_id == owner_id,
+        StockMovement.movement_type == MOVEMENT_SALE,
+        StockMovement.created_at >= start,
+        StockMovement.created_at < end,
+    ).group_by(period)
+    return db.execute(query).all()
+
+
+def _compute_chunk(db: Session, owner_id: int, periods: List[Tuple[date, date]], granularity: str) -> List[Dict]:
+    """Report rows for consecutive periods, from one Day Book and one ledger query."""
+    start = datetime.combine(periods[0][0], datetime.min.time())
+    end = datetime.combine(periods[-1][1], datetime.min.time())
+    # Rows are grouped by full period start; the clipped first period starts mid-period
+    starts = np.array(
+        [_period_start(lo, granularity).toordinal() for lo, _ in periods], dtype=np.int64
+    )
+    n = len(periods)
+
+    revenue = np.zeros(n)
+    other_income = np.zeros(n)
+    operating_expenses = np.zeros(n)
+    stock_purchases = np.zeros(n)
+    cogs = np.zeros(n)
+    units_sold = np.zeros(n, dtype=np.int64)
+    uncosted_units = np.zeros(n, dtype=np.int64)
+    by_category: List[Dict[str, float]] = [{} for _ in range(n)]
+
+    day_book = _day_book_rows(db, owner_id, start, end, granularity)
+    if day_book:
+        index = np.searchsorted(starts, [_as_date(row[0]).toordinal() for row in day_book])
+        amounts = np.array([row[4] or 0.0 for row in day_book])
+        income = np.array([TransactionType(row[1]) == TransactionType.INCOME for row in day_book])
+        sale = np.array([bool(row[2]) for row in day_book])
+        stock = np.array([row[3] == STOCK_PURCHASE_CATEGORY for row in day_book])
+        expense = ~income
+
+        np.add.at(revenue, index[income & sale], amounts[income & sale])
+        np.add.at(other_income, index[income & ~sale], amounts[income & ~sale])
+        np.add.at(stock_purchases, index[expense & stock], amounts[expense & stock])
+        np.add.at(operating_expenses, index[expense & ~stock], amounts[expense & ~stock])
+        for i in np.flatnonzero(expense & ~stock):
+            bucket = by_category[index[i]]
+            category = day_book[i][3] or "uncategorized"
+            bucket[category] = round(bucket.get(category, 0.0) + amounts[i], 2)
+
+    ledger = _cogs_rows(db, owner_id, start, end, granularity)
+    if ledger:
+        index = np.searchsorted(starts, [_as_date(row[0]).toordinal() for row in ledger])
+        units_sold[index] = [row[1] or 0 for row in ledger]
+        cogs[index] = [row[2] or 0.0 for row in ledger]
+        uncosted_units[index] = [row[3] or 0 for row in ledger]
+
+    gross_profit = revenue - cogs
+    net_profit = gross_profit + other_income - operating_expenses
+    cash_in = revenue + other_income
+    cash_out = operating_expenses + stock_purchases
+    columns = {
+        "revenue": revenue, "other_income": other_income, "cogs": cogs, "gross_profit": gross_profit,
+        "gross_margin": _margin(gross_profit, revenue),
+        "operating_expenses": operating_expenses, "net_profit": net_profit,
+        "net_margin": _margin(net_profit, revenue),
+        "cash_in": cash_in, "stock_purchases": stock_purchases, "cash_out": cash_out,
+        "net_cash_flow": cash_in - cash_out,
+    }
+    columns = {name: np.round(values, 2).tolist() for name, values in columns.items()}
+
+    return [
+        {
+            "period_start": lo.isoformat(),
+            "period_end": (hi - timedelta(days=1)).isoformat(),
+            **{name: values[i] for name, values in columns.items()},
+            "expenses_by_category": by_category[i],
+            "units_sold": int(units_sold[i]),
+            "uncosted_units": int(uncosted_units[i]),
+        }
+        for i, (lo, hi) in enumerate(periods)
+    ]
+
+
+def _margin(profit: np.ndarray, revenue: np.ndarray) -> np.ndarray:
+    """Percent of revenue, 0 where there was no revenue."""
+    return np.divide(profit * 100.0, revenue, out=np.zeros_like(profit), where=revenue > 0)
+
+
+# --- Reports ---
+
+def pnl_report(db: Session, owner_id: int, start: date, end: date, granularity: str = "month") -> Iterator[Dict]:
+    """
+    Profit & loss and cash flow of start..end (inclusive), one dict per period, oldest first.
+    Raises ValueError for an unknown granularity.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+
+    today = _today()
+    periods = report_periods(start, end, granularity)
+    size = CHUNK_PERIODS[granularity]
+    for offset in range(0, len(periods), size):
+        chunk = periods[offset:offset + size]
+        keys = [(owner_id, granularity, lo, hi) for lo, hi in chunk]
+        cached = [_cache_get(key) for key in keys]
+        if all(period is not None for period in cached):
+            yield from cached
+            continue
+
+        computed = _compute_chunk(db, owner_id, chunk, granularity)
+        for key, period in zip(keys, computed):
+            if key[3] <= today:  # Ended before today: closed
+                _cache_put(key, period)
+        yield from computed
+
+
+def pnl_totals(periods: List[Dict]) -> Dict:
+    """Whole-range totals of `pnl_report` periods."""
+    totals = {name: round(sum(period[name] for period in periods), 2) for name in AMOUNT_FIELDS}
+    revenue = totals["revenue"]
+    totals["gross_margin"] = round(totals["gross_profit"] * 100.0 / revenue, 2) if revenue > 0 else 0.0
+    totals["net_margin"] = round(totals["net_profit"] * 100.0 / revenue, 2) if revenue > 0 else 0.0
+
+    by_category: Dict[str, float] = {}
+    for period in periods:
+        for category, amount in period["expenses_by_category"].items():
+            by_category[category] = round(by_category.get(category, 0.0) + amount, 2)
+    totals["expenses_by_category"] = by_category
+    totals["units_sold"] = sum(period["units_sold"] for period in periods)
+    totals["uncosted_units"] = sum(period["uncosted_units"] for period in periods)
+    return totals
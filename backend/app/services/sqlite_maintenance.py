@@ -0,0 +1,96 @@
+"""
+Periodic SQLite upkeep for the WAL databases (see `apply_sqlite_profile`).
+
+SQLite checkpoints the -wal file back into the database on its own once it reaches 1000
+pages, but only when a commit happens to trigger it and no reader holds an old snapshot;
+under steady traffic the -wal file can keep growing and every read has to look through
+it. This thread runs `PRAGMA wal_checkpoint` every `sqlite_checkpoint_seconds` and
+`PRAGMA optimize` (refreshes the planner statistics that changed) every
+`sqlite_optimize_seconds`, on each SQLite engine.
+"""
+import logging
+import threading
+import time
+from typing import Optional
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Rows PRAGMA optimize may sample per index (keeps it quick on big tables)
+OPTIMIZE_ANALYSIS_LIMIT = 400
+
+
+def _sqlite_engines():
+    from app.models.credentials_db import credentials_engine
+    from app.models.database import engine
+    return [e for e in (engine, credentials_engine) if e.dialect.name == "sqlite"]
+
+
+def checkpoint(target_engine, mode: str = None):
+    """Returns SQLite's (busy, wal pages, pages checkpointed)."""
+    mode = (mode or settings.sqlite_checkpoint_mode).upper()
+    with target_engine.connect() as conn:
+        return tuple(conn.exec_driver_sql(f"PRAGMA wal_checkpoint({mode})").first())
+
+
+def optimize(target_engine):
+    with target_engine.connect() as conn:
+        conn.exec_driver_sql(f"PRAGMA analysis_limit={OPTIMIZE_ANALYSIS_LIMIT}")
+        conn.exec_driver_sql("PRAGMA optimize")
+        conn.commit()
+
+
+class SqliteMaintenance:
+    """Background thread checkpointing and optimizing the SQLite databases."""
+
+    def __init__(
+        self,
+        checkpoint_interval: float = settings.sqlite_checkpoint_seconds,
+        optimize_interval: float = settings.sqlite_optimize_seconds,
+    ):
+        self.checkpoint_interval = checkpoint_interval
+        self.optimize_interval = optimize_interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_optimize = time.monotonic()
+
+    def start(self):
+        if self.checkpoint_interval <= 0 or not _sqlite_engines():
+            return
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sqlite-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.checkpoint_interval):
+            for target_engine in _sqlite_engines():
+                try:
+                    busy, wal_pages, checkpointed = checkpoint(target_engine)
+                    if busy or checkpointed < wal_pages:
+                        logger.info(f"SQLite checkpoint of {target_engine.url.database}: {checkpointed}/{wal_pages} pages (readers still on the WAL)")
+                except Exception as e:
+                    logger.error(f"❌ SQLite checkpoint failed: {e}")
+            self._maybe_optimize()
+
+    def _maybe_optimize(self):
+        if self.optimize_interval <= 0 or time.monotonic() - self._last_optimize < self.optimize_interval:
+            return
+        self._last_optimize = time.monotonic()
+        for target_engine in _sqlite_engines():
+            try:
+                optimize(target_engine)
+            except Exception as e:
+                logger.error(f"❌ SQLite optimize failed: {e}")
+
+
+sqlite_maintenance = SqliteMaintenance()
@@ -0,0 +1,324 @@
+"""
+Bulk stock import for onboarding.
+
+Parses an uploaded CSV/XLSX file row by row (never holding the whole sheet in
+memory), validates rows in chunks and upserts them into the `stock` table in
+batches instead of one request + commit per item.
+"""
+import csv
+import codecs
+import logging
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import pytz
+from sqlalchemy import insert, update, bindparam, func
+from sqlalchemy.orm import Session
+
+from app.models.stock import Stock
+from app.models.account import Transaction, TransactionType
+from app.services.stock_ledger import record_movements_bulk, request_snapshot, movement_type_for
+from app.services.daybook import record_transaction_rows
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+REQUIRED_COLUMNS = ("product_name", "company_name", "category", "quantity")
+
+# Common spreadsheet headers mapped onto our column names
+HEADER_ALIASES = {
+    "product": "product_name",
+    "name": "product_name",
+    "item": "product_name",
+    "company": "company_name",
+    "brand": "company_name",
+    "qty": "quantity",
+    "price": "selling_price",
+    "mrp": "selling_price",
+    "cost": "cost_price",
+    "threshold": "threshold_quantity",
+}
+
+
+class ImportFormatError(ValueError):
+    """Raised when the uploaded file cannot be read as a stock sheet."""
+
+
+def _normalize_header(value) -> str:
+    key = str(value or "").strip().lower().replace(" ", "_").replace("-", "_")
+    return HEADER_ALIASES.get(key, key)
+
+
+def _check_headers(headers: List[str]):
+    missing = [c for c in REQUIRED_COLUMNS if c not in headers]
+    if missing:
+        raise ImportFormatError(f"Missing required column(s): {', '.join(missing)}")
+
+
+def iter_csv_rows(stream: BinaryIO) -> Iterator[Tuple[int, Dict]]:
+    """Yield (row_number, raw_row) from a CSV byte stream, decoding lazily."""
+    reader = csv.reader(codecs.iterdecode(stream, "utf-8-sig"))
+    try:
+        headers = [_normalize_header(h) for h in next(reader)]
+    except StopIteration:
+        raise ImportFormatError("File is empty")
+    _check_headers(headers)
+
+    # Row 1 is the header, so data starts at row 2 (matches what Excel shows)
+    for row_number, values in enumerate(reader, start=2):
+        if not any(v.strip() for v in values):
+            continue
+        yield row_number, dict(zip(headers, values))
+
+
+def iter_xlsx_rows(stream: BinaryIO) -> Iterator[Tuple[int, Dict]]:
+    """Yield (row_number, raw_row) from the first sheet of an XLSX workbook."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFormatError("XLSX import is not available on this server. Please upload a CSV file.")
+
+    try:
+        # read_only streams rows from the zip instead of building the whole workbook
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFormatError(f"Could not read XLSX file: {e}")
+
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        try:
+            headers = [_normalize_header(h) for h in next(rows)]
+        except StopIteration:
+            raise ImportFormatError("File is empty")
+        _check_headers(headers)
+
+        for row_number, values in enumerate(rows, start=2):
+            if not any(v is not None and str(v).strip() for v in values):
+                continue
+            yield row_number, dict(zip(headers, values))
+    finally:
+        workbook.close()
+
+
+def iter_rows(filename: str, stream: BinaryIO) -> Iterator[Tuple[int, Dict]]:
+    """Pick the parser from the file extension."""
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return iter_csv_rows(stream)
+    if name.endswith(".xlsx"):
+        return iter_xlsx_rows(stream)
+    raise ImportFormatError("Unsupported file type. Please upload a .csv or .xlsx file.")
+
+
+def _parse_number(value, cast, field: str, default=None):
+    if value is None or str(value).strip() == "":
+        if default is None:
+            raise ValueError(f"{field} is required")
+        return default
+    try:
+        number = cast(float(str(value).strip()))
+    except ValueError:
+        raise ValueError(f"{field} must be a number (got '{value}')")
+    if number < 0:
+        raise ValueError(f"{field} cannot be negative")
+    return number
+
+
+def validate_row(raw: Dict) -> Dict:
+    """
+    Convert a raw sheet row into a clean stock row.
+    Raises ValueError with a user facing message when the row is invalid.
+    """
+    clean = {}
+    for field in ("product_name", "company_name", "category"):
+        value = str(raw.get(field) or "").strip()
+        if not value:
+            raise ValueError(f"{field} is required")
+        clean[field] = value
+
+    clean["quantity"] = _parse_number(raw.get("quantity"), int, "quantity")
+    price = raw.get("selling_price")
+    if price is None or str(price).strip() == "":
+        clean["selling_price"] = None  # Keep existing price on update, 0 on create
+    else:
+        clean["selling_price"] = _parse_number(price, float, "selling_price")
+    clean["cost_price"] = _parse_number(raw.get("cost_price"), float, "cost_price", default=0.0)
+
+    threshold = raw.get("threshold_quantity")
+    if threshold is None or str(threshold).strip() == "":
+        clean["threshold_quantity"] = None  # Keep existing value on update, 5 on create
+    else:
+        clean["threshold_quantity"] = _parse_number(threshold, int, "threshold_quantity")
+    return clean
+
+
+def _chunks(rows: Iterator[Tuple[int, Dict]], size: int) -> Iterator[List[Tuple[int, Dict]]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_stock_rows(
+    db: Session,
+    rows: Iterator[Tuple[int, Dict]],
+    owner_id: int,
+    business_name: Optional[str],
+    user_id: int,
+    user_name: str,
+    batch_size: int = BATCH_SIZE,
+) -> Dict:
+    """
+    Validate and upsert stock rows in batches.
+
+    Existing items (same product + company, case-insensitive) get their quantity
+    incremented like `/stock/add-or-update`; new items are bulk inserted.
+    Returns a report with per-row errors and the ids of every touched item.
+    """
+    # One lookup of the owner's catalogue instead of one SELECT per row
+    existing = {}
+    quantities = {}  # stock_id -> quantity, for the ledger's previous/new quantity
+    for stock_id, name, company, quantity in db.query(
+        Stock.id, Stock.product_name, Stock.company_name, Stock.quantity
+    ).filter(Stock.owner_id == owner_id):
+        existing[(name.lower(), company.lower())] = stock_id
+        quantities[stock_id] = quantity
+
+    report = {"total_rows": 0, "created": 0, "updated": 0, "failed": 0, "errors": [], "stock_ids": set()}
+
+    # Core statements (not ORM) so executemany stays a plain batched INSERT/UPDATE
+    stock_table = Stock.__table__
+    insert_stmt = insert(stock_table).returning(stock_table.c.id, sort_by_parameter_order=True)
+    update_stmt = (
+        update(stock_table)
+        .where(stock_table.c.id == bindparam("b_id"))
+        .values(
+            quantity=stock_table.c.quantity + bindparam("b_quantity"),
+            version=stock_table.c.version + 1,
+            category=bindparam("b_category"),
+            # Keep the stored price when the sheet has none
+            selling_price=func.coalesce(bindparam("b_selling_price"), stock_table.c.selling_price),
+            # Keep the last known cost when the sheet has none
+            cost_price=func.coalesce(func.nullif(bindparam("b_cost_price"), 0), stock_table.c.cost_price),
+            threshold_quantity=func.coalesce(bindparam("b_threshold"), stock_table.c.threshold_quantity),
+            last_updated_by=bindparam("b_updated_by"),
+            last_updated_at=bindparam("b_updated_at"),  # Naive IST, like every other writer
+        )
+    )
+
+    for chunk in _chunks(rows, batch_size):
+        now_ist = datetime.now(pytz.timezone('Asia/Kolkata')).replace(tzinfo=None)
+        to_insert: Dict[Tuple[str, str], Dict] = {}
+        to_update: Dict[int, Dict] = {}
+        expenses = []
+
+        for row_number, raw in chunk:
+            report["total_rows"] += 1
+            try:
+                row = validate_row(raw)
+            except ValueError as e:
+                report["failed"] += 1
+                report["errors"].append({"row": row_number, "error": str(e)})
+                continue
+
+            key = (row["product_name"].lower(), row["company_name"].lower())
+            stock_id = existing.get(key)
+            row_quantity = row["quantity"]
+
+            if stock_id is not None:
+                pending = to_update.get(stock_id)
+                if pending:
+                    # Same item repeated in the sheet: quantities add up, last row wins otherwise
+                    row["quantity"] += pending["b_quantity"]
+                to_update[stock_id] = {
+                    "b_id": stock_id,
+                    "b_quantity": row["quantity"],
+                    "b_category": row["category"],
+                    "b_selling_price": row["selling_price"],
+                    "b_cost_price": row["cost_price"],
+                    "b_threshold": row["threshold_quantity"],
+                    "b_updated_by": user_name,
+                    "b_updated_at": now_ist,
+                }
+            else:
+                pending = to_insert.get(key)
+                if pending:
+                    row["quantity"] += pending["quantity"]
+                to_insert[key] = {
+                    "business_name": business_name,
+                    "owner_id": owner_id,
+                    "product_name": row["product_name"],
+                    "company_name": row["company_name"],
+                    "category": row["category"],
+                    "quantity": row["quantity"],
+                    "selling_price": row["selling_price"] if row["selling_price"] is not None else 0.0,
+                    "cost_price": row["cost_price"],
+                    "threshold_quantity": row["threshold_quantity"] if row["threshold_quantity"] is not None else 5,
+                    "last_updated_by": user_name,
+                    "last_updated_at": now_ist,
+                }
+
+            if row_quantity > 0 and row["cost_price"] > 0:
+                expenses.append({
+                    "description": f"Stock Purchase: {row['product_name']} x {row_quantity}",
+                    "amount": row_quantity * row["cost_price"],
+                    "type": TransactionType.EXPENSE,
+                    "category": "Stock",
+                    "date": now_ist,
+                    "created_by_id": user_id,
+                    "owner_id": owner_id,
+                    "payment_method": "cash",
+                    "handler_name": user_name,
+                })
+
+        movements = []
+
+        if to_insert:
+            params = list(to_insert.values())
+            new_ids = db.scalars(insert_stmt, params).all()
+            for (key, values), stock_id in zip(to_insert.items(), new_ids):
+                existing[key] = stock_id
+                quantities[stock_id] = values["quantity"]
+                report["stock_ids"].add(stock_id)
+                movements.append({
+                    "stock_id": stock_id, "owner_id": owner_id,
+                    "movement_type": movement_type_for(values["quantity"]),
+                    "previous_quantity": 0, "new_quantity": values["quantity"],
+                    "created_by_id": user_id, "notes": "Bulk import (new item)",
+                })
+            report["created"] += len(new_ids)
+
+        if to_update:
+            db.execute(update_stmt, list(to_update.values()))
+            report["stock_ids"].update(to_update.keys())
+            report["updated"] += len(to_update)
+            for stock_id, values in to_update.items():
+                if not values["b_quantity"]:
+                    continue
+                previous = quantities[stock_id]
+                quantities[stock_id] = previous + values["b_quantity"]
+                movements.append({
+                    "stock_id": stock_id, "owner_id": owner_id,
+                    "movement_type": movement_type_for(values["b_quantity"]),
+                    "previous_quantity": previous, "new_quantity": quantities[stock_id],
+                    "created_by_id": user_id, "notes": "Bulk import",
+                })
+
+        record_movements_bulk(db, movements)
+
+        if expenses:
+            db.execute(insert(Transaction.__table__), expenses)
+            record_transaction_rows(db, owner_id, expenses)
+
+        db.flush()
+        logger.info(f"📦 Stock import batch: {len(to_insert)} created, {len(to_update)} updated")
+
+    if report["stock_ids"]:
+        request_snapshot(owner_id)
+
+    return report
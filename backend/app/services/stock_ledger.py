@@ -0,0 +1,310 @@
+"""
+Append-only stock ledger.
+
+Every change to `Stock.quantity` is written as a `StockMovement` row in the same
+transaction as the change itself. Once a day per business a 'snapshot' row is
+written for every item, so point-in-time queries start from the nearest snapshot
+and only replay the movements after it. Requests that change stock only ask for it
+(`request_snapshot`); `snapshot_worker` takes it in a transaction of its own, so a
+snapshot holds exactly the changes committed before its rows.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+import pytz
+from sqlalchemy import insert, update, select, literal, func
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.models.stock import Stock
+from app.models.product import StockMovement
+
+logger = logging.getLogger(__name__)
+
+MOVEMENT_SALE = "sale"
+MOVEMENT_PURCHASE = "purchase"
+MOVEMENT_ADJUSTMENT = "adjustment"
+MOVEMENT_RETURN = "return"
+MOVEMENT_SNAPSHOT = "snapshot"
+
+SNAPSHOT_INTERVAL = timedelta(days=1)
+
+# owner_id -> time of the latest committed snapshot we know about
+_last_snapshot_at: Dict[int, datetime] = {}
+
+# Businesses waiting for `snapshot_worker`
+_due_owners: Set[int] = set()
+_due_lock = threading.Lock()
+
+
+def ledger_now() -> datetime:
+    # Store as Naive IST (same clock as the Day Book)
+    return datetime.now(pytz.timezone('Asia/Kolkata')).replace(tzinfo=None)
+
+
+def movement_type_for(quantity_change: int) -> str:
+    """Manual stock edits: additions are purchases, deductions are adjustments."""
+    return MOVEMENT_PURCHASE if quantity_change > 0 else MOVEMENT_ADJUSTMENT
+
+
+def deduct_stock(db: Session, stock: Stock, quantity: int) -> Optional[int]:
+    """
+    Atomically take `quantity` units off an item:
+    UPDATE stock SET quantity = quantity - :n WHERE id = :id AND quantity >= :n
+    No read-modify-write in Python, so two counters billing the same item can't lose units.
+    Returns the new quantity, or None if there was not enough stock.
+    """
+    row = db.execute(
+        update(Stock)
+        .where(Stock.id == stock.id, Stock.quantity >= quantity)
+        .values(quantity=Stock.quantity - quantity, version=Stock.version + 1)
+        .returning(Stock.quantity, Stock.version)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
+        return None
+
+    # Keep the in-session object in step with the DB (without marking it dirty),
+    # otherwise its stale version would make the next ORM flush a false conflict
+    set_committed_value(stock, "quantity", row.quantity)
+    set_committed_value(stock, "version", row.version)
+    return row.quantity
+
+
+def add_stock(db: Session, stock: Stock, quantity: int) -> int:
+    """Atomically put `quantity` units on an item (goods received). Returns the new quantity."""
+    row = db.execute(
+        update(Stock)
+        .where(Stock.id == stock.id)
+        .values(quantity=Stock.quantity + quantity, version=Stock.version + 1)
+        .returning(Stock.quantity, Stock.version)
+        .execution_options(synchronize_session=False)
+    ).one()
+    set_committed_value(stock, "quantity", row.quantity)
+    set_committed_value(stock, "version", row.version)
+    return row.quantity
+
+
+def record_movement(
+    db: Session,
+    stock: Stock,
+    quantity_change: int,
+    movement_type: str,
+    previous_quantity: Optional[int] = None,
+    user_id: Optional[int] = None,
+    sale_id: Optional[int] = None,
+    notes: Optional[str] = None,
+    unit_cost: Optional[float] = None,
+) -> StockMovement:
+    """
+    Write the ledger row for a change already applied to `stock.quantity`.
+    Does not commit; the caller commits it together with the stock change.
+    """
+    if stock.id is None:
+        db.flush()
+
+    new_quantity = stock.quantity
+    if previous_quantity is None:
+        previous_quantity = new_quantity - quantity_change
+
+    movement = StockMovement(
+        stock_id=stock.id,
+        owner_id=stock.owner_id,
+        movement_type=movement_type,
+        quantity_change=new_quantity - previous_quantity,
+        previous_quantity=previous_quantity,
+        new_quantity=new_quantity,
+        sale_id=sale_id,
+        unit_cost=unit_cost,
+        notes=notes,
+        created_by_id=user_id,
+        created_at=ledger_now(),
+    )
+    db.add(movement)
+    return movement
+
+
+def record_movements_bulk(db: Session, rows: List[Dict]):
+    """
+    Insert many ledger rows at once (bulk import). Each row needs stock_id, owner_id,
+    movement_type, previous_quantity and new_quantity.
+    """
+    if not rows:
+        return
+    now = ledger_now()
+    for row in rows:
+        row.setdefault("quantity_change", row["new_quantity"] - row["previous_quantity"])
+        row.setdefault("created_at", now)
+    db.execute(insert(StockMovement.__table__), rows)
+
+
+def request_snapshot(owner_id: int):
+    """
+    Ask for a snapshot of this business if the last one is older than SNAPSHOT_INTERVAL.
+    Only marks the business; `snapshot_worker` copies the catalogue in its own
+    transaction, so no request waits for (or holds locks during) the copy.
+    """
+    last = _last_snapshot_at.get(owner_id)
+    if last is not None and ledger_now() - last < SNAPSHOT_INTERVAL:
+        return
+    with _due_lock:
+        _due_owners.add(owner_id)
+    snapshot_worker.wake()
+
+
+def take_snapshot(db: Session, owner_id: int, at: Optional[datetime] = None):
+    """Copy the current quantity of every item of this business into the ledger. Does not commit."""
+    at = at or ledger_now()
+    # Pending ORM changes must be in the DB before INSERT ... SELECT reads them
+    db.flush()
+
+    source = select(
+        Stock.id,
+        Stock.owner_id,
+        literal(MOVEMENT_SNAPSHOT),
+        literal(0),
+        Stock.quantity,
+        Stock.quantity,
+        literal(at),
+    ).where(Stock.owner_id == owner_id)
+
+    db.execute(
+        insert(StockMovement.__table__).from_select(
+            ["stock_id", "owner_id", "movement_type", "quantity_change",
+             "previous_quantity", "new_quantity", "created_at"],
+            source,
+        )
+    )
+
+
+def take_due_snapshot(db: Session, owner_id: int) -> bool:
+    """
+    Snapshot this business and commit, unless a snapshot younger than SNAPSHOT_INTERVAL
+    already exists (e.g. taken by another worker process). Returns True if one was taken.
+    """
+    now = ledger_now()
+    last = db.query(func.max(StockMovement.created_at)).filter(
+        StockMovement.owner_id == owner_id,
+        StockMovement.movement_type == MOVEMENT_SNAPSHOT,
+    ).scalar()
+    if last is not None and now - last < SNAPSHOT_INTERVAL:
+        db.rollback()
+        _last_snapshot_at[owner_id] = last
+        return False
+
+    take_snapshot(db, owner_id, at=now)
+    db.commit()
+    # Only remembered once committed: a failed snapshot must not hold off the next one
+    _last_snapshot_at[owner_id] = now
+    logger.info(f"📸 Stock snapshot taken for owner {owner_id} at {now}")
+    return True
+
+
+class SnapshotWorker:
+    """Background thread taking the snapshots asked for by `request_snapshot`."""
+
+    def __init__(self, poll_interval: float = 60.0):
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ledger-snapshots", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            self.run_pending()
+
+    def run_pending(self) -> int:
+        """Take the snapshots asked for so far. Returns how many were taken."""
+        from app.models.database import SessionLocal
+
+        with _due_lock:
+            owners = sorted(_due_owners)
+            _due_owners.clear()
+        taken = 0
+        for owner_id in owners:
+            if self._stop.is_set():
+                # Not lost: the next stock change of this business asks again
+                break
+            db = SessionLocal()
+            try:
+                taken += take_due_snapshot(db, owner_id)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"❌ Stock snapshot for owner {owner_id} failed: {e}")
+            finally:
+                db.close()
+        return taken
+
+
+snapshot_worker = SnapshotWorker()
+
+
+def quantity_on(db: Session, stock_id: int, at: datetime) -> Optional[int]:
+    """
+    Quantity of one item at time `at`: the last ledger row at or before `at`.
+    Returns None if the item has no ledger history that far back.
+    """
+    row = db.query(StockMovement.new_quantity).filter(
+        StockMovement.stock_id == stock_id,
+        StockMovement.created_at <= at,
+    ).order_by(StockMovement.created_at.desc(), StockMovement.id.desc()).first()
+    return row[0] if row else None
+
+
+def stock_on(db: Session, owner_id: int, at: datetime) -> Dict[int, int]:
+    """
+    Quantity of every item of a business at time `at` as {stock_id: quantity}.
+    Starts from the latest snapshot at or before `at` and replays the movements after it.
+    """
+    snapshot_at = db.query(func.max(StockMovement.created_at)).filter(
+        StockMovement.owner_id == owner_id,
+        StockMovement.movement_type == MOVEMENT_SNAPSHOT,
+        StockMovement.created_at <= at,
+    ).scalar()
+
+    quantities: Dict[int, int] = {}
+    cutoff_id = 0
+
+    if snapshot_at is not None:
+        base = db.query(StockMovement.id, StockMovement.stock_id, StockMovement.new_quantity).filter(
+            StockMovement.owner_id == owner_id,
+            StockMovement.movement_type == MOVEMENT_SNAPSHOT,
+            StockMovement.created_at == snapshot_at,
+        ).all()
+        for movement_id, stock_id, quantity in base:
+            quantities[stock_id] = quantity
+            cutoff_id = max(cutoff_id, movement_id)
+
+    # Anything written after the snapshot rows (ids are monotonic) up to `at`
+    replay = db.query(StockMovement.stock_id, func.sum(StockMovement.quantity_change)).filter(
+        StockMovement.owner_id == owner_id,
+        StockMovement.movement_type != MOVEMENT_SNAPSHOT,
+        StockMovement.id > cutoff_id,
+        StockMovement.created_at <= at,
+    ).group_by(StockMovement.stock_id).all()
+
+    for stock_id, change in replay:
+        quantities[stock_id] = quantities.get(stock_id, 0) + (change or 0)
+
+    return quantities
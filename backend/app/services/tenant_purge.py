@@ -0,0 +1,359 @@
+"""
+Tenant purge: deleting a business's data after DELETE /auth/me.
+
+The request only disables the business: owner and staff become inactive, their sessions
+are revoked, and a `tenant_purges` row is written, all in one small transaction. The
+data is then deleted by `TenantPurgeWorker` in the background: one table at a time,
+CHUNK_SIZE rows per transaction with a short pause in between, so SQLite's write lock is
+never held for long and billing for other businesses keeps going. Each chunk commits
+its progress with it, so a purge interrupted by a restart resumes where it stopped (every
+step is "delete what is left"). Invoice PDFs and uploaded images are removed from disk
+as their rows go. The owner's and staff's users rows are deleted last.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import pytz
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models.account import Account, DaybookDaily, DaybookMonthly, StatementLine, Transaction
+from app.models.database import SessionLocal
+from app.models.outbox import OutboxMessage
+from app.models.product import InventoryItem, Product, StockMovement, Supplier
+from app.models.purchase import PriceHistory, PurchaseOrder, PurchaseOrderItem
+from app.models.purge import TenantPurge
+from app.models.sale import Sale, SaleItem, Warranty, WarrantyClaim
+from app.models.stock import Stock
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+CHUNK_SIZE = 500
+CHUNK_PAUSE_SECONDS = 0.05  # Lets other writers in between chunks
+POLL_INTERVAL_SECONDS = 5.0
+MAX_ATTEMPTS = 5
+
+# A running purge whose worker hasn't committed a chunk for this long is claimed again
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+# Only files under these folders (where the app writes them) are ever removed
+FILE_ROOTS = ("invoices", "static/business_images", "uploads")
+
+
+def purge_now() -> datetime:
+    # Store as Naive IST (same clock as the rest of the app)
+    return datetime.now(pytz.timezone('Asia/Kolkata')).replace(tzinfo=None)
+
+
+# --- What a tenant owns, in deletion order (children before parents) ---
+
+def _steps(owner_id: int, team_ids: List[int]):
+    team_sales = select(Sale.id).where(Sale.created_by_id.in_(team_ids))
+    owner_products = select(Product.id).where(Product.owner_id == owner_id)
+    owner_stock = select(Stock.id).where(Stock.owner_id == owner_id)
+    team_orders = select(PurchaseOrder.id).where(PurchaseOrder.created_by_id.in_(team_ids))
+    tenant_warranties = select(Warranty.id).where(or_(
+        Warranty.sale_id.in_(team_sales), Warranty.product_id.in_(owner_products),
+    ))
+    return [
+        ("warranty_claims", WarrantyClaim, WarrantyClaim.warranty_id.in_(tenant_warranties)),
+        ("warranties", Warranty, Warranty.id.in_(tenant_warranties)),
+        ("sale_items", SaleItem, or_(SaleItem.sale_id.in_(team_sales), SaleItem.product_id.in_(owner_stock))),
+        ("statement_lines", StatementLine, StatementLine.owner_id == owner_id),
+        ("transactions", Transaction, or_(
+            Transaction.owner_id == owner_id,
+            Transaction.created_by_id.in_(team_ids),
+            Transaction.sale_id.in_(team_sales),
+        )),
+        ("stock_movements", StockMovement, or_(
+            StockMovement.owner_id == owner_id,
+            StockMovement.created_by_id.in_(team_ids),
+            StockMovement.stock_id.in_(owner_stock),
+        )),
+        ("sales", Sale, Sale.created_by_id.in_(team_ids)),
+        ("purchase_order_items", PurchaseOrderItem, PurchaseOrderItem.purchase_order_id.in_(team_orders)),
+        ("purchase_orders", PurchaseOrder, PurchaseOrder.created_by_id.in_(team_ids)),
+        ("price_history", PriceHistory, PriceHistory.product_id.in_(owner_products)),
+        ("inventory_items", InventoryItem, InventoryItem.owner_id == owner_id),
+        ("products", Product, Product.owner_id == owner_id),
+        ("stock", Stock, Stock.owner_id == owner_id),
+        ("suppliers", Supplier, Supplier.owner_id == owner_id),
+        ("accounts", Account, Account.owner_id == owner_id),
+        ("daybook_daily", DaybookDaily, DaybookDaily.owner_id == owner_id),
+        ("daybook_monthly", DaybookMonthly, DaybookMonthly.owner_id == owner_id),
+        ("outbox", OutboxMessage, OutboxMessage.owner_id == owner_id),
+    ]
+
+
+STEP_NAMES = [name for name, _, _ in _steps(0, [0])] + ["users"]
+
+
+# --- Request (DELETE /auth/me) ---
+
+def request_tenant_purge(db: Session, owner: User) -> TenantPurge:
+    """
+    Disable the business now and queue the deletion of its data (the caller commits,
+    then drops the team from the principal cache).
+    """
+    from app.auth.refresh_tokens import revoke_user_sessions
+    from app.services.credentials_replica import enqueue_credentials_sync
+
+    team = db.query(User.id, User.username).filter((User.id == owner.id) | (User.owner_id == owner.id)).all()
+    team_ids = [member.id for member in team]
+
+    # Bulk update: the credentials sync hook doesn't see it, so queue the sync here
+    db.query(User).filter(User.id.in_(team_ids)).update({"is_active": False}, synchronize_session=False)
+    enqueue_credentials_sync(db, [member.username for member in team])
+    revoke_user_sessions(db, team_ids)
+
+    purge = TenantPurge(
+        public_id=uuid.uuid4().hex,
+        owner_id=owner.id,
+        username=owner.username,
+        team_ids=json.dumps(team_ids),
+        status=STATUS_PENDING,
+        deleted="{}",
+        files_deleted=0,
+        attempts=0,
+        created_at=purge_now(),
+    )
+    db.add(purge)
+    return purge
+
+
+def purge_progress(purge: TenantPurge) -> Dict:
+    steps_done = STEP_NAMES.index(purge.step) if purge.step in STEP_NAMES else 0
+    if purge.status == STATUS_DONE:
+        steps_done = len(STEP_NAMES)
+    return {
+        "purge_id": purge.public_id,
+        "status": purge.status,
+        "step": purge.step,
+        "steps_done": steps_done,
+        "steps_total": len(STEP_NAMES),
+        "deleted": json.loads(purge.deleted or "{}"),
+        "files_deleted": purge.files_deleted,
+        "error": purge.last_error if purge.status == STATUS_FAILED else None,
+        "created_at": purge.created_at,
+        "finished_at": purge.finished_at,
+    }
+
+
+# --- Files ---
+
+def _remove_file(path: Optional[str]) -> bool:
+    """Delete an app-written file. Anything outside FILE_ROOTS (or not a file) is left alone."""
+    if not path or len(path) > 1024:
+        return False
+    real = os.path.realpath(path)
+    roots = [os.path.realpath(root) + os.sep for root in FILE_ROOTS]
+    if not any(real.startswith(root) for root in roots) or not os.path.isfile(real):
+        return False
+    try:
+        os.remove(real)
+        return True
+    except OSError as e:
+        logger.warning(f"Could not remove {path}: {e}")
+        return False
+
+
+# --- Worker ---
+
+class PurgeClaimLost(Exception):
+    """Another worker took over this purge (ours stalled past CLAIM_TIMEOUT)."""
+
+
+def claim_purge(db: Session, worker_id: str) -> Optional[int]:
+    """Atomically take the oldest pending (or abandoned) purge. Returns its id."""
+    now = purge_now()
+    table = TenantPurge.__table__
+    due = (
+        select(table.c.id)
+        .where(or_(
+            table.c.status == STATUS_PENDING,
+            and_(table.c.status == STATUS_RUNNING, table.c.claimed_at < now - CLAIM_TIMEOUT),
+        ))
+        .order_by(table.c.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    row = db.execute(
+        update(table)
+        .where(table.c.id == due)
+        .values(status=STATUS_RUNNING, claimed_by=worker_id, claimed_at=now, attempts=table.c.attempts + 1)
+        .returning(table.c.id)
+    ).first()
+    db.commit()
+    return row.id if row else None
+
+
+def _record_chunk(db: Session, purge: TenantPurge, worker_id: str, step: str, count: int, files: int = 0):
+    """Progress + heartbeat, in the chunk's own transaction."""
+    deleted = json.loads(purge.deleted or "{}")
+    deleted[step] = deleted.get(step, 0) + count
+    table = TenantPurge.__table__
+    result = db.execute(
+        update(table)
+        .where(table.c.id == purge.id, table.c.claimed_by == worker_id)
+        .values(step=step, deleted=json.dumps(deleted), files_deleted=table.c.files_deleted + files, claimed_at=purge_now())
+    )
+    if not result.rowcount:
+        raise PurgeClaimLost(f"Purge #{purge.id} was claimed by another worker")
+    purge.deleted = json.dumps(deleted)
+
+
+def _delete_step(db: Session, purge: TenantPurge, worker_id: str, step: str, model, condition) -> int:
+    total = 0
+    while True:
+        if model is Sale:
+            rows = db.execute(select(Sale.id, Sale.pdf_file_path).where(condition).limit(CHUNK_SIZE)).all()
+            ids = [row.id for row in rows]
+        else:
+            rows = None
+            ids = db.scalars(select(model.id).where(condition).limit(CHUNK_SIZE)).all()
+        if not ids:
+            _record_chunk(db, purge, worker_id, step, 0)
+            db.commit()
+            return total
+
+        db.execute(delete(model).where(model.id.in_(ids)))
+        _record_chunk(db, purge, worker_id, step, len(ids))
+        db.commit()
+        total += len(ids)
+
+        # Files go once their rows are gone for good
+        if rows:
+            files = sum(_remove_file(row.pdf_file_path) for row in rows)
+            if files:
+                _record_chunk(db, purge, worker_id, step, 0, files)
+                db.commit()
+        time.sleep(CHUNK_PAUSE_SECONDS)
+
+
+def _delete_users(db: Session, purge: TenantPurge, worker_id: str, team_ids: List[int]):
+    from app.services.credentials_replica import enqueue_credentials_sync
+
+    users = db.query(User).filter(User.id.in_(team_ids)).all()
+    paths = [path for user in users for path in (user.business_logo, user.signature_image, user.template_pdf_path)]
+
+    # References from other businesses' rows (nullable) are cut, not followed
+    db.execute(update(WarrantyClaim).where(WarrantyClaim.resolved_by_id.in_(team_ids)).values(resolved_by_id=None))
+    db.execute(update(PriceHistory).where(PriceHistory.changed_by_id.in_(team_ids)).values(changed_by_id=None))
+    enqueue_credentials_sync(db, [user.username for user in users])
+    # Staff first: they reference the owner. Refresh tokens go with them (ON DELETE CASCADE)
+    db.execute(delete(User).where(User.id.in_(team_ids), User.owner_id.isnot(None)))
+    db.execute(delete(User).where(User.id.in_(team_ids)))
+    _record_chunk(db, purge, worker_id, "users", len(users))
+    db.commit()
+
+    files = sum(_remove_file(path) for path in paths)
+    if files:
+        _record_chunk(db, purge, worker_id, "users", 0, files)
+        db.commit()
+
+
+def run_purge(purge_id: int, worker_id: str):
+    """Delete everything the purge's business owns, resuming wherever a previous run stopped."""
+    from app.auth.principal_cache import invalidate_principal
+    from app.services.accounts import invalidate_default_account
+    from app.services.alerts import invalidate_alert_recipients
+    from app.services.reports import invalidate_reports
+
+    db = SessionLocal()
+    try:
+        purge = db.get(TenantPurge, purge_id)
+        team_ids = json.loads(purge.team_ids)
+        logger.info(f"🗑️ Purging business {purge.owner_id} ({purge.username}), attempt {purge.attempts}")
+
+        for step, model, condition in _steps(purge.owner_id, team_ids):
+            _delete_step(db, purge, worker_id, step, model, condition)
+        _delete_users(db, purge, worker_id, team_ids)
+
+        purge.status = STATUS_DONE
+        purge.finished_at = purge_now()
+        purge.claimed_by = None
+        db.commit()
+
+        invalidate_alert_recipients(purge.owner_id)
+        invalidate_default_account(purge.owner_id)
+        invalidate_reports(purge.owner_id)
+        for user_id in team_ids:
+            invalidate_principal(user_id)
+        logger.info(f"🗑️ Purge of business {purge.owner_id} finished: {purge.deleted}")
+    except PurgeClaimLost as e:
+        db.rollback()
+        logger.warning(str(e))
+    except Exception as e:
+        db.rollback()
+        purge = db.get(TenantPurge, purge_id)
+        failed = purge.attempts >= MAX_ATTEMPTS
+        purge.status = STATUS_FAILED if failed else STATUS_PENDING
+        purge.last_error = str(e)[:1000]
+        purge.claimed_by = None
+        db.commit()
+        logger.error(f"❌ Purge #{purge_id} failed (attempt {purge.attempts}{', giving up' if failed else ''}): {e}")
+    finally:
+        db.close()
+
+
+class TenantPurgeWorker:
+    """Background thread running queued purges, one at a time."""
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL_SECONDS):
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="tenant-purge", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Look for purges now instead of at the next poll."""
+        self._wake.set()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            purge_id = None
+            db = SessionLocal()
+            try:
+                purge_id = claim_purge(db, self.worker_id)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"❌ Purge claim failed: {e}")
+            finally:
+                db.close()
+
+            if purge_id is not None:
+                run_purge(purge_id, self.worker_id)
+                continue
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+
+tenant_purge_worker = TenantPurgeWorker()
@@ -0,0 +1,218 @@
+"""
+Sales velocity engine.
+
+Velocity is an exponentially weighted rate of units sold per day:
+
+    velocity(t) = sum(q_i * exp(-(t - t_i) / TAU)) / TAU
+
+Each item stores `velocity_score = sum(q_i * exp((t_i - EPOCH) / TAU))`, so a sale only
+has to ADD its weight to the score (one atomic UPDATE, no read-modify-write) and the
+velocity at any time is `velocity_score * velocity_factor(t)`.
+
+`velocity_sq_score` is the same sum over q_i^2. Treating sales as a compound Poisson
+process, `velocity_sq_score * velocity_factor(t)` is the variance of daily demand, which
+the reorder planner uses for safety stock.
+
+`recompute_velocity` rebuilds the scores for a whole business from the stock ledger in
+one vectorized NumPy pass (used for backfills and to correct drift).
+"""
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import update, bindparam
+from sqlalchemy.orm import Session
+
+from app.models.stock import Stock
+from app.models.product import StockMovement
+from app.services.stock_ledger import ledger_now, MOVEMENT_SALE
+
+logger = logging.getLogger(__name__)
+
+# Time constant of the exponential weighting, in days (a sale's weight halves in ~10 days)
+TAU_DAYS = 14.0
+
+# Fixed reference point for velocity_score. Scores grow as exp((t - EPOCH) / TAU), which
+# stays well inside float range for decades; recompute_velocity rebuilds from the ledger anyway.
+EPOCH = datetime(2024, 1, 1)
+
+# Sales older than this contribute < exp(-10) of their weight, so the rebuild ignores them
+HISTORY_DAYS = int(TAU_DAYS * 10)
+
+CRITICAL_DAYS = 3.0
+WARNING_DAYS = 7.0
+
+
+def _days_since_epoch(at: datetime) -> float:
+    return (at - EPOCH).total_seconds() / 86400.0
+
+
+def sale_weight(quantity: int, at: datetime) -> float:
+    """What one sale adds to velocity_score."""
+    return quantity * math.exp(_days_since_epoch(at) / TAU_DAYS)
+
+
+def velocity_factor(at: datetime) -> float:
+    """velocity_score * velocity_factor(at) = units/day at time `at`."""
+    return math.exp(-_days_since_epoch(at) / TAU_DAYS) / TAU_DAYS
+
+
+def record_sale_velocity(db: Session, stock: Stock, quantity: int, at: Optional[datetime] = None):
+    """
+    Incremental update on each sale: add the sale's weight and refresh the persisted
+    daily_velocity / days_of_cover. `stock.quantity` must already be the post-sale quantity.
+    """
+    at = at or ledger_now()
+    weight = sale_weight(quantity, at)
+    factor = velocity_factor(at)
+    new_score = Stock.velocity_score + weight
+
+    db.execute(
+        update(Stock)
+        .where(Stock.id == stock.id)
+        .values(
+            velocity_score=new_score,
+            velocity_sq_score=Stock.velocity_sq_score + weight * quantity,
+            daily_velocity=new_score * factor,
+            days_of_cover=Stock.quantity / (new_score * factor),
+            velocity_updated_at=at,
+        )
+        # Velocity is not part of the version check: it is only ever added to atomically
+        .execution_options(synchronize_session=False)
+    )
+
+
+def days_of_cover(quantity: int, velocity: float) -> Optional[float]:
+    if velocity <= 0:
+        return None
+    return max(quantity, 0) / velocity
+
+
+def refresh_cover(stock: Stock, at: Optional[datetime] = None):
+    """After a manual quantity change: re-derive the persisted velocity/cover on the ORM object."""
+    at = at or ledger_now()
+    velocity = (stock.velocity_score or 0.0) * velocity_factor(at)
+    stock.daily_velocity = velocity
+    stock.days_of_cover = days_of_cover(stock.quantity, velocity)
+    stock.velocity_updated_at = at
+
+
+def recompute_velocity(db: Session, owner_id: int, at: Optional[datetime] = None) -> int:
+    """
+    Rebuild velocity_score / daily_velocity / days_of_cover for every item of a business
+    from the ledger's sale rows (sale_items are purged by the invoice cleanup, the ledger
+    is not). Returns the number of items updated. Does not commit.
+    """
+    at = at or ledger_now()
+    since = at - timedelta(days=HISTORY_DAYS)
+
+    sales = db.query(
+        StockMovement.stock_id, StockMovement.quantity_change, StockMovement.created_at
+    ).filter(
+        StockMovement.owner_id == owner_id,
+        StockMovement.movement_type == MOVEMENT_SALE,
+        StockMovement.created_at >= since,
+        StockMovement.created_at <= at,
+    ).all()
+
+    items = db.query(Stock.id, Stock.quantity).filter(Stock.owner_id == owner_id).all()
+    if not items:
+        return 0
+
+    item_ids = np.fromiter((i for i, _ in items), dtype=np.int64, count=len(items))
+    quantities = np.fromiter((q for _, q in items), dtype=np.float64, count=len(items))
+    scores = np.zeros(len(items), dtype=np.float64)
+    sq_scores = np.zeros(len(items), dtype=np.float64)
+
+    if sales:
+        sale_ids = np.fromiter((s[0] for s in sales), dtype=np.int64, count=len(sales))
+        units = -np.fromiter((s[1] for s in sales), dtype=np.float64, count=len(sales))
+        epoch_days = np.fromiter(
+            ((s[2] - EPOCH).total_seconds() / 86400.0 for s in sales), dtype=np.float64, count=len(sales)
+        )
+        weights = units * np.exp(epoch_days / TAU_DAYS)
+
+        # Map each sale's stock_id to its position in `items`, then sum weights per item
+        order = np.argsort(item_ids)
+        pos = np.searchsorted(item_ids, sale_ids, sorter=order)
+        pos = np.clip(pos, 0, len(item_ids) - 1)
+        known = item_ids[order[pos]] == sale_ids
+        scores = np.bincount(order[pos[known]], weights=weights[known], minlength=len(items))
+        sq_scores = np.bincount(order[pos[known]], weights=(weights * units)[known], minlength=len(items))
+
+    velocities = scores * velocity_factor(at)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covers = np.where(velocities > 0, np.maximum(quantities, 0) / velocities, np.nan)
+
+    params = [
+        {
+            "b_id": int(stock_id),
+            "b_score": float(score),
+            "b_sq_score": float(sq_score),
+            "b_velocity": float(velocity),
+            "b_cover": None if np.isnan(cover) else float(cover),
+            "b_at": at,
+        }
+        for stock_id, score, sq_score, velocity, cover in zip(item_ids, scores, sq_scores, velocities, covers)
+    ]
+    stock_table = Stock.__table__
+    db.execute(
+        update(stock_table)
+        .where(stock_table.c.id == bindparam("b_id"))
+        .values(
+            velocity_score=bindparam("b_score"),
+            velocity_sq_score=bindparam("b_sq_score"),
+            daily_velocity=bindparam("b_velocity"),
+            days_of_cover=bindparam("b_cover"),
+            velocity_updated_at=bindparam("b_at"),
+        ),
+        params,
+    )
+    logger.info(f"📈 Recomputed velocity for {len(params)} items ({len(sales)} sales) for owner {owner_id}")
+    return len(params)
+
+
+def rank_low_stock(db: Session, owner_id: int, limit: int = 20, include_ok: bool = False) -> list:
+    """
+    Low-stock ranking from the stored scores (no sale history scan): decay every item's
+    score to now, compute days of cover in one NumPy pass and return the most urgent first.
+    """
+    rows = db.query(
+        Stock.id, Stock.product_name, Stock.company_name, Stock.quantity,
+        Stock.threshold_quantity, Stock.velocity_score,
+    ).filter(Stock.owner_id == owner_id).all()
+    if not rows:
+        return []
+
+    quantities = np.array([r.quantity for r in rows], dtype=np.float64)
+    thresholds = np.array([r.threshold_quantity for r in rows], dtype=np.float64)
+    velocities = np.array([r.velocity_score for r in rows], dtype=np.float64) * velocity_factor(ledger_now())
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covers = np.where(velocities > 0, np.maximum(quantities, 0) / velocities, np.inf)
+    covers = np.where(quantities <= 0, 0.0, covers)
+
+    critical = covers <= CRITICAL_DAYS
+    warning = ~critical & ((covers <= WARNING_DAYS) | (quantities <= thresholds))
+    keep = np.ones(len(rows), dtype=bool) if include_ok else (critical | warning)
+
+    # Most urgent first: shortest cover, then lowest quantity
+    candidates = np.flatnonzero(keep)
+    order = candidates[np.lexsort((quantities[candidates], covers[candidates]))][:limit]
+
+    result = []
+    for i in order:
+        r = rows[i]
+        result.append({
+            "id": r.id,
+            "sku": f"{r.company_name}-{r.product_name}".upper().replace(" ", "-"),
+            "name": r.product_name,
+            "company_name": r.company_name,
+            "quantity": r.quantity,
+            "daily_velocity": round(float(velocities[i]), 3),
+            "days_remaining": None if np.isinf(covers[i]) else round(float(covers[i]), 1),
+            "status": "critical" if critical[i] else ("warning" if warning[i] else "ok"),
+        })
+    return result
@@ -0,0 +1,190 @@
+"""
+Email templates.
+
+Each template is parsed once at import into literal chunks and field names, so
+rendering is a single join (no re-parsing, no f-string rebuild of the whole page).
+Values are HTML-escaped when substituted into bodies.
+
+`render_email` caches rendered output by (template, params): the same alert or invoice
+notice going to several recipients, or retried by the outbox, is rendered once.
+Templates carrying credentials are never cached.
+"""
+import html
+import json
+from functools import lru_cache
+from string import Formatter
+from typing import Callable, Dict, List, Optional, Tuple
+
+RENDER_CACHE_SIZE = 256
+
+
+class Raw(str):
+    """Already-escaped HTML fragment (substituted as-is)."""
+
+
+def _compile(text: str) -> List[Tuple[str, Optional[str]]]:
+    """'Hi {username}!' -> [('Hi ', 'username'), ('!', None)]"""
+    return [(literal, field) for literal, field, _spec, _conv in Formatter().parse(text)]
+
+
+def _substitute(chunks: List[Tuple[str, Optional[str]]], values: Dict, escape: bool) -> str:
+    out = []
+    for literal, field in chunks:
+        out.append(literal)
+        if field is not None:
+            value = values[field]
+            if escape and not isinstance(value, Raw):
+                value = html.escape(str(value))
+            out.append(str(value))
+    return "".join(out)
+
+
+class EmailTemplate:
+    def __init__(self, subject: str, body: str, prepare: Callable[[Dict], Dict] = None, cacheable: bool = True):
+        self.subject = _compile(subject)
+        self.body = _compile(body)
+        self.prepare = prepare
+        self.cacheable = cacheable
+
+    def render(self, params: Dict) -> Tuple[str, str]:
+        values = self.prepare(params) if self.prepare else params
+        return _substitute(self.subject, values, escape=False), _substitute(self.body, values, escape=True)
+
+
+# --- Templates ---
+
+WELCOME = EmailTemplate(
+    subject="Welcome to SmartStock 360 🚀",
+    body="""
+    <div style="font-family: Arial, sans-serif; color: #333; max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #ddd; border-radius: 8px;">
+        <h2 style="color: #6366f1; text-align: center;">Welcome to SmartStock 360!</h2>
+        <p>Hi {username},</p>
+        <p>Your business account has been successfully created. Here are your login details:</p>
+
+        <div style="background-color: #f3f4f6; padding: 15px; border-radius: 6px; margin: 20px 0;">
+            <p><strong>Username:</strong> {username}</p>
+            <p><strong>Password:</strong> {password}</p>
+            <p><strong>Security Code:</strong> <span style="font-family: monospace; font-size: 1.2em; color: #d946ef;">{security_code}</span></p>
+        </div>
+
+        <p><strong>Important:</strong> Please keep your Security Code safe. You will need it to reset your password if you forget it.</p>
+
+        <a href="https://my-bussiness-manager.vercel.app/login" style="display: block; width: 200px; margin: 20px auto; padding: 12px; background-color: #6366f1; color: white; text-align: center; text-decoration: none; border-radius: 6px; font-weight: bold;">Login to Dashboard</a>
+
+        <hr style="border: none; border-top: 1px solid #eee; margin: 20px 0;">
+        <p style="font-size: 12px; color: #666; text-align: center;">SmartStock 360 - Intelligent Inventory Management</p>
+    </div>
+    """,
+    cacheable=False,  # Credentials: one recipient, and must not linger in memory
+)
+
+PASSWORD_CHANGE = EmailTemplate(
+    subject="Your password has been updated",
+    body="""
+    <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px;">
+        <h2 style="color: #333;">Password Updated</h2>
+        <p>Hello {username},</p>
+        <p>Your password for SmartStock 360 has been successfully changed.</p>
+
+        <p>Your new password is: <strong>{new_password}</strong></p>
+
+        <p>If you did not make this change, please contact support immediately.</p>
+    </div>
+    """,
+    cacheable=False,
+)
+
+LOW_STOCK_ALERT = EmailTemplate(
+    subject="⚠️ Low Stock Alert: {product_name}",
+    body="""
+    <div style="font-family: Arial, sans-serif; padding: 20px; border: 1px solid #ef4444; border-radius: 8px;">
+        <h2 style="color: #ef4444;">⚠️ Low Stock Alert</h2>
+        <p><strong>Product:</strong> {product_name}</p>
+        <p><strong>Company:</strong> {company_name}</p>
+        <p><strong>Current Quantity:</strong> {current_quantity}</p>
+        <br>
+        <p>Please restock immediately.</p>
+        <a href="https://my-bussiness-manager.vercel.app/stock" style="background-color: #ef4444; color: white; padding: 10px 15px; text-decoration: none; border-radius: 5px;">Update Stock Now</a>
+    </div>
+    """,
+)
+
+_DIGEST_ROW = _compile(
+    '<tr><td style="padding: 6px 10px;">{product_name}</td>'
+    '<td style="padding: 6px 10px;">{company_name}</td>'
+    '<td style="padding: 6px 10px; text-align: right;"><strong>{quantity}</strong></td></tr>'
+)
+
+
+def _prepare_low_stock_digest(params: Dict) -> Dict:
+    """`items`: list of dicts with product_name, company_name and quantity."""
+    items = params["items"]
+    return {
+        "count": len(items),
+        "plural": "s" if len(items) != 1 else "",
+        "rows": Raw("".join(_substitute(_DIGEST_ROW, item, escape=True) for item in items)),
+    }
+
+
+LOW_STOCK_DIGEST = EmailTemplate(
+    subject="⚠️ Low Stock Alert: {count} item{plural} running low",
+    body="""
+    <div style="font-family: Arial, sans-serif; padding: 20px; border: 1px solid #ef4444; border-radius: 8px;">
+        <h2 style="color: #ef4444;">⚠️ Low Stock Alert</h2>
+        <table style="border-collapse: collapse; width: 100%;">
+            <tr style="background-color: #fee2e2;"><th align="left" style="padding: 6px 10px;">Product</th><th align="left" style="padding: 6px 10px;">Company</th><th align="right" style="padding: 6px 10px;">Quantity</th></tr>
+            {rows}
+        </table>
+        <br>
+        <p>Please restock immediately.</p>
+        <a href="https://my-bussiness-manager.vercel.app/stock" style="background-color: #ef4444; color: white; padding: 10px 15px; text-decoration: none; border-radius: 5px;">Update Stock Now</a>
+    </div>
+    """,
+    prepare=_prepare_low_stock_digest,
+)
+
+CUSTOMER_INVOICE = EmailTemplate(
+    subject="Invoice #{invoice_number} from {business_name}",
+    body="""
+    <p>Dear {customer_name},</p>
+    <p>Please find attached your invoice <strong>#{invoice_number}</strong> from <strong>{business_name}</strong>.</p>
+    <p>Thank you for your business!</p>
+    """,
+)
+
+INVOICE_COPY = EmailTemplate(
+    subject="[Copy] Invoice #{invoice_number} - {customer_name}",
+    body="""
+    <p><strong>Invoice Record</strong></p>
+    <p>Attached is the invoice generated for <strong>{customer_name}</strong>.</p>
+    <p>Invoice #: {invoice_number}</p>
+    """,
+)
+
+# Templates by name (also what the notification outbox stores, app/services/outbox.py)
+EMAIL_TEMPLATES: Dict[str, EmailTemplate] = {
+    "welcome": WELCOME,
+    "password_change": PASSWORD_CHANGE,
+    "low_stock_alert": LOW_STOCK_ALERT,
+    "low_stock_digest": LOW_STOCK_DIGEST,
+    "customer_invoice": CUSTOMER_INVOICE,
+    "invoice_copy": INVOICE_COPY,
+}
+
+
+def params_key(params: Dict) -> str:
+    """Stable cache key for template params."""
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _render_cached(name: str, key: str) -> Tuple[str, str]:
+    return EMAIL_TEMPLATES[name].render(json.loads(key))
+
+
+def render_email(name: str, **params) -> Tuple[str, str]:
+    """(subject, html) for a template. Raises KeyError for an unknown template or missing param."""
+    template = EMAIL_TEMPLATES[name]
+    if not template.cacheable:
+        return template.render(params)
+    return _render_cached(name, params_key(params))
@@ -0,0 +1,285 @@
+"""
+Outbound mail queue with a pool of persistent SMTP connections.
+
+The notification outbox (app/services/outbox.py) hands each email to `submit`, which
+queues it and returns a Future. A few worker threads take messages off the queue in
+batches and send them over authenticated connections that are kept open between
+batches (no DNS lookup + TCP connect + STARTTLS + login per message), then resolve the
+Futures. A failed send fails its Future (`MailDeliveryError`); retrying is the outbox's
+job, so a message is never retried in two places. Delivery counters are available from
+`get_mail_metrics()`.
+"""
+import logging
+import queue
+import smtplib
+import socket
+import ssl
+import threading
+import time
+from concurrent.futures import Future
+from email.message import Message
+from typing import Dict, List, Optional
+
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger("uvicorn")
+
+# Resolved SMTP server addresses are reused for this long
+DNS_CACHE_TTL_SECONDS = 300
+
+# Idle connections older than this are checked with NOOP before reuse
+CONNECTION_CHECK_AFTER_SECONDS = 30
+
+# Servers drop idle sessions eventually (Gmail after ~10 min); close them before that
+CONNECTION_MAX_IDLE_SECONDS = 240
+
+
+class MailDeliveryError(Exception):
+    """Send failed. `permanent` = retrying the same message can't succeed."""
+
+    def __init__(self, message: str, permanent: bool = False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+class _DNSCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._addresses: List[str] = []
+        self._resolved_at = 0.0
+
+    def addresses(self) -> List[str]:
+        with self._lock:
+            if self._addresses and time.monotonic() - self._resolved_at < DNS_CACHE_TTL_SECONDS:
+                return list(self._addresses)
+        try:
+            # AF_INET = IPv4, SOCK_STREAM = TCP
+            info = socket.getaddrinfo(settings.smtp_server, settings.smtp_port, socket.AF_INET, socket.SOCK_STREAM)
+            addresses = list(dict.fromkeys(entry[4][0] for entry in info))  # Deduplicate, keep order
+            logger.info(f"Resolved SMTP server {settings.smtp_server}: {addresses}")
+        except Exception as e:
+            logger.error(f"DNS Resolution failed: {e}")
+            return [settings.smtp_server]  # Fallback to hostname, don't cache the failure
+        with self._lock:
+            self._addresses = addresses
+            self._resolved_at = time.monotonic()
+        return list(addresses)
+
+    def forget(self, address: str):
+        """Move an address that failed to the back of the list."""
+        with self._lock:
+            if address in self._addresses and len(self._addresses) > 1:
+                self._addresses.remove(address)
+                self._addresses.append(address)
+
+
+class SMTPConnectionPool:
+    """Up to `size` authenticated SMTP connections, reused across batches."""
+
+    def __init__(self, size: int, metrics: Dict[str, int], metrics_lock: threading.Lock):
+        self.size = size
+        self._idle: List[tuple] = []  # (connection, last_used)
+        self._lock = threading.Lock()
+        self._dns = _DNSCache()
+        self._metrics = metrics
+        self._metrics_lock = metrics_lock
+
+    def _ssl_context(self) -> ssl.SSLContext:
+        context = ssl.create_default_context()
+        # We connect by IP, so the certificate can't match the host name
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+
+    def _connect(self) -> smtplib.SMTP:
+        last_error = None
+        for address in self._dns.addresses():
+            try:
+                if settings.smtp_port == 465:
+                    server = smtplib.SMTP_SSL(address, settings.smtp_port, context=self._ssl_context(), timeout=30)
+                else:
+                    server = smtplib.SMTP(address, settings.smtp_port, timeout=30)
+                    if settings.smtp_use_tls:
+                        server.starttls(context=self._ssl_context())
+                server.login(settings.smtp_username, settings.smtp_password)
+                with self._metrics_lock:
+                    self._metrics["connections_opened"] += 1
+                logger.info(f"✅ SMTP connection opened to {address}")
+                return server
+            except smtplib.SMTPAuthenticationError:
+                raise  # Same credentials on every address
+            except Exception as e:
+                logger.warning(f"Failed to connect to {address}: {e}")
+                self._dns.forget(address)
+                last_error = e
+        raise ConnectionError(f"Could not connect to any SMTP address. Last error: {last_error}")
+
+    def acquire(self) -> smtplib.SMTP:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                server, last_used = self._idle.pop()
+            idle = time.monotonic() - last_used
+            if idle > CONNECTION_MAX_IDLE_SECONDS:
+                self._close(server)
+                continue
+            if idle > CONNECTION_CHECK_AFTER_SECONDS:
+                try:
+                    if server.noop()[0] != 250:
+                        raise smtplib.SMTPServerDisconnected("NOOP failed")
+                except Exception:
+                    self._close(server)
+                    continue
+            return server
+        return self._connect()
+
+    def release(self, server: smtplib.SMTP):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((server, time.monotonic()))
+                return
+        self._close(server)
+
+    def discard(self, server: Optional[smtplib.SMTP]):
+        if server is not None:
+            self._close(server)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._close(server)
+
+    def _close(self, server: smtplib.SMTP):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+
+class MailQueue:
+    """In-process mail queue drained by `workers` threads, each sending in batches."""
+
+    def __init__(self, workers: int, batch_size: int):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self.metrics = {"queued": 0, "sent": 0, "failed": 0, "batches": 0, "connections_opened": 0}
+        self.pool = SMTPConnectionPool(workers, self.metrics, self._metrics_lock)
+
+    def _count(self, key: str, amount: int = 1):
+        with self._metrics_lock:
+            self.metrics[key] += amount
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"mail-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, msg: Message) -> Future:
+        """Queue a message; the Future resolves once it's sent or raises `MailDeliveryError`."""
+        future = Future()
+        self._count("queued")
+        self._ensure_started()
+        self._queue.put({"msg": msg, "future": future})
+        return future
+
+    def _next_batch(self) -> Optional[List[dict]]:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # Let the loop see the stop signal after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._send_batch(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _send_batch(self, batch: List[dict]):
+        self._count("batches")
+        server = None
+        for item in batch:
+            try:
+                if server is None:
+                    server = self.pool.acquire()
+                server.send_message(item["msg"])
+                self._count("sent")
+                logger.info(f"✅ Email sent to {item['msg']['To']}")
+                item["future"].set_result(None)
+            except smtplib.SMTPRecipientsRefused as e:
+                # Permanent for this message only; the connection is still fine
+                self._count("failed")
+                item["future"].set_exception(MailDeliveryError(f"Recipient refused: {e}", permanent=True))
+            except Exception as e:
+                # Connection level problem: drop the connection; the next message reconnects
+                self.pool.discard(server)
+                server = None
+                self._count("failed")
+                item["future"].set_exception(MailDeliveryError(str(e)))
+        if server is not None:
+            self.pool.release(server)
+
+    def get_metrics(self) -> Dict[str, int]:
+        with self._metrics_lock:
+            metrics = dict(self.metrics)
+        metrics["queue_depth"] = self._queue.qsize()
+        metrics["idle_connections"] = len(self.pool._idle)
+        return metrics
+
+    def drain(self, timeout: float = 10.0) -> bool:
+        """Wait until everything queued so far has been handled."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._queue.unfinished_tasks == 0:
+                return True
+            time.sleep(0.05)
+        return False
+
+    def shutdown(self, timeout: float = 10.0):
+        """Send what is queued, stop the workers and close the SMTP connections."""
+        if self._threads:
+            self.drain(timeout)
+            for _ in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join(timeout=1)
+            self._threads = []
+        self.pool.close_all()
+
+
+mail_queue = MailQueue(
+    workers=settings.smtp_pool_size,
+    batch_size=settings.mail_batch_size,
+)
+
+
+def get_mail_metrics() -> Dict[str, int]:
+    return mail_queue.get_metrics()
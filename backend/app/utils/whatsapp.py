@@ -1,33 +1,57 @@
-import requests
+"""
+WhatsApp sender (Meta Cloud API).
+
+All messages go through one `httpx.AsyncClient` with keep-alive connections to the
+Graph API (no TLS handshake per message), running on a dedicated event loop thread:
+
+- at most `whatsapp_max_concurrency` requests are in flight at once (semaphore),
+- each business (owner) is held to `whatsapp_owner_rate_per_second` with bursts of
+  `whatsapp_owner_burst` (token bucket), so one busy shop can't use up the number's
+  throughput,
+- 429s, Meta's rate limit error codes, 5xx and connection errors are retried with
+  exponential backoff and full jitter, honouring Retry-After when the API sends it.
+
+Sync callers (the outbox worker, scripts) use `send_whatsapp_message` / `submit`.
+For local testing point `WHATSAPP_API_BASE_URL` at `scripts/mock_whatsapp_api.py`.
+"""
+import asyncio
 import logging
+import random
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+import httpx
+
 from app.config import get_settings
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
-def send_whatsapp_message(to_number: str, message_text: str = None, template_name: str = None, template_language: str = "en_US"):
-    """
-    Sends a WhatsApp message using the Meta Cloud API.
-    
-    Args:
-        to_number (str): The recipient's phone number (with country code, e.g., '919876543210').
-        message_text (str, optional): The text content for a freeform message. 
-                                      Note: Only allowed if a user-initiated conversation is open (24h window).
-        template_name (str, optional): The name of the approved template to send.
-        template_language (str, optional): Language code for the template.
-    """
-    
-    if not settings.whatsapp_phone_number_id or not settings.whatsapp_access_token:
-        logger.warning("⚠️ WhatsApp configuration missing. Message not sent.")
-        return None
+RETRY_BASE_DELAY_SECONDS = 1.0
+RETRY_MAX_DELAY_SECONDS = 60.0
 
-    url = f"https://graph.facebook.com/v17.0/{settings.whatsapp_phone_number_id}/messages"
-    
-    headers = {
-        "Authorization": f"Bearer {settings.whatsapp_access_token}",
-        "Content-Type": "application/json",
-    }
+# Graph API error codes that mean "slow down" even when the HTTP status isn't 429
+# 4/80007: app/WABA rate limit, 130429: throughput limit, 131056: pair rate limit (same recipient)
+RATE_LIMIT_ERROR_CODES = {4, 80007, 130429, 131056}
+
+
+class WhatsAppError(Exception):
+    """Send failed. `permanent` = retrying the same message can't succeed."""
 
+    def __init__(self, message: str, permanent: bool = False, throttled: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.permanent = permanent
+        self.throttled = throttled
+        self.retry_after = retry_after
+
+
+def whatsapp_configured() -> bool:
+    return bool(settings.whatsapp_phone_number_id and settings.whatsapp_access_token)
+
+
+def build_payload(to_number: str, message_text: str = None, template_name: str = None, template_language: str = "en_US") -> Optional[Dict]:
+    """Cloud API request body for a template or a freeform text message."""
     # Default payload structure
     payload = {
         "messaging_product": "whatsapp",
@@ -48,54 +72,234 @@ def send_whatsapp_message(to_number: str, message_text: str = None, template_nam
     else:
         logger.error("❌ Send WhatsApp Error: Must provide either 'message_text' or 'template_name'.")
         return None
+    return payload
+
+
+class _OwnerRateLimiter:
+    """Token bucket per owner. Only used from the sender's event loop."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._buckets: Dict[int, tuple] = {}  # owner_id -> (tokens, updated_at)
+
+    async def acquire(self, owner_id: Optional[int]):
+        if owner_id is None or self.rate <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            tokens, updated_at = self._buckets.get(owner_id, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= 1:
+                self._buckets[owner_id] = (tokens - 1, now)
+                return
+            self._buckets[owner_id] = (tokens, now)
+            await asyncio.sleep((1 - tokens) / self.rate)
+
+
+class WhatsAppSender:
+    """Shared async Cloud API client on its own event loop thread (started on first use)."""
+
+    def __init__(self, max_concurrency: int, owner_rate: float, owner_burst: int, max_attempts: int):
+        self.max_concurrency = max(max_concurrency, 1)
+        self.max_attempts = max(max_attempts, 1)
+        self._limiter = _OwnerRateLimiter(owner_rate, owner_burst)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._start_lock = threading.Lock()
+        self.metrics = {"sent": 0, "failed": 0, "retried": 0, "throttled": 0, "in_flight": 0}
+
+    # --- Event loop thread ---
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None:
+            return self._loop
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=loop.run_forever, name="whatsapp-sender", daemon=True)
+                self._thread.start()
+                asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+                self._loop = loop
+        return self._loop
+
+    async def _open(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._client = httpx.AsyncClient(
+            base_url=settings.whatsapp_api_base_url.rstrip("/") + "/",
+            headers={"Authorization": f"Bearer {settings.whatsapp_access_token}"},
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+                keepalive_expiry=120,
+            ),
+        )
+
+    def close(self, timeout: float = 5.0):
+        """Close the HTTP client and stop the loop thread (shutdown)."""
+        with self._start_lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), loop).result(timeout)
+        except Exception as e:
+            logger.warning(f"WhatsApp client close failed: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout)
+        loop.close()
+
+    # --- Sending ---
+
+    def _classify(self, response: httpx.Response) -> WhatsAppError:
+        retry_after = None
+        header = response.headers.get("Retry-After")
+        if header:
+            try:
+                retry_after = float(header)
+            except ValueError:
+                pass
+
+        error_code = None
+        try:
+            error_code = response.json().get("error", {}).get("code")
+        except Exception:
+            pass
+
+        throttled = response.status_code == 429 or error_code in RATE_LIMIT_ERROR_CODES
+        return WhatsAppError(
+            f"HTTP {response.status_code}: {response.text[:500]}",
+            permanent=not (throttled or response.status_code >= 500),
+            throttled=throttled,
+            retry_after=retry_after,
+        )
+
+    def _retry_delay(self, attempt: int, error: WhatsAppError) -> float:
+        if error.retry_after is not None:
+            return min(error.retry_after, RETRY_MAX_DELAY_SECONDS)
+        # Full jitter: spreads out senders that got throttled at the same moment
+        return random.uniform(0, min(RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1), RETRY_MAX_DELAY_SECONDS))
+
+    async def send(self, payload: Dict, owner_id: Optional[int] = None) -> Dict:
+        """Send one message. Returns the API response; raises WhatsAppError."""
+        path = f"{settings.whatsapp_phone_number_id}/messages"
+        for attempt in range(1, self.max_attempts + 1):
+            await self._limiter.acquire(owner_id)
+            try:
+                async with self._semaphore:
+                    self.metrics["in_flight"] += 1
+                    try:
+                        response = await self._client.post(path, json=payload)
+                    finally:
+                        self.metrics["in_flight"] -= 1
+            except httpx.TransportError as e:
+                error = WhatsAppError(f"Connection failed: {e}")
+            else:
+                if response.status_code < 400:
+                    self.metrics["sent"] += 1
+                    return response.json()
+                error = self._classify(response)
+
+            if error.permanent or attempt == self.max_attempts:
+                self.metrics["failed"] += 1
+                raise error
+
+            delay = self._retry_delay(attempt, error)
+            self.metrics["retried"] += 1
+            if error.throttled:
+                self.metrics["throttled"] += 1
+            logger.warning(f"WhatsApp send to {payload.get('to')} failed ({error}), retry {attempt} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def send_many(self, messages: List[tuple]) -> List:
+        """[(payload, owner_id), ...] -> responses / WhatsAppErrors, same order."""
+        return await asyncio.gather(*(self.send(payload, owner_id) for payload, owner_id in messages), return_exceptions=True)
+
+    def submit(self, payload: Dict, owner_id: Optional[int] = None) -> Future:
+        """Start sending from a sync thread; `.result()` gives the response or raises."""
+        return asyncio.run_coroutine_threadsafe(self.send(payload, owner_id), self._ensure_started())
+
+    def send_sync(self, payload: Dict, owner_id: Optional[int] = None) -> Dict:
+        return self.submit(payload, owner_id).result()
+
+    def get_metrics(self) -> Dict[str, int]:
+        return dict(self.metrics)
+
+
+whatsapp_sender = WhatsAppSender(
+    max_concurrency=settings.whatsapp_max_concurrency,
+    owner_rate=settings.whatsapp_owner_rate_per_second,
+    owner_burst=settings.whatsapp_owner_burst,
+    max_attempts=settings.whatsapp_max_attempts,
+)
+
+
+def send_whatsapp_message(to_number: str, message_text: str = None, template_name: str = None, template_language: str = "en_US", owner_id: int = None):
+    """
+    Sends a WhatsApp message using the Meta Cloud API. Blocks until sent (or given up).
+
+    Args:
+        to_number (str): The recipient's phone number (with country code, e.g., '919876543210').
+        message_text (str, optional): The text content for a freeform message.
+                                      Note: Only allowed if a user-initiated conversation is open (24h window).
+        template_name (str, optional): The name of the approved template to send.
+        template_language (str, optional): Language code for the template.
+        owner_id (int, optional): Business the message is sent for (per-owner rate limit).
+    """
+
+    if not whatsapp_configured():
+        logger.warning("⚠️ WhatsApp configuration missing. Message not sent.")
+        return None
+
+    payload = build_payload(to_number, message_text, template_name, template_language)
+    if payload is None:
+        return None
 
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        data = whatsapp_sender.send_sync(payload, owner_id)
         logger.info(f"✅ WhatsApp sent to {to_number}: {data}")
         return data
-    except requests.exceptions.HTTPError as e:
-        logger.error(f"❌ WhatsApp API Error: {e.response.text}")
-        print(f"WHATSAPP API ERROR: {e.response.text}") # Print for Render logs
+    except WhatsAppError as e:
+        logger.error(f"❌ WhatsApp API Error: {e}")
+        print(f"WHATSAPP API ERROR: {e}") # Print for Render logs
         return None
     except Exception as e:
         logger.error(f"❌ WhatsApp Connection Failed: {e}")
         print(f"WHATSAPP CONNECTION ERROR: {e}")
         return None
 
-def send_welcome_whatsapp(to_number: str, business_name: str, username: str):
+
+# --- Messages (payload builders, also used by the notification outbox) ---
+
+def welcome_message(to_number: str, business_name: str = None, username: str = None) -> Dict:
     """
-    Sends a welcome message via WhatsApp.
+    Welcome message for a new business.
     Currently uses the standard 'hello_world' template for testing/sandbox.
     """
     # For Sandbox, we often only have 'hello_world' approved.
     # In Production, create a template named 'welcome_message' with variables.
-    
-    # Fallback/Test: hello_world
-    return send_whatsapp_message(to_number, template_name="hello_world")
-
-    # Future Production Implementation (Example):
-    # return send_whatsapp_message(to_number, template_name="welcome_business", ...)
+    return build_payload(to_number, template_name="hello_world")
 
-def send_low_stock_whatsapp(to_number: str, product_name: str, current_quantity: int):
+def low_stock_digest_message(to_number: str, items: list) -> Dict:
     """
-    Sends a low stock alert via WhatsApp.
+    ONE low stock alert covering several items.
+    `items` is a list of (product_name, current_quantity) pairs.
     """
-    # Ideally use a template: 'low_stock_alert'
-    # For now, we might try text if the 24h window is open, or use a template.
-    
+    summary = ", ".join(f"{name} ({qty})" for name, qty in items)
+    logger.info(f"🔔 (Mock) Low Stock Digest WhatsApp to {to_number}: {len(items)} items low - {summary}")
+
     # NOTE: You cannot send freeform text (message_text) to a user who hasn't messaged you in 24h.
-    # You MUST use a Template.
-    
-    # Placeholder: Using 'hello_world' as a signal, or assuming a template exists.
-    # Since we can't create templates via API, we advise the user to create one.
-    
-    # Attempting to send a template if it existed, otherwise logging the intent.
-    logger.info(f"🔔 (Mock) Low Stock WhatsApp to {to_number}: {product_name} is low ({current_quantity})")
-    
-    # Real call (Assuming template 'low_stock_alert' exists):
-    # return send_whatsapp_message(to_number, template_name="low_stock_alert")
-    
-    # Verification Hack: Use hello_world just to prove connectivity
-    return send_whatsapp_message(to_number, template_name="hello_world")
+    # You MUST use a Template. Verification Hack: Use hello_world just to prove connectivity
+    return build_payload(to_number, template_name="hello_world")
+
+
+# Messages the notification outbox can send by kind (app/services/outbox.py)
+WHATSAPP_MESSAGES = {
+    "welcome": welcome_message,
+    "low_stock_digest": low_stock_digest_message,
+}
+
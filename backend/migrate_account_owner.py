@@ -0,0 +1,73 @@
+from app.models.database import engine
+from sqlalchemy import text, inspect
+
+def migrate():
+    """
+    Give every business its own default cash account.
+
+    Until now all bills/Day Book entries posted to ONE shared "Main Cash" account. For each
+    business with transactions on a shared account, this creates its default account with
+    the balance those transactions add up to and moves the transactions to it. The old
+    shared account is left in place (owner_id NULL) but no longer used.
+    """
+    inspector = inspect(engine)
+    columns = [c['name'] for c in inspector.get_columns('accounts')]
+
+    with engine.connect() as conn:
+        if 'owner_id' not in columns:
+            print("Adding owner_id column...")
+            conn.execute(text("ALTER TABLE accounts ADD COLUMN owner_id INTEGER REFERENCES users(id) ON DELETE CASCADE"))
+        else:
+            print("owner_id already exists.")
+        if 'is_default' not in columns:
+            print("Adding is_default column...")
+            conn.execute(text("ALTER TABLE accounts ADD COLUMN is_default BOOLEAN DEFAULT 0 NOT NULL"))
+        else:
+            print("is_default already exists.")
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_accounts_owner_id ON accounts (owner_id)"))
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_accounts_owner_default ON accounts (owner_id) WHERE is_default = 1"
+        ))
+
+        # Business of each transaction on a shared account: the creator, or the creator's owner
+        rows = conn.execute(text("""
+            SELECT COALESCE(u.owner_id, u.id) AS business_id,
+                   SUM(CASE WHEN t.type = 'INCOME' AND t.to_account_id = a.id THEN t.amount
+                            WHEN t.type = 'EXPENSE' AND t.from_account_id = a.id THEN -t.amount
+                            ELSE 0 END) AS balance
+            FROM transactions t
+            JOIN accounts a ON a.id IN (t.to_account_id, t.from_account_id) AND a.owner_id IS NULL
+            JOIN users u ON u.id = t.created_by_id
+            GROUP BY COALESCE(u.owner_id, u.id)
+        """)).all()
+
+        for business_id, balance in rows:
+            existing = conn.execute(
+                text("SELECT id FROM accounts WHERE owner_id = :owner AND is_default = 1"), {"owner": business_id}
+            ).scalar()
+            if existing is None:
+                existing = conn.execute(text("""
+                    INSERT INTO accounts (name, type, balance, owner_id, is_default, created_at, updated_at)
+                    VALUES ('Main Cash', 'CASH', :balance, :owner, 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                    RETURNING id
+                """), {"balance": balance or 0.0, "owner": business_id}).scalar()
+            else:
+                conn.execute(
+                    text("UPDATE accounts SET balance = balance + :balance WHERE id = :id"),
+                    {"balance": balance or 0.0, "id": existing},
+                )
+
+            team = "SELECT id FROM users WHERE id = :owner OR owner_id = :owner"
+            shared = "SELECT id FROM accounts WHERE owner_id IS NULL"
+            for column in ("to_account_id", "from_account_id"):
+                conn.execute(text(
+                    f"UPDATE transactions SET {column} = :account "
+                    f"WHERE {column} IN ({shared}) AND created_by_id IN ({team})"
+                ), {"account": existing, "owner": business_id})
+            print(f"Business {business_id}: default account {existing}, balance {balance or 0.0:.2f}")
+
+        conn.commit()
+    print("Migration complete.")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,40 @@
+from app.models.database import engine, SessionLocal, Base
+from app.models.account import DaybookDaily, DaybookMonthly
+from sqlalchemy import text, inspect
+
+def migrate():
+    """Add transactions.owner_id, create the Day Book rollup tables and fill them."""
+    inspector = inspect(engine)
+    columns = [c['name'] for c in inspector.get_columns('transactions')]
+
+    with engine.connect() as conn:
+        if 'owner_id' not in columns:
+            print("Adding owner_id column to transactions...")
+            conn.execute(text("ALTER TABLE transactions ADD COLUMN owner_id INTEGER REFERENCES users(id) ON DELETE CASCADE"))
+        else:
+            print("owner_id already exists.")
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_transactions_owner_id ON transactions (owner_id)"))
+
+        # Business of each existing entry = its creator's owner (or the creator, for owners)
+        result = conn.execute(text("""
+            UPDATE transactions
+            SET owner_id = (SELECT COALESCE(users.owner_id, users.id) FROM users WHERE users.id = transactions.created_by_id)
+            WHERE owner_id IS NULL AND created_by_id IS NOT NULL
+        """))
+        print(f"Backfilled owner_id on {result.rowcount} transactions.")
+        conn.commit()
+
+    Base.metadata.create_all(bind=engine, tables=[DaybookDaily.__table__, DaybookMonthly.__table__])
+
+    from app.services.daybook import rebuild_daybook
+    db = SessionLocal()
+    try:
+        count = rebuild_daybook(db)
+        db.commit()
+        print(f"Day book rollups built from {count} transactions.")
+    finally:
+        db.close()
+    print("Migration complete.")
+
+if __name__ == "__main__":
+    migrate()
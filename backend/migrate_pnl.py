@@ -0,0 +1,41 @@
+from app.models.database import engine
+from sqlalchemy import text, inspect
+
+def migrate():
+    """
+    Cost of goods sold for the P&L report: add stock_movements.unit_cost and fill in the
+    cost of past sales (ledger rows and sale_items.unit_cost/profit) from each item's
+    current cost price, the best estimate there is for them.
+    """
+    inspector = inspect(engine)
+    columns = [c['name'] for c in inspector.get_columns('stock_movements')]
+
+    with engine.connect() as conn:
+        if 'unit_cost' not in columns:
+            print("Adding unit_cost column to stock_movements...")
+            conn.execute(text("ALTER TABLE stock_movements ADD COLUMN unit_cost FLOAT"))
+        else:
+            print("unit_cost already exists.")
+
+        result = conn.execute(text("""
+            UPDATE stock_movements
+            SET unit_cost = (SELECT stock.cost_price FROM stock WHERE stock.id = stock_movements.stock_id)
+            WHERE movement_type = 'sale' AND unit_cost IS NULL
+              AND (SELECT stock.cost_price FROM stock WHERE stock.id = stock_movements.stock_id) > 0
+        """))
+        print(f"Backfilled unit_cost on {result.rowcount} sale ledger rows.")
+
+        result = conn.execute(text("""
+            UPDATE sale_items
+            SET unit_cost = (SELECT stock.cost_price FROM stock WHERE stock.id = sale_items.product_id),
+                profit = (unit_price - (SELECT stock.cost_price FROM stock WHERE stock.id = sale_items.product_id)) * quantity
+            WHERE unit_cost IS NULL
+              AND (SELECT stock.cost_price FROM stock WHERE stock.id = sale_items.product_id) > 0
+        """))
+        print(f"Backfilled unit_cost/profit on {result.rowcount} sale items.")
+
+        conn.commit()
+    print("Migration complete.")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,10 @@
+from app.models.database import engine, Base
+from app.models.refresh_token import RefreshToken
+
+def migrate():
+    """Create the refresh_tokens table (rotating refresh tokens for /auth/refresh)."""
+    Base.metadata.create_all(bind=engine, tables=[RefreshToken.__table__])
+    print("Migration complete.")
+
+if __name__ == "__main__":
+    migrate()
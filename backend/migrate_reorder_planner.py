@@ -0,0 +1,57 @@
+from app.models.database import engine, Base
+from sqlalchemy import text, inspect
+
+def add_columns(conn, inspector, table, new_columns):
+    columns = [c['name'] for c in inspector.get_columns(table)]
+    for name, ddl in new_columns.items():
+        if name not in columns:
+            print(f"Adding {table}.{name} column...")
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+        else:
+            print(f"{table}.{name} already exists.")
+
+def migrate():
+    inspector = inspect(engine)
+    tables = inspector.get_table_names()
+    
+    with engine.connect() as conn:
+        add_columns(conn, inspector, 'stock', {
+            'supplier_id': "INTEGER REFERENCES suppliers(id) ON DELETE SET NULL",
+            'cost_price': "FLOAT DEFAULT 0 NOT NULL",
+            'reorder_point': "INTEGER",
+            'reorder_quantity': "INTEGER",
+            'velocity_sq_score': "FLOAT DEFAULT 0 NOT NULL",
+        })
+        if 'suppliers' in tables:
+            add_columns(conn, inspector, 'suppliers', {
+                'lead_time_days': "FLOAT DEFAULT 7 NOT NULL",
+                'lead_time_std_days': "FLOAT DEFAULT 0 NOT NULL",
+            })
+        
+        # purchase_orders.supplier_id and purchase_order_items.product_id became nullable,
+        # which SQLite cannot change with ALTER TABLE. The tables were never written to
+        # before the planner, so recreate them (only if empty).
+        if 'purchase_order_items' in tables:
+            item_columns = [c['name'] for c in inspector.get_columns('purchase_order_items')]
+            if 'stock_id' not in item_columns:
+                orders = conn.execute(text("SELECT COUNT(*) FROM purchase_orders")).scalar()
+                items = conn.execute(text("SELECT COUNT(*) FROM purchase_order_items")).scalar()
+                if orders or items:
+                    print(f"❌ purchase_orders has {orders} rows. Refusing to drop it, migrate manually.")
+                else:
+                    print("Recreating empty purchase_orders / purchase_order_items tables...")
+                    conn.execute(text("DROP TABLE purchase_order_items"))
+                    conn.execute(text("DROP TABLE purchase_orders"))
+        
+        conn.commit()
+    
+    # Creates the dropped tables (and the indexes on the new columns) from the models
+    from app.models import PurchaseOrder, PurchaseOrderItem, Stock
+    Base.metadata.create_all(bind=engine, tables=[PurchaseOrder.__table__, PurchaseOrderItem.__table__])
+    with engine.connect() as conn:
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_stock_supplier_id ON stock (supplier_id)"))
+        conn.commit()
+    print("Migration complete. Run POST /api/inventory/velocity/recompute to backfill demand variability.")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,13 @@
+from app.models.database import engine
+from sqlalchemy import text
+
+def migrate():
+    """Composite index for the staff directory (business's staff in name order)."""
+    with engine.connect() as conn:
+        print("Creating ix_users_owner_name...")
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_owner_name ON users (owner_id, full_name, id)"))
+        conn.commit()
+    print("Migration complete.")
+
+if __name__ == "__main__":
+    migrate()
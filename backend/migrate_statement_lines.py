@@ -0,0 +1,10 @@
+from app.models.database import engine, Base
+from app.models.account import StatementLine
+
+def migrate():
+    """Create the statement_lines table (bank/UPI statement reconciliation)."""
+    Base.metadata.create_all(bind=engine, tables=[StatementLine.__table__])
+    print("Migration complete.")
+
+if __name__ == "__main__":
+    migrate()
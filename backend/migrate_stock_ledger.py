@@ -0,0 +1,59 @@
+import sqlite3
+import os
+
+# Database file path
+DB_FILE = "smartstock.db"
+
+def migrate():
+    print("="*60)
+    print("DATABASE MIGRATION: Stock Ledger (stock_movements)")
+    print("="*60)
+
+    if not os.path.exists(DB_FILE):
+        print(f"❌ Database file {DB_FILE} not found!")
+        return
+
+    try:
+        conn = sqlite3.connect(DB_FILE)
+        cursor = conn.cursor()
+        print(f"📁 Connecting to database: {DB_FILE}")
+
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='stock_movements'")
+        if not cursor.fetchone():
+            print("ℹ️ Table 'stock_movements' does not exist yet. It will be created on app startup.")
+            conn.close()
+            return
+
+        cursor.execute("PRAGMA table_info(stock_movements)")
+        columns = [info[1] for info in cursor.fetchall()]
+
+        if 'stock_id' in columns:
+            print("ℹ️ stock_movements already has the ledger columns")
+            conn.close()
+            return
+
+        # The old table was never written to and inventory_item_id was NOT NULL,
+        # which SQLite cannot relax with ALTER TABLE. Recreate it (only if empty).
+        cursor.execute("SELECT COUNT(*) FROM stock_movements")
+        count = cursor.fetchone()[0]
+        if count:
+            print(f"❌ stock_movements has {count} rows. Refusing to drop it, migrate manually.")
+            conn.close()
+            return
+
+        print("➖ Dropping unused legacy stock_movements table")
+        cursor.execute("DROP TABLE stock_movements")
+        conn.commit()
+        conn.close()
+
+        # Recreate with the current model definition (columns + indexes)
+        from app.models.database import engine, Base
+        from app.models import StockMovement
+        Base.metadata.create_all(bind=engine, tables=[StockMovement.__table__])
+        print("\n✅ Migration successful! stock_movements recreated.")
+
+    except Exception as e:
+        print(f"\n❌ Migration Failed: {e}")
+
+if __name__ == "__main__":
+    migrate()
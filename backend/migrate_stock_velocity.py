@@ -0,0 +1,27 @@
+from app.models.database import engine
+from sqlalchemy import text, inspect
+
+def migrate():
+    inspector = inspect(engine)
+    columns = [c['name'] for c in inspector.get_columns('stock')]
+    
+    new_columns = {
+        'velocity_score': "FLOAT DEFAULT 0 NOT NULL",
+        'daily_velocity': "FLOAT DEFAULT 0",
+        'days_of_cover': "FLOAT",
+        'velocity_updated_at': "DATETIME",
+    }
+    
+    with engine.connect() as conn:
+        for name, ddl in new_columns.items():
+            if name not in columns:
+                print(f"Adding {name} column...")
+                conn.execute(text(f"ALTER TABLE stock ADD COLUMN {name} {ddl}"))
+            else:
+                print(f"{name} already exists.")
+        
+        conn.commit()
+    print("Migration complete. Run POST /api/inventory/velocity/recompute to backfill from the ledger.")
+
+if __name__ == "__main__":
+    migrate()
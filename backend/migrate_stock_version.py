@@ -0,0 +1,19 @@
+from app.models.database import engine
+from sqlalchemy import text, inspect
+
+def migrate():
+    inspector = inspect(engine)
+    columns = [c['name'] for c in inspector.get_columns('stock')]
+    
+    with engine.connect() as conn:
+        if 'version' not in columns:
+            print("Adding version column (optimistic concurrency)...")
+            conn.execute(text("ALTER TABLE stock ADD COLUMN version INTEGER DEFAULT 1 NOT NULL"))
+        else:
+            print("version already exists.")
+        
+        conn.commit()
+    print("Migration complete.")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,10 @@
+from app.models.database import engine, Base
+from app.models.purge import TenantPurge
+
+def migrate():
+    """Create the tenant_purges table (background account deletion)."""
+    Base.metadata.create_all(bind=engine, tables=[TenantPurge.__table__])
+    print("Migration complete.")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,13 @@
+from app.models.database import engine
+from sqlalchemy import text
+
+def migrate():
+    """Composite index for the Day Book listing (business + date range, newest first)."""
+    with engine.connect() as conn:
+        print("Creating ix_transactions_owner_date...")
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_transactions_owner_date ON transactions (owner_id, date, id)"))
+        conn.commit()
+    print("Migration complete. (Run migrate_daybook.py first if transactions.owner_id is missing.)")
+
+if __name__ == "__main__":
+    migrate()
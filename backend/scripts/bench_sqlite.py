@@ -0,0 +1,137 @@
+"""
+Concurrent read/write throughput of SQLite with the old settings (rollback journal, only
+foreign_keys set) and with the tuning profile from settings (`sqlite_pragmas()`: WAL,
+synchronous=NORMAL, mmap, cache, busy_timeout, temp_store).
+
+Writers run billing-shaped transactions (decrement a stock row, insert a ledger row);
+readers run report-shaped queries (sum the ledger for a product range) at the same time.
+Runs against throwaway databases in a temp folder (your real DBs are not touched).
+
+Usage:
+    python scripts/bench_sqlite.py [--seconds 10] [--writers 4] [--readers 8]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+PRODUCTS = 1000
+SEED_LEDGER_ROWS = 50000
+
+
+def setup(engine):
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE stock (id INTEGER PRIMARY KEY, quantity INTEGER NOT NULL)")
+        conn.exec_driver_sql(
+            "CREATE TABLE ledger (id INTEGER PRIMARY KEY, stock_id INTEGER NOT NULL REFERENCES stock(id), "
+            "quantity INTEGER NOT NULL, note TEXT)"
+        )
+        conn.exec_driver_sql("CREATE INDEX ix_ledger_stock ON ledger (stock_id)")
+        conn.exec_driver_sql("INSERT INTO stock (id, quantity) VALUES " + ",".join(f"({i}, 1000000)" for i in range(1, PRODUCTS + 1)))
+        rows = [(random.randint(1, PRODUCTS), random.randint(1, 5)) for _ in range(SEED_LEDGER_ROWS)]
+        conn.exec_driver_sql("INSERT INTO ledger (stock_id, quantity, note) VALUES (?, ?, 'seed')", rows)
+
+
+def run(label, pragmas, args, workdir):
+    from sqlalchemy import create_engine
+    from app.models.database import apply_sqlite_profile
+
+    engine = create_engine(
+        f"sqlite:///{workdir}/{label}.db",
+        connect_args={"check_same_thread": False},
+        pool_size=args.writers + args.readers,
+        max_overflow=0,
+    )
+    apply_sqlite_profile(engine, pragmas)
+    setup(engine)
+
+    counts = {"writes": 0, "reads": 0, "locked": 0, "errors": 0}
+    write_latencies = []
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def writer():
+        while not stop.is_set():
+            stock_id = random.randint(1, PRODUCTS)
+            started = time.perf_counter()
+            try:
+                with engine.begin() as conn:
+                    conn.exec_driver_sql("UPDATE stock SET quantity = quantity - 1 WHERE id = ?", (stock_id,))
+                    conn.exec_driver_sql("INSERT INTO ledger (stock_id, quantity, note) VALUES (?, 1, 'bill')", (stock_id,))
+                key = "writes"
+            except Exception as e:
+                key = "locked" if "locked" in str(e) else "errors"
+            with lock:
+                counts[key] += 1
+                if key == "writes":
+                    write_latencies.append(time.perf_counter() - started)
+
+    def reader():
+        while not stop.is_set():
+            low = random.randint(1, PRODUCTS - 50)
+            try:
+                with engine.connect() as conn:
+                    conn.exec_driver_sql(
+                        "SELECT s.id, s.quantity, SUM(l.quantity) FROM stock s JOIN ledger l ON l.stock_id = s.id "
+                        "WHERE s.id BETWEEN ? AND ? GROUP BY s.id", (low, low + 50)
+                    ).all()
+                key = "reads"
+            except Exception as e:
+                key = "locked" if "locked" in str(e) else "errors"
+            with lock:
+                counts[key] += 1
+
+    threads = [threading.Thread(target=writer) for _ in range(args.writers)]
+    threads += [threading.Thread(target=reader) for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    with engine.connect() as conn:
+        journal_mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+    engine.dispose()
+
+    write_latencies.sort()
+    p99 = write_latencies[int(len(write_latencies) * 0.99)] * 1000 if write_latencies else 0
+    print(f"{label:<8} journal={journal_mode:<6} "
+          f"writes/s={counts['writes'] / args.seconds:8.1f}  reads/s={counts['reads'] / args.seconds:8.1f}  "
+          f"write p99={p99:7.1f} ms  locked={counts['locked']}  other errors={counts['errors']}")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="smartstock_sqlite_bench_")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/app.db")
+    os.environ.setdefault("CREDENTIALS_DB_URL", f"sqlite:///{workdir}/credentials.db")
+    from app.models.database import sqlite_pragmas
+
+    print("=" * 60)
+    print(f"SQLite benchmark: {args.writers} writers + {args.readers} readers, {args.seconds:g}s per profile")
+    print(f"Work dir: {workdir}")
+    print("Profile: " + ", ".join(f"{name}={value}" for name, value in sqlite_pragmas()))
+    print("=" * 60)
+
+    before = run("legacy", [("foreign_keys", "ON")], args, workdir)
+    after = run("tuned", sqlite_pragmas(), args, workdir)
+
+    if before["writes"] and before["reads"]:
+        print(f"Writes x{after['writes'] / before['writes']:.2f}, reads x{after['reads'] / before['reads']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
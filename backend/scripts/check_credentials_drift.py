@@ -0,0 +1,54 @@
+"""
+Report where credentials.db (the replica) differs from the users table in the main DB:
+usernames missing from the replica, replica rows with no main user, and rows whose
+columns differ. Pending `credentials` outbox rows show up as drift until delivered.
+
+With --repair, queue a sync for every drifted username; the outbox worker (running
+server) applies them. Exits 1 when drift was found, so it can run from cron/CI.
+
+Usage:
+    python scripts/check_credentials_drift.py [--repair] [--limit 20]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repair", action="store_true", help="Queue a sync for every drifted username")
+    parser.add_argument("--limit", type=int, default=20, help="Usernames listed per category")
+    args = parser.parse_args()
+
+    from app.models.credentials_db import CredentialsSessionLocal
+    from app.models.database import SessionLocal
+    from app.services.credentials_replica import credentials_drift, queue_repair
+
+    db = SessionLocal()
+    cred_db = CredentialsSessionLocal()
+    try:
+        drift = credentials_drift(db, cred_db)
+        for category, entries in drift.items():
+            print(f"{category}: {len(entries)}")
+            for entry in entries[:args.limit]:
+                print(f"    {entry}")
+        drifted = any(drift.values())
+        if not drifted:
+            print("Credentials replica is in sync.")
+        elif args.repair:
+            queued = queue_repair(db, drift)
+            db.commit()
+            print(f"Queued a credentials sync for {queued} usernames.")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cred_db.close()
+        db.close()
+    sys.exit(1 if drifted else 0)
+
+
+if __name__ == "__main__":
+    main()
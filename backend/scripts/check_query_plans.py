@@ -0,0 +1,71 @@
+"""
+Query plan check: the hot list queries must be served by an index, not a table scan.
+
+Builds a throwaway SQLite database with some data, runs EXPLAIN QUERY PLAN on the
+queries the endpoints actually issue and fails (exit code 1) if one of them scans the
+table or stops using its index. Run after changing those queries or the indexes.
+
+Usage:
+    python scripts/check_query_plans.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix="smartstock_plans_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/plans.db"
+    os.environ["CREDENTIALS_DB_URL"] = f"sqlite:///{workdir}/credentials.db"
+
+    from sqlalchemy import insert, text
+    from app.models.database import Base, engine, SessionLocal
+    from app.models.account import Transaction, TransactionType
+    from app.models.user import User, UserRole
+    from app.services.daybook import transactions_page_query
+
+    Base.metadata.create_all(bind=engine)
+    start = datetime(2026, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {"id": i, "username": f"owner{i}", "email": f"owner{i}@example.com", "hashed_password": "x",
+             "full_name": "Owner", "role": UserRole.OWNER, "is_active": True, "created_at": start}
+            for i in range(1, 51)
+        ])
+        conn.execute(insert(Transaction.__table__), [
+            {
+                "description": "x", "amount": 1.0, "type": TransactionType.INCOME,
+                "owner_id": i % 50 + 1, "date": start + timedelta(minutes=37 * i), "created_at": start,
+            }
+            for i in range(20000)
+        ])
+        conn.execute(text("ANALYZE"))
+
+    checks = {
+        "day": transactions_page_query(7, start, start + timedelta(days=1), limit=101),
+        "month": transactions_page_query(7, start, start + timedelta(days=31), limit=1001),
+        "next page": transactions_page_query(7, start, start + timedelta(days=31), after=(start + timedelta(days=10), 500), limit=101),
+        "all": transactions_page_query(7, limit=101),
+    }
+
+    failed = False
+    db = SessionLocal()
+    try:
+        for name, query in checks.items():
+            sql = str(query.compile(engine, compile_kwargs={"literal_binds": True}))
+            plan = " | ".join(row[-1] for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+            ok = "ix_transactions_owner_date" in plan and "TEMP B-TREE" not in plan
+            failed |= not ok
+            print(f"{'OK  ' if ok else 'FAIL'} {name}: {plan}")
+    finally:
+        db.close()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
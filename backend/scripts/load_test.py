@@ -0,0 +1,149 @@
+"""
+Concurrent-request load test: how many requests/s the API serves when many clients hit
+DB-backed endpoints at once, and whether the event loop stays responsive meanwhile.
+
+Starts the app under uvicorn (one worker, like production) on throwaway SQLite databases
+in a temp folder (your real DBs are not touched), seeds one business, then sends
+`--requests` GETs to /api/stock/list and /api/billing/history/grouped from `--concurrency`
+clients while timing GET /health every 50 ms. With blocking handlers /health waits behind
+every query; with handlers in the thread pool it answers in a few ms.
+
+Usage:
+    python scripts/load_test.py [--requests 400] [--concurrency 40] [--items 2000] [--bills 300]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000 if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=40)
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--bills", type=int, default=300)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="smartstock_load_")
+    os.chdir(workdir)
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/load.db"
+    os.environ["CREDENTIALS_DB_URL"] = f"sqlite:///{workdir}/load_credentials.db"
+
+    import httpx
+    import uvicorn
+    from app.main import app
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    base_url = f"http://127.0.0.1:{port}"
+
+    print("=" * 60)
+    print(f"Load test: {args.requests} requests, {args.concurrency} concurrent clients")
+    print(f"Seeding {args.items} stock items and {args.bills} bills in {workdir}")
+    print("=" * 60)
+
+    # --- Seed ---
+    with httpx.Client(base_url=base_url, timeout=60) as client:
+        client.post("/api/auth/register", json={
+            "full_name": "Load Owner", "business_name": "Load Store", "business_type": "grocery",
+            "username": "load_owner", "email": "load@example.com",
+            "phone_number": "910000000001", "password": "password123",
+        })
+        token = client.post("/api/auth/token", data={
+            "username": "load_owner", "password": "password123",
+        }).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        sheet = "product_name,company_name,category,quantity,selling_price\n" + "".join(
+            f"Item {i},Brand {i % 50},Cat {i % 10},1000,{10 + i % 90}\n" for i in range(args.items)
+        )
+        client.post("/api/stock/import", headers=headers, files={"file": ("seed.csv", sheet.encode(), "text/csv")})
+        items = client.get("/api/stock/list", headers=headers).json()
+        for i in range(args.bills):
+            item = items[i % len(items)]
+            client.post("/api/billing/generate", headers=headers, json={
+                "customer_name": f"Customer {i}", "customer_phone": "9000000000",
+                "items": [{"product_id": item["id"], "product_name": item["product_name"], "quantity": 1, "unit_price": 10}],
+            })
+
+    # --- Load ---
+    paths = ["/api/stock/list", "/api/billing/history/grouped"]
+
+    async def run():
+        limits = httpx.Limits(max_connections=args.concurrency + 1)
+        async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=120, limits=limits) as client:
+            latencies, statuses, health = [], [], []
+            queue = asyncio.Queue()
+            for i in range(args.requests):
+                queue.put_nowait(paths[i % len(paths)])
+
+            async def worker():
+                while not queue.empty():
+                    path = queue.get_nowait()
+                    start = time.perf_counter()
+                    try:
+                        r = await client.get(path)
+                        statuses.append(r.status_code)
+                    except httpx.HTTPError as e:
+                        statuses.append(type(e).__name__)
+                    latencies.append(time.perf_counter() - start)
+
+            done = asyncio.Event()
+
+            async def probe():
+                while not done.is_set():
+                    start = time.perf_counter()
+                    try:
+                        await client.get("/health")
+                    except httpx.HTTPError:
+                        pass
+                    health.append(time.perf_counter() - start)
+                    await asyncio.sleep(0.05)
+
+            prober = asyncio.create_task(probe())
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - start
+            done.set()
+            await prober
+            return elapsed, latencies, statuses, health
+
+    elapsed, latencies, statuses, health = asyncio.run(run())
+    server.should_exit = True
+    thread.join(timeout=10)
+
+    print(f"Finished in {elapsed:.2f}s  ({len(latencies) / elapsed:.1f} requests/s)")
+    print(f"HTTP status counts: { {c: statuses.count(c) for c in sorted(set(statuses), key=str)} }")
+    print(f"Latency p50 {_percentile(latencies, 50):.0f} ms  p95 {_percentile(latencies, 95):.0f} ms")
+    print(
+        f"/health during load: {len(health)} probes, median {statistics.median(health) * 1000:.1f} ms, "
+        f"p95 {_percentile(health, 95):.1f} ms, max {max(health) * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
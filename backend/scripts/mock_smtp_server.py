@@ -0,0 +1,164 @@
+"""
+Local stand-in SMTP server (aiosmtpd) for testing the mail queue without sending real
+email. Accepts any login, keeps every message in memory, and counts connections, logins
+and messages per connection. Recipients starting with "refuse" are rejected with 550
+(to test permanent failures).
+
+With --check it also pushes --messages emails through `mail_queue` (app/utils/mail_queue.py)
+and verifies they were all delivered over no more than `smtp_pool_size` connections,
+in batches (exits 1 if not).
+
+Usage:
+    python scripts/mock_smtp_server.py [--port 8025]             # serve until Ctrl+C
+    python scripts/mock_smtp_server.py --check [--messages 200]
+
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=8025 SMTP_USE_TLS=false \\
+    SMTP_USERNAME=test SMTP_PASSWORD=test uvicorn app.main:app
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+class RecordingHandler:
+    """aiosmtpd handler: records what arrived on which connection."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.logins = 0
+        self.messages = []
+        self.per_connection = Counter()
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        session.host_name = hostname
+        if not getattr(session, "counted", False):
+            session.counted = True
+            with self.lock:
+                self.connections += 1
+                session.connection_number = self.connections
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("refuse"):
+            return "550 No such user here"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        with self.lock:
+            self.messages.append((envelope.mail_from, list(envelope.rcpt_tos)))
+            self.per_connection[getattr(session, "connection_number", 0)] += 1
+        return "250 Message accepted for delivery"
+
+    def authenticate(self, server, session, envelope, mechanism, auth_data):
+        from aiosmtpd.smtp import AuthResult
+        with self.lock:
+            self.logins += 1
+        return AuthResult(success=True)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "connections": self.connections,
+                "logins": self.logins,
+                "messages": len(self.messages),
+                "max_per_connection": max(self.per_connection.values(), default=0),
+            }
+
+
+def start_server(port: int):
+    from aiosmtpd.controller import Controller
+
+    # aiosmtpd logs a warning about its own use of Session.login_data on every AUTH
+    logging.getLogger("mail.log").setLevel(logging.ERROR)
+
+    handler = RecordingHandler()
+    controller = Controller(
+        handler,
+        hostname="127.0.0.1",
+        port=port,
+        authenticator=handler.authenticate,
+        auth_require_tls=False,  # Plain local connections (SMTP_USE_TLS=false)
+    )
+    controller.start()
+    return controller, handler
+
+
+def check(port: int, count: int) -> tuple:
+    os.environ.update({
+        "SMTP_SERVER": "127.0.0.1", "SMTP_PORT": str(port), "SMTP_USE_TLS": "false",
+        "SMTP_USERNAME": "test", "SMTP_PASSWORD": "test",
+    })
+    from app.config import get_settings
+    from app.utils.email import build_message, build_parts
+    from app.utils.mail_queue import mail_queue
+
+    settings = get_settings()
+    parts = build_parts("<p>Mail queue check</p>")
+    started = time.perf_counter()
+    futures = [
+        mail_queue.submit(build_message(f"user{i}@example.com", f"Check {i}", parts=parts))
+        for i in range(count)
+    ]
+    failed = 0
+    for future in futures:
+        try:
+            future.result(timeout=30)
+        except Exception as e:
+            failed += 1
+            print(f"Send failed: {e}")
+    elapsed = time.perf_counter() - started
+    metrics = mail_queue.get_metrics()
+    mail_queue.shutdown()
+
+    print(f"Sent {count - failed}/{count} in {elapsed:.2f}s ({count / elapsed:.0f} msg/s)")
+    print(f"Mail queue: {metrics}")
+    return failed == 0, metrics, settings.smtp_pool_size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--check", action="store_true", help="Send through mail_queue and verify batching/reuse")
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+
+    controller, handler = start_server(args.port)
+    print(f"Mock SMTP server on 127.0.0.1:{args.port}")
+    try:
+        if not args.check:
+            while True:
+                time.sleep(5)
+                print(handler.stats())
+
+        delivered, metrics, pool_size = check(args.port, args.messages)
+        stats = handler.stats()
+        print(f"Server saw: {stats}")
+        problems = []
+        if not delivered or stats["messages"] != args.messages:
+            problems.append(f"{stats['messages']} of {args.messages} messages arrived")
+        if stats["connections"] > pool_size:
+            problems.append(f"{stats['connections']} connections opened (pool size {pool_size})")
+        if metrics["batches"] >= args.messages:
+            problems.append("every message was sent in its own batch")
+        for problem in problems:
+            print(f"❌ {problem}")
+        if not problems:
+            print("✅ All messages delivered over pooled connections, in batches")
+        sys.exit(1 if problems else 0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    main()
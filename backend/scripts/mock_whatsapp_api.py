@@ -0,0 +1,84 @@
+"""
+Local stand-in for the Meta WhatsApp Cloud API, for testing the sender without
+touching graph.facebook.com.
+
+Accepts POST /{version}/{phone_number_id}/messages like the real API and can throttle:
+a share of requests gets 429 (with Retry-After) or Meta's throughput error 130429.
+GET /stats shows what arrived (requests, accepted, throttled, per recipient, peak
+concurrency).
+
+Usage:
+    python scripts/mock_whatsapp_api.py [--port 8090] [--throttle-rate 0.2] [--latency 0.05]
+
+    WHATSAPP_API_BASE_URL=http://127.0.0.1:8090/v17.0 \\
+    WHATSAPP_PHONE_NUMBER_ID=123 WHATSAPP_ACCESS_TOKEN=test uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import random
+import uuid
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import JSONResponse
+
+
+def create_mock_app(throttle_rate: float = 0.0, latency: float = 0.0) -> FastAPI:
+    mock = FastAPI(title="Mock WhatsApp Cloud API")
+    stats = {"requests": 0, "accepted": 0, "throttled": 0, "in_flight": 0, "peak_in_flight": 0}
+    recipients = Counter()
+
+    @mock.post("/{version}/{phone_number_id}/messages")
+    async def messages(version: str, phone_number_id: str, request: Request, authorization: str = Header(None)):
+        stats["requests"] += 1
+        if not authorization or not authorization.startswith("Bearer "):
+            return JSONResponse(status_code=401, content={"error": {"message": "Invalid OAuth access token.", "code": 190}})
+
+        stats["in_flight"] += 1
+        stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+        try:
+            if latency:
+                await asyncio.sleep(latency)
+            body = await request.json()
+            if body.get("messaging_product") != "whatsapp" or not body.get("to"):
+                return JSONResponse(status_code=400, content={"error": {"message": "Invalid parameter", "code": 100}})
+
+            if random.random() < throttle_rate:
+                stats["throttled"] += 1
+                if random.random() < 0.5:
+                    return JSONResponse(status_code=429, headers={"Retry-After": "1"},
+                                        content={"error": {"message": "Too many requests", "code": 4}})
+                return JSONResponse(status_code=400,
+                                    content={"error": {"message": "Rate limit hit", "code": 130429}})
+
+            stats["accepted"] += 1
+            recipients[body["to"]] += 1
+            return {
+                "messaging_product": "whatsapp",
+                "contacts": [{"input": body["to"], "wa_id": body["to"]}],
+                "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}],
+            }
+        finally:
+            stats["in_flight"] -= 1
+
+    @mock.get("/stats")
+    async def get_stats():
+        return {**stats, "recipients": dict(recipients)}
+
+    return mock
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)  # Share of requests rejected as rate limited
+    parser.add_argument("--latency", type=float, default=0.05)  # Seconds per request
+    args = parser.parse_args()
+
+    uvicorn.run(create_mock_app(args.throttle_rate, args.latency), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
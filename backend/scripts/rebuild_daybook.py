@@ -0,0 +1,36 @@
+"""
+Recompute the Day Book rollup tables (daybook_daily, daybook_monthly) from the
+transactions table, e.g. after fixing transactions by hand.
+
+Usage:
+    python scripts/rebuild_daybook.py [--owner OWNER_ID]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--owner", type=int, default=None, help="Only this business (default: all)")
+    args = parser.parse_args()
+
+    from app.models.database import SessionLocal
+    from app.services.daybook import rebuild_daybook
+
+    db = SessionLocal()
+    try:
+        count = rebuild_daybook(db, args.owner)
+        db.commit()
+        print(f"Rebuilt day book rollups from {count} transactions.")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Concurrency stress test for billing: fires many parallel bills at ONE stock item
+and checks that no units are lost or oversold.
+
+Runs against throwaway SQLite databases in a temp folder (your real DBs are not touched).
+
+Usage:
+    python scripts/stress_billing.py [--bills 300] [--stock 200] [--workers 10]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bills", type=int, default=300)
+    parser.add_argument("--stock", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=10)  # keep below the DB pool size (db_pool_size + db_max_overflow)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="smartstock_stress_")
+    os.chdir(workdir)
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/stress.db"
+    os.environ["CREDENTIALS_DB_URL"] = f"sqlite:///{workdir}/stress_credentials.db"
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.models.database import SessionLocal
+    from app.models.stock import Stock
+    from app.models.sale import SaleItem
+    from app.models.product import StockMovement
+
+    print("=" * 60)
+    print(f"Billing stress test: {args.bills} bills x 1 unit, {args.stock} units in stock")
+    print(f"Work dir: {workdir}")
+    print("=" * 60)
+
+    with TestClient(app) as client:
+        client.post("/api/auth/register", json={
+            "full_name": "Stress Owner", "business_name": "Stress Store", "business_type": "grocery",
+            "username": "stress_owner", "email": "stress@example.com",
+            "phone_number": "910000000000", "password": "password123",
+        })
+        token = client.post("/api/auth/token", data={
+            "username": "stress_owner", "password": "password123",
+        }).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        stock = client.post("/api/stock/add-or-update", headers=headers, json={
+            "product_name": "Hot SKU", "company_name": "Stress Co", "category": "Test",
+            "quantity": args.stock, "threshold_quantity": 0,
+        }).json()
+
+        # Outside its context manager TestClient runs every request on its own event loop
+        # thread, so the bills really race each other like separate counters/workers would.
+        counters = TestClient(app)
+
+        def bill(i):
+            r = counters.post("/api/billing/generate", headers=headers, json={
+                "customer_name": f"Customer {i}", "customer_phone": "9000000000",
+                "items": [{"product_id": stock["id"], "product_name": "Hot SKU", "quantity": 1, "unit_price": 10}],
+            })
+            return r.status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            codes = list(pool.map(bill, range(args.bills)))
+        elapsed = time.perf_counter() - start
+
+    db = SessionLocal()
+    try:
+        final_qty = db.query(Stock.quantity).filter(Stock.id == stock["id"]).scalar()
+        sold = sum(q for (q,) in db.query(SaleItem.quantity).filter(SaleItem.product_id == stock["id"]))
+        ledger_sold = -sum(q for (q,) in db.query(StockMovement.quantity_change).filter(
+            StockMovement.stock_id == stock["id"], StockMovement.movement_type == "sale"))
+    finally:
+        db.close()
+
+    ok = codes.count(200)
+    print(f"Finished in {elapsed:.1f}s  ({args.bills / elapsed:.1f} bills/s)")
+    print(f"HTTP status counts: { {c: codes.count(c) for c in sorted(set(codes))} }")
+    print(f"Successful bills: {ok}  Units sold (sale_items): {sold}  Ledger sales: {ledger_sold}")
+    print(f"Final quantity: {final_qty}  Expected: {args.stock - sold}")
+
+    failures = []
+    if final_qty != args.stock - sold:
+        failures.append("lost update: stock quantity does not match units sold")
+    if final_qty < 0:
+        failures.append("oversold: quantity went negative")
+    if sold != ok or ledger_sold != sold:
+        failures.append("sale items / ledger rows do not match successful bills")
+    if ok != min(args.bills, args.stock):
+        failures.append(f"expected {min(args.bills, args.stock)} successful bills, got {ok}")
+
+    if failures:
+        for f in failures:
+            print(f"❌ {f}")
+        sys.exit(1)
+    print("✅ No units lost or oversold")
+
+
+if __name__ == "__main__":
+    main()
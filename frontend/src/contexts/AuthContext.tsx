@@ -25,11 +25,61 @@ interface AuthContextType {
 
 const AuthContext = createContext<AuthContextType | undefined>(undefined);
 
+// Access tokens are short-lived: on a 401 we swap the refresh token for a new pair once
+// and retry. Concurrent 401s share one refresh (each refresh token works only once).
+let refreshPromise: Promise<string> | null = null;
+
+const refreshAccessToken = (): Promise<string> => {
+  if (!refreshPromise) {
+    const refreshToken = localStorage.getItem("refresh_token");
+    refreshPromise = (refreshToken
+      ? axios.post(`${API_URL}/api/auth/refresh`, { refresh_token: refreshToken })
+      : Promise.reject(new Error("No refresh token"))
+    )
+      .then((response) => {
+        const { access_token, refresh_token } = response.data;
+        localStorage.setItem("token", access_token);
+        localStorage.setItem("refresh_token", refresh_token);
+        axios.defaults.headers.common["Authorization"] = `Bearer ${access_token}`;
+        return access_token as string;
+      })
+      .finally(() => {
+        refreshPromise = null;
+      });
+  }
+  return refreshPromise;
+};
+
 export const AuthProvider = ({ children }: { children: ReactNode }) => {
   const [user, setUser] = useState<User | null>(null);
   const [token, setToken] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState(true);
 
+  // Renew the access token when the backend says it has expired, then retry the request
+  useEffect(() => {
+    const interceptor = axios.interceptors.response.use(
+      (response) => response,
+      async (error) => {
+        const original = error.config;
+        const isAuthCall = original?.url?.includes("/api/auth/token") || original?.url?.includes("/api/auth/refresh");
+        if (error.response?.status !== 401 || !original || original._retried || isAuthCall) {
+          return Promise.reject(error);
+        }
+        original._retried = true;
+        try {
+          const accessToken = await refreshAccessToken();
+          setToken(accessToken);
+          original.headers = { ...original.headers, Authorization: `Bearer ${accessToken}` };
+          return axios(original);
+        } catch {
+          logout();
+          return Promise.reject(error);
+        }
+      }
+    );
+    return () => axios.interceptors.response.eject(interceptor);
+  }, []);
+
   // Load auth state from localStorage on mount and VERIFY with backend
   useEffect(() => {
     const initializeAuth = async () => {
@@ -76,21 +126,28 @@ export const AuthProvider = ({ children }: { children: ReactNode }) => {
       },
     });
 
-    const { access_token, user: userData } = response.data;
+    const { access_token, refresh_token, user: userData } = response.data;
 
     setToken(access_token);
     setUser(userData);
 
     localStorage.setItem("token", access_token);
+    localStorage.setItem("refresh_token", refresh_token);
     localStorage.setItem("user", JSON.stringify(userData));
 
     axios.defaults.headers.common["Authorization"] = `Bearer ${access_token}`;
   };
 
   const logout = () => {
+    const refreshToken = localStorage.getItem("refresh_token");
+    if (refreshToken) {
+      // End the session server-side too (best effort)
+      axios.post(`${API_URL}/api/auth/logout`, { refresh_token: refreshToken }).catch(() => {});
+    }
     setToken(null);
     setUser(null);
     localStorage.removeItem("token");
+    localStorage.removeItem("refresh_token");
     localStorage.removeItem("user");
     // Clear any other app specific keys if necessary
     delete axios.defaults.headers.common["Authorization"];
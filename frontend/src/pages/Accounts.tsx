@@ -17,6 +17,20 @@ interface Transaction {
     sale_id: number | null;
 }
 
+// Day Book rollup totals (/api/accounts/daybook/daily and /monthly)
+interface DaybookSummary {
+    income_total: number;
+    expense_total: number;
+    net: number;
+    income_count: number;
+    expense_count: number;
+    transaction_count: number;
+}
+
+const EMPTY_SUMMARY: DaybookSummary = {
+    income_total: 0, expense_total: 0, net: 0, income_count: 0, expense_count: 0, transaction_count: 0,
+};
+
 interface StaffMember {
     id: number;
     full_name: string;
@@ -46,6 +60,9 @@ interface BillResponse {
 
 const API_URL = import.meta.env.VITE_API_URL || "http://localhost:8000";
 
+// Transactions per page in the lists; the API returns X-Next-Cursor when there are more
+const PAGE_SIZE = 100;
+
 
 
 // TransactionTable Component (extracted for reusability)
@@ -128,8 +145,12 @@ const TransactionTable: React.FC<TransactionTableProps> = ({ transactions, onDel
 
 export const Accounts = () => {
     const { user, token } = useAuth();
-    const [transactions, setTransactions] = useState<Transaction[]>([]); // Daily Transactions
-    const [monthlyTransactions, setMonthlyTransactions] = useState<Transaction[]>([]); // Monthly Transactions
+    const [transactions, setTransactions] = useState<Transaction[]>([]); // Daily Transactions (list view)
+    const [monthlyTransactions, setMonthlyTransactions] = useState<Transaction[]>([]); // Monthly Transactions (list view)
+    const [dailySummary, setDailySummary] = useState<DaybookSummary>(EMPTY_SUMMARY);
+    const [monthlySummary, setMonthlySummary] = useState<DaybookSummary>(EMPTY_SUMMARY);
+    const [dailyCursor, setDailyCursor] = useState<string | null>(null); // Next page of the daily list
+    const [monthlyCursor, setMonthlyCursor] = useState<string | null>(null); // Next page of the monthly list
     const [loading, setLoading] = useState(false);
 
     // Date States
@@ -167,12 +188,19 @@ export const Accounts = () => {
         notes: "",
     });
 
-    // Fetch Daily Data
+    // Fetch Daily Totals
     useEffect(() => {
         fetchDailyData();
         fetchStaff();
     }, [selectedDate]);
 
+    // Daily rows are only needed for the list
+    useEffect(() => {
+        if (showDailyTransactions) {
+            fetchDailyTransactions();
+        }
+    }, [selectedDate, showDailyTransactions]);
+
     // Fetch Monthly Data when Modal is open or Month changes
     useEffect(() => {
         if (showMonthlyModal) {
@@ -180,17 +208,37 @@ export const Accounts = () => {
         }
     }, [selectedMonth, showMonthlyModal]);
 
+    // Totals and counts come from the Day Book rollups (no need to load every row)
     const fetchDailyData = async () => {
-        setLoading(true);
         try {
             const config = {
                 headers: { Authorization: `Bearer ${token}` },
                 params: { date_str: selectedDate }
             };
-            const txnRes = await axios.get(`${API_URL}/api/accounts/transactions`, config);
-            setTransactions(txnRes.data);
+            const summaryRes = await axios.get(`${API_URL}/api/accounts/daybook/daily`, config);
+            setDailySummary(summaryRes.data);
         } catch (error) {
             console.error("Failed to fetch daily data", error);
+        }
+    };
+
+    // One page of raw transactions; `next` is the cursor of the following page (null = last page)
+    const fetchTransactionPage = async (params: Record<string, string>, cursor: string | null) => {
+        const txnRes = await axios.get(`${API_URL}/api/accounts/transactions`, {
+            headers: { Authorization: `Bearer ${token}` },
+            params: { ...params, limit: PAGE_SIZE, ...(cursor ? { cursor } : {}) }
+        });
+        return { rows: txnRes.data as Transaction[], next: (txnRes.headers["x-next-cursor"] as string | undefined) ?? null };
+    };
+
+    const fetchDailyTransactions = async (cursor: string | null = null) => {
+        setLoading(true);
+        try {
+            const page = await fetchTransactionPage({ date_str: selectedDate }, cursor);
+            setTransactions(prev => cursor ? [...prev, ...page.rows] : page.rows);
+            setDailyCursor(page.next);
+        } catch (error) {
+            console.error("Failed to fetch daily transactions", error);
         } finally {
             setLoading(false);
         }
@@ -198,17 +246,41 @@ export const Accounts = () => {
 
     const fetchMonthlyData = async () => {
         try {
-            const config = {
-                headers: { Authorization: `Bearer ${token}` },
-                params: { month_str: selectedMonth }
-            };
-            const txnRes = await axios.get(`${API_URL}/api/accounts/transactions`, config);
-            setMonthlyTransactions(txnRes.data);
+            const [summaryRes, page] = await Promise.all([
+                axios.get(`${API_URL}/api/accounts/daybook/monthly`, {
+                    headers: { Authorization: `Bearer ${token}` },
+                    params: { start_month: selectedMonth, end_month: selectedMonth }
+                }),
+                fetchTransactionPage({ month_str: selectedMonth }, null),
+            ]);
+            setMonthlySummary(summaryRes.data);
+            setMonthlyTransactions(page.rows);
+            setMonthlyCursor(page.next);
         } catch (error) {
             console.error("Failed to fetch monthly data", error);
         }
     };
 
+    const fetchMoreMonthlyTransactions = async () => {
+        if (!monthlyCursor) return;
+        setLoading(true);
+        try {
+            const page = await fetchTransactionPage({ month_str: selectedMonth }, monthlyCursor);
+            setMonthlyTransactions(prev => [...prev, ...page.rows]);
+            setMonthlyCursor(page.next);
+        } catch (error) {
+            console.error("Failed to fetch monthly transactions", error);
+        } finally {
+            setLoading(false);
+        }
+    };
+
+    const refreshData = () => {
+        fetchDailyData();
+        if (showDailyTransactions) fetchDailyTransactions();
+        if (showMonthlyModal) fetchMonthlyData();
+    };
+
     const fetchStaff = async () => {
         try {
             const res = await axios.get(`${API_URL}/api/staff/list`, {
@@ -243,8 +315,7 @@ export const Accounts = () => {
                 category: "",
                 notes: "",
             });
-            fetchDailyData(); // Refresh daily
-            if (showMonthlyModal) fetchMonthlyData(); // Refresh monthly if open
+            refreshData();
         } catch (error: any) {
             alert(error.response?.data?.detail || "Failed to create transaction");
             console.error(error);
@@ -257,8 +328,7 @@ export const Accounts = () => {
             await axios.delete(`${API_URL}/api/accounts/transactions/${id}`, {
                 headers: { Authorization: `Bearer ${token}` }
             });
-            fetchDailyData();
-            if (showMonthlyModal) fetchMonthlyData();
+            refreshData();
         } catch (error) {
             console.error("Failed to delete transaction", error);
             alert("Failed to delete transaction");
@@ -298,15 +368,14 @@ export const Accounts = () => {
         }
     };
 
-    // Calculations - Daily
-    const dailyIncome = transactions.filter(t => t.type === 'income').reduce((acc, curr) => acc + curr.amount, 0);
-    const dailyExpense = transactions.filter(t => t.type === 'expense').reduce((acc, curr) => acc + curr.amount, 0);
-    const dailyBalance = dailyIncome - dailyExpense;
+    // Totals - Daily / Monthly (from the Day Book rollups)
+    const dailyIncome = dailySummary.income_total;
+    const dailyExpense = dailySummary.expense_total;
+    const dailyBalance = dailySummary.net;
 
-    // Calculations - Monthly
-    const monthlyIncome = monthlyTransactions.filter(t => t.type === 'income').reduce((acc, curr) => acc + curr.amount, 0);
-    const monthlyExpense = monthlyTransactions.filter(t => t.type === 'expense').reduce((acc, curr) => acc + curr.amount, 0);
-    const monthlyBalance = monthlyIncome - monthlyExpense;
+    const monthlyIncome = monthlySummary.income_total;
+    const monthlyExpense = monthlySummary.expense_total;
+    const monthlyBalance = monthlySummary.net;
 
     // Calculate Average Daily Sales
     const getDaysInMonth = (yearMonth: string) => {
@@ -423,7 +492,7 @@ export const Accounts = () => {
                                         Transactions for {new Date(selectedDate).toDateString()}
                                     </h2>
                                     <span className="text-xs text-slate-500 bg-slate-950 px-2 py-1 rounded border border-slate-800 mt-1 inline-block">
-                                        {transactions.length} Records
+                                        {dailySummary.transaction_count} Records
                                     </span>
                                 </div>
                                 <button onClick={() => setShowDailyTransactions(false)} className="text-slate-400 hover:text-white">
@@ -440,6 +509,15 @@ export const Accounts = () => {
                                 ) : (
                                     <TransactionTable transactions={transactions} onDelete={handleDeleteTransaction} onViewInvoice={handleViewInvoice} />
                                 )}
+                                {dailyCursor && (
+                                    <button
+                                        onClick={() => fetchDailyTransactions(dailyCursor)}
+                                        disabled={loading}
+                                        className="mt-4 w-full py-2 rounded-lg border border-slate-700 text-slate-300 hover:bg-slate-800 transition disabled:opacity-50"
+                                    >
+                                        {loading ? "Loading..." : `Load more (${transactions.length} of ${dailySummary.transaction_count})`}
+                                    </button>
+                                )}
                             </div>
                         </div>
                     </div>
@@ -496,7 +574,7 @@ export const Accounts = () => {
                                 {/* Monthly Table */}
                                 <h3 className="text-lg font-bold text-white mb-4 flex items-center gap-2">
                                     <span>Transaction Log</span>
-                                    <span className="bg-slate-800 text-slate-400 text-xs px-2 py-0.5 rounded-full">{monthlyTransactions.length}</span>
+                                    <span className="bg-slate-800 text-slate-400 text-xs px-2 py-0.5 rounded-full">{monthlySummary.transaction_count}</span>
                                 </h3>
 
                                 {monthlyTransactions.length === 0 ? (
@@ -506,6 +584,15 @@ export const Accounts = () => {
                                 ) : (
                                     <TransactionTable transactions={monthlyTransactions} onDelete={handleDeleteTransaction} onViewInvoice={handleViewInvoice} />
                                 )}
+                                {monthlyCursor && (
+                                    <button
+                                        onClick={fetchMoreMonthlyTransactions}
+                                        disabled={loading}
+                                        className="mt-4 w-full py-2 rounded-lg border border-slate-700 text-slate-300 hover:bg-slate-800 transition disabled:opacity-50"
+                                    >
+                                        {loading ? "Loading..." : `Load more (${monthlyTransactions.length} of ${monthlySummary.transaction_count})`}
+                                    </button>
+                                )}
                             </div>
                         </div>
                     </div>